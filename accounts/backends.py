@@ -0,0 +1,32 @@
+from django.contrib.auth.backends import ModelBackend
+
+from accounts.permissions import PERMISSION_BITS, permission_mask
+
+APP_LABEL = 'accounts'
+
+# Bit per "accounts.can_*" name, as has_perm receives them
+MANAGED_PERMISSIONS = {f'{APP_LABEL}.{codename}': bit for codename, bit in PERMISSION_BITS.items()}
+
+
+class RolePermissionBackend(ModelBackend):
+    """
+    ModelBackend that answers the role permissions (accounts.can_*) from
+    User.role without touching the database. It is authoritative for them:
+    user or group permission rows never grant one that the role lacks.
+    Logins, sessions and Django admin model permissions are ModelBackend's,
+    so this is the only backend configured. Superusers keep every permission.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if obj is not None:
+            return set()
+        mask = permission_mask(user_obj)
+        role_permissions = {perm for perm, bit in MANAGED_PERMISSIONS.items() if mask & bit}
+        model_permissions = {perm for perm in super().get_all_permissions(user_obj) if perm not in MANAGED_PERMISSIONS}
+        return role_permissions | model_permissions
+
+    def has_perm(self, user_obj, perm, obj=None):
+        bit = MANAGED_PERMISSIONS.get(perm)
+        if bit is None:
+            return super().has_perm(user_obj, perm, obj)
+        return obj is None and bool(permission_mask(user_obj) & bit)
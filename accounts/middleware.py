@@ -1,14 +1,20 @@
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import cached_property
 from django.contrib import messages
 
+from accounts.setup_state import MISSING_SUPERADMIN, SUPERADMIN_MUST_CHANGE_PASSWORD, get_setup_state
+
 
 class MustChangePasswordMiddleware(MiddlewareMixin):
     """
     1. System setup enforcement (superadmin creation and first login)
     2. Password change requirements for any user with must_change_password=True
     3. Blocking access during system initialization
+
+    The setup state comes from accounts.setup_state and URLs are reversed
+    once, so a request on a set-up system costs no queries here.
     """
 
     def process_request(self, request):
@@ -17,84 +23,78 @@ class MustChangePasswordMiddleware(MiddlewareMixin):
         if any(request.path.startswith(path) for path in allowed_paths):
             return None
 
-        # Import here to avoid circular imports
-        from accounts.models import User
-
         # Check if system needs initial setup
-        superadmin = User.objects.filter(role='SUPERADMIN').first()
+        setup_state = get_setup_state()
 
-        if not superadmin:
+        if setup_state.status == MISSING_SUPERADMIN:
             # No superadmin exists, system needs setup
             self._handle_missing_superadmin(request)
             return None
 
         # If superadmin exists but needs password change, enforce system-wide setup
-        if superadmin.must_change_password:
-            return self._handle_system_setup(request, superadmin)
+        if setup_state.status == SUPERADMIN_MUST_CHANGE_PASSWORD:
+            return self._handle_system_setup(request, setup_state.superadmin_id)
 
         # System is set up, handle individual user password change requirements
         return self._handle_user_password_change(request)
 
+    @cached_property
+    def _urls(self):
+        """Named URLs this middleware lets through or redirects to, reversed once."""
+        login = self._safe_reverse('login')
+        password_change_paths = frozenset(filter(None, (
+            self._safe_reverse(name)
+            for name in ("password_change", "password_change_done", "logout", "login")
+        )))
+        return {
+            'login': login or '/accounts/login/',
+            'logout': self._safe_reverse('logout') or '/accounts/logout/',
+            'password_change': self._safe_reverse('password_change') or '/accounts/password/change/',
+            'missing_superadmin_allowed': frozenset([login or '/accounts/login/', '/admin/']),
+            # Django admin login is allowed too (but not other admin pages)
+            'setup_allowed': password_change_paths | {'/admin/login/'},
+            'setup_anonymous_allowed': frozenset([login, '/admin/login/']),
+            'password_change_allowed': password_change_paths,
+        }
+
     def _handle_missing_superadmin(self, request):
         """Handle case where no superadmin exists in the system"""
         # Only allow access to login page and admin (for setup via Django admin if needed)
-        allowed_paths = [reverse('login')] if self._safe_reverse('login') else ['/accounts/login/']
-        allowed_paths.extend(['/admin/'])
-
-        if request.path not in allowed_paths:
+        if request.path not in self._urls['missing_superadmin_allowed']:
             try:
                 messages.error(request, 'System setup required. Please run: python manage.py setup_system')
             except:
                 # Handle case where messages framework isn't available (e.g., in tests)
                 pass
-            return redirect('login') if self._safe_reverse('login') else redirect('/accounts/login/')
+            return redirect(self._urls['login'])
 
-    def _handle_system_setup(self, request, superadmin):
+    def _handle_system_setup(self, request, superadmin_id):
         """Handle system setup phase when superadmin needs password change"""
         user = getattr(request, "user", None)
 
-        # Define allowed URLs during setup
-        allowed_names = {
-            "password_change",
-            "password_change_done",
-            "logout",
-            "login",
-        }
-
-        # Get allowed paths, handling cases where URLs might not be available
-        allowed_paths = []
-        for name in allowed_names:
-            path = self._safe_reverse(name)
-            if path:
-                allowed_paths.append(path)
-
-        # Allow Django admin login (but not other admin pages)
-        if request.path == '/admin/login/':
-            allowed_paths.append('/admin/login/')
-
         current_path = request.path
 
         if not user or not user.is_authenticated:
             # Not authenticated - only allow login and admin login
-            if current_path not in [self._safe_reverse('login'), '/admin/login/']:
-                return redirect('login') if self._safe_reverse('login') else redirect('/accounts/login/')
+            if current_path not in self._urls['setup_anonymous_allowed']:
+                return redirect(self._urls['login'])
             return None
 
-        if user != superadmin:
+        if user.pk != superadmin_id:
             # Authenticated but not the superadmin - deny access during setup
             try:
                 messages.error(request, 'System setup is in progress. Please wait for the administrator to complete initial setup.')
             except:
                 pass
-            return redirect('logout') if self._safe_reverse('logout') else redirect('/accounts/logout/')
+            return redirect(self._urls['logout'])
 
         # This is the superadmin - check if they're trying to change password
-        if current_path not in allowed_paths:
+        if current_path not in self._urls['setup_allowed']:
             try:
                 messages.warning(request, 'You must change your password before the system can be used.')
             except:
                 pass
-            return redirect('password_change') if self._safe_reverse('password_change') else redirect('/accounts/password/change/')
+            return redirect(self._urls['password_change'])
 
         return None
 
@@ -110,34 +110,19 @@ class MustChangePasswordMiddleware(MiddlewareMixin):
         if not getattr(user, "must_change_password", False):
             return None
 
-        # User needs to change password - define allowed URLs
-        allowed_names = {
-            "password_change",
-            "password_change_done",
-            "logout",
-            "login",
-        }
-
         current_path = request.path
 
         # Allow static/media files
         if current_path.startswith("/static/") or current_path.startswith("/media/"):
             return None
 
-        # Get allowed paths
-        allowed_paths = []
-        for name in allowed_names:
-            path = self._safe_reverse(name)
-            if path:
-                allowed_paths.append(path)
-
         # If user is trying to access a non-allowed page, redirect to password change
-        if current_path not in allowed_paths:
+        if current_path not in self._urls['password_change_allowed']:
             try:
                 messages.warning(request, 'You must change your password before accessing the system.')
             except:
                 pass
-            return redirect("password_change") if self._safe_reverse('password_change') else redirect('/accounts/password/change/')
+            return redirect(self._urls['password_change'])
 
         return None
 
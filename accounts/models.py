@@ -41,23 +41,33 @@ class User(AbstractUser):
     def is_superadmin(self) -> bool:
         return self.role == self.UserRole.SUPERADMIN
 
+    # Role as last loaded from or saved to the database, see save()
+    _loaded_role = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_role = instance.__dict__.get('role')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'role' in fields:
+            self._loaded_role = self.__dict__.get('role')
+
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        old_role = None
-        
-        if not is_new:
-            try:
-                old_instance = User.objects.get(pk=self.pk)
-                old_role = old_instance.role
-            except User.DoesNotExist:
-                # Handle edge case where pk exists but object doesn't
-                is_new = True
-        
+        is_new = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        # A deferred role is not written, and reading it would cost a query
+        role_saved = 'role' in self.__dict__ and (update_fields is None or 'role' in update_fields)
+
         super().save(*args, **kwargs)
-        
+
         # Assign to groups if role changed or new user
-        if is_new or old_role != self.role:
+        if role_saved and (is_new or self._loaded_role != self.role):
             self._assign_to_group()
+        if role_saved:
+            self._loaded_role = self.role
     
     def _assign_to_group(self):
         """Assign user to appropriate group based on role"""
@@ -4,7 +4,73 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 from functools import wraps
+from types import MappingProxyType
+
+
+# Roles are fixed, so their permissions are too. RolePermissionBackend answers
+# permission checks from this map; the groups below mirror it for Django admin.
+PERMISSION_NAMES = {
+    'can_manage_users': 'Can manage users',
+    'can_view_analytics': 'Can view analytics',
+    'can_create_admins': 'Can create administrators',
+    'can_manage_official_repos': 'Can manage official repositories',
+    'can_manage_repositories': 'Can manage repositories',
+    'can_star_repositories': 'Can star repositories',
+}
+
+ROLE_PERMISSIONS = MappingProxyType({
+    # Super Admin permissions (all)
+    'SUPERADMIN': frozenset(PERMISSION_NAMES),
+    # Admin permissions (subset)
+    'ADMIN': frozenset({
+        'can_manage_users',
+        'can_view_analytics',
+        'can_manage_official_repos',
+        'can_manage_repositories',
+        'can_star_repositories',
+    }),
+    # User permissions (basic)
+    'USER': frozenset({
+        'can_manage_repositories',
+        'can_star_repositories',
+    }),
+})
+
+# Compact form of ROLE_PERMISSIONS: one bit per permission, one mask per role
+PERMISSION_BITS = MappingProxyType({codename: 1 << index for index, codename in enumerate(PERMISSION_NAMES)})
+ALL_PERMISSIONS_MASK = (1 << len(PERMISSION_NAMES)) - 1
+ROLE_PERMISSION_MASKS = MappingProxyType({
+    role: sum(PERMISSION_BITS[codename] for codename in codenames)
+    for role, codenames in ROLE_PERMISSIONS.items()
+})
+
+ROLE_GROUPS = MappingProxyType({
+    'SUPERADMIN': 'Super Administrators',
+    'ADMIN': 'Administrators',
+    'USER': 'Users',
+})
+
+
+def permission_mask(user):
+    """
+    Bitmask of the user's role permissions. It is worked out once per user
+    object and request, and shared by the context processor, has_perm and
+    views; changing role, is_superuser or is_active on the object renews it.
+    """
+    if not user.is_authenticated or not user.is_active:
+        return 0
+    key = (user.role, user.is_superuser)
+    memo = user.__dict__.get('_permission_mask')
+    if memo is None or memo[0] != key:
+        mask = ALL_PERMISSIONS_MASK if user.is_superuser else ROLE_PERMISSION_MASKS.get(user.role, 0)
+        memo = user._permission_mask = (key, mask)
+    return memo[1]
+
+
+def has_role_permission(user, codename):
+    return bool(permission_mask(user) & PERMISSION_BITS[codename])
 
 
 def setup_groups_and_permissions():
@@ -12,97 +78,30 @@ def setup_groups_and_permissions():
     Set up Django groups and permissions for the application.
     Should be called during system initialization.
     """
-    # Get or create groups
-    admin_group, _ = Group.objects.get_or_create(name='Administrators')
-    superadmin_group, _ = Group.objects.get_or_create(name='Super Administrators')
-    user_group, _ = Group.objects.get_or_create(name='Users')
-    
-    # Create custom permissions
     from accounts.models import User
     content_type = ContentType.objects.get_for_model(User)
-    
-    # Define custom permissions
-    permissions_to_create = [
-        ('can_manage_users', 'Can manage users'),
-        ('can_view_analytics', 'Can view analytics'),
-        ('can_create_admins', 'Can create administrators'),
-        ('can_manage_official_repos', 'Can manage official repositories'),
-        ('can_manage_repositories', 'Can manage repositories'),
-        ('can_star_repositories', 'Can star repositories'),
-    ]
-    
+
     # Create permissions if they don't exist
-    for codename, name in permissions_to_create:
-        Permission.objects.get_or_create(
+    permissions = {}
+    for codename, name in PERMISSION_NAMES.items():
+        permissions[codename], _ = Permission.objects.get_or_create(
             codename=codename,
             content_type=content_type,
             defaults={'name': name}
         )
-    
-    # Assign permissions to groups
-    # Super Admin permissions (all)
-    superadmin_permissions = [
-        'can_manage_users',
-        'can_view_analytics', 
-        'can_create_admins',
-        'can_manage_official_repos',
-        'can_manage_repositories',
-        'can_star_repositories',
-    ]
-    
-    # Admin permissions (subset)
-    admin_permissions = [
-        'can_manage_users',
-        'can_view_analytics',
-        'can_manage_official_repos',
-        'can_manage_repositories',
-        'can_star_repositories',
-    ]
-    
-    # User permissions (basic)
-    user_permissions = [
-        'can_manage_repositories',
-        'can_star_repositories',
-    ]
-    
-    # Clear existing permissions and reassign
-    superadmin_group.permissions.clear()
-    admin_group.permissions.clear()
-    user_group.permissions.clear()
-    
-    # Assign permissions to Super Admin group
-    for perm_codename in superadmin_permissions:
-        perm = Permission.objects.get(codename=perm_codename, content_type=content_type)
-        superadmin_group.permissions.add(perm)
-    
-    # Assign permissions to Admin group
-    for perm_codename in admin_permissions:
-        perm = Permission.objects.get(codename=perm_codename, content_type=content_type)
-        admin_group.permissions.add(perm)
-    
-    # Assign permissions to User group
-    for perm_codename in user_permissions:
-        perm = Permission.objects.get(codename=perm_codename, content_type=content_type)
-        user_group.permissions.add(perm)
+
+    # Mirror ROLE_PERMISSIONS into one group per role
+    for role, group_name in ROLE_GROUPS.items():
+        group, _ = Group.objects.get_or_create(name=group_name)
+        group.permissions.set([permissions[codename] for codename in ROLE_PERMISSIONS[role]])
 
 
 def assign_user_to_group(user):
     """
     Assign user to appropriate group based on their role.
     """
-    # Remove user from all groups first
-    user.groups.clear()
-    
-    # Assign to appropriate group based on role
-    if user.role == 'SUPERADMIN':
-        group = Group.objects.get(name='Super Administrators')
-        user.groups.add(group)
-    elif user.role == 'ADMIN':
-        group = Group.objects.get(name='Administrators')
-        user.groups.add(group)
-    else:  # USER
-        group = Group.objects.get(name='Users')
-        user.groups.add(group)
+    # set() only deletes and inserts the difference, usually nothing
+    user.groups.set([Group.objects.get(name=ROLE_GROUPS.get(user.role, ROLE_GROUPS['USER']))])
 
 
 def check_setup_required(view_func):
@@ -112,14 +111,13 @@ def check_setup_required(view_func):
     """
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
-        from accounts.models import User
-        
-        # Check if any superadmin exists
-        superadmin = User.objects.filter(role='SUPERADMIN').first()
-        
-        if superadmin and superadmin.must_change_password:
+        from accounts.setup_state import SUPERADMIN_MUST_CHANGE_PASSWORD, get_setup_state
+
+        setup_state = get_setup_state()
+
+        if setup_state.status == SUPERADMIN_MUST_CHANGE_PASSWORD:
             # If user is not the superadmin, deny access
-            if not request.user.is_authenticated or request.user != superadmin:
+            if not request.user.is_authenticated or request.user.pk != setup_state.superadmin_id:
                 from django.contrib import messages
                 messages.error(request, 'System setup is in progress. Please wait.')
                 return redirect('login')
@@ -212,14 +210,18 @@ def get_user_permissions_context(user):
     """
     if not user.is_authenticated:
         return {}
-    
+
+    # Lazy flags: a page that never references one never computes it
+    def flag(*codenames):
+        return SimpleLazyObject(lambda: any(has_role_permission(user, codename) for codename in codenames))
+
     return {
-        'can_manage_users': user.has_perm('accounts.can_manage_users'),
-        'can_view_analytics': user.has_perm('accounts.can_view_analytics'),
-        'can_create_admins': user.has_perm('accounts.can_create_admins'),
-        'can_manage_official_repos': user.has_perm('accounts.can_manage_official_repos'),
-        'can_manage_repositories': user.has_perm('accounts.can_manage_repositories'),
-        'can_star_repositories': user.has_perm('accounts.can_star_repositories'),
-        'is_admin': user.has_perm('accounts.can_manage_users') or user.has_perm('accounts.can_view_analytics'),
-        'is_superadmin': user.has_perm('accounts.can_create_admins'),
-    }
\ No newline at end of file
+        'can_manage_users': flag('can_manage_users'),
+        'can_view_analytics': flag('can_view_analytics'),
+        'can_create_admins': flag('can_create_admins'),
+        'can_manage_official_repos': flag('can_manage_official_repos'),
+        'can_manage_repositories': flag('can_manage_repositories'),
+        'can_star_repositories': flag('can_star_repositories'),
+        'is_admin': flag('can_manage_users', 'can_view_analytics'),
+        'is_superadmin': flag('can_create_admins'),
+    }
@@ -0,0 +1,113 @@
+"""
+Process-wide cache of the system setup state.
+
+Every request needs to know whether a SUPERADMIN exists and whether they
+still have to change their password. The answer is loaded once per process
+and kept until a User change (accounts.signals) clears it: locally right away,
+and in every other process through Redis pub/sub once the change commits.
+It is only kept once the pub/sub subscription is confirmed, and for at most
+SETUP_STATE_MAX_AGE seconds in case a message is lost anyway.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from docker_platform import pubsub
+
+MISSING_SUPERADMIN = 'missing_superadmin'
+SUPERADMIN_MUST_CHANGE_PASSWORD = 'superadmin_must_change_password'
+READY = 'ready'
+
+SetupState = namedtuple('SetupState', ['status', 'superadmin_id'])
+
+CHANNEL = 'accounts:setup_state'
+
+
+def _channel():
+    return cache.make_key(CHANNEL)
+
+
+class _SetupStateCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._subscription = None
+        self._waited = False
+
+    def get(self):
+        state = self._state
+        if state is not None and time.monotonic() - self._loaded_at < settings.SETUP_STATE_MAX_AGE:
+            return state
+
+        version = self._version
+        keep = self._subscribed()
+        state = self._load()
+        with self._lock:
+            if keep and version == self._version:
+                self._state = state
+                self._loaded_at = time.monotonic()
+        return state
+
+    def cached(self):
+        """The state as last loaded, or None; never queries."""
+        return self._state
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._state = None
+
+    def _subscribed(self):
+        """Whether invalidations reach this process, so a loaded state may be kept."""
+        if self._subscription is None:
+            self._subscription = pubsub.subscribe(_channel(), self._on_message, on_reconnect=self.clear)
+        if self._subscription.is_set():
+            return True
+        # Only the first load waits; later ones query until confirmed
+        waited, self._waited = self._waited, True
+        return not waited and self._subscription.wait(pubsub.CONFIRM_TIMEOUT)
+
+    def _on_message(self, data):
+        # Another process changed a user that affects the setup state
+        self.clear()
+
+    def _load(self):
+        from accounts.models import User
+
+        superadmin = User.objects.filter(role='SUPERADMIN').values_list('pk', 'must_change_password').first()
+        if superadmin is None:
+            return SetupState(MISSING_SUPERADMIN, None)
+        superadmin_id, must_change_password = superadmin
+        if must_change_password:
+            return SetupState(SUPERADMIN_MUST_CHANGE_PASSWORD, superadmin_id)
+        return SetupState(READY, superadmin_id)
+
+
+_setup_state = _SetupStateCache()
+
+
+def get_setup_state():
+    return _setup_state.get()
+
+
+def setup_state_changed():
+    _setup_state.clear()
+    transaction.on_commit(lambda: pubsub.publish(_channel(), 'changed'), robust=True)
+
+
+def reset_setup_state():
+    """Forget the cached state in this process only."""
+    _setup_state.clear()
+
+
+def affects_setup_state(user):
+    """Whether saving or deleting this user can change the setup state."""
+    state = _setup_state.cached()
+    return user.role == 'SUPERADMIN' or state is None or state.superadmin_id == user.pk
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .setup_state import affects_setup_state, setup_state_changed
+
+SETUP_STATE_FIELDS = frozenset({'role', 'must_change_password'})
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_setup_state_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SETUP_STATE_FIELDS.intersection(update_fields):
+        return
+    if affects_setup_state(instance):
+        setup_state_changed()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_setup_state_on_delete(sender, instance, **kwargs):
+    if affects_setup_state(instance):
+        setup_state_changed()
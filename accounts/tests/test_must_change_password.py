@@ -1,8 +1,17 @@
 from __future__ import annotations
 
+import threading
+
 import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.urls import reverse
 
+from accounts.middleware import MustChangePasswordMiddleware
+from accounts.models import User
+from accounts.setup_state import READY, SUPERADMIN_MUST_CHANGE_PASSWORD, _setup_state, get_setup_state
+
 
 @pytest.fixture
 def user_must_change_password(db, user_factory):
@@ -55,3 +64,78 @@ def test_password_change_clears_flag(client, user_must_change_password):
     # Now admin should be accessible
     resp2 = client.get("/admin/", follow=False)
     assert resp2.status_code != 302
+
+
+def _middleware():
+    return MustChangePasswordMiddleware(lambda request: HttpResponse("OK"))
+
+
+def _anonymous_request(path="/api/auth/token/"):
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    return request
+
+
+@pytest.mark.django_db
+def test_set_up_system_costs_no_queries(superadmin_user, django_assert_num_queries):
+    middleware = _middleware()
+    middleware(_anonymous_request())
+
+    with django_assert_num_queries(0):
+        response = middleware(_anonymous_request())
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_flagging_superadmin_applies_to_next_request(superadmin_user):
+    middleware = _middleware()
+    assert middleware(_anonymous_request("/explore/")).status_code == 200
+
+    superadmin_user.must_change_password = True
+    superadmin_user.save(update_fields=["must_change_password"])
+
+    response = middleware(_anonymous_request("/explore/"))
+    assert response.status_code == 302
+    assert response["Location"] == reverse("login")
+
+
+@pytest.mark.django_db
+def test_unrelated_user_changes_keep_cached_state(superadmin_user, regular_user, django_assert_num_queries):
+    get_setup_state()
+
+    regular_user.email = "alice@example.org"
+    regular_user.save()
+
+    with django_assert_num_queries(0):
+        assert get_setup_state().status == READY
+
+
+@pytest.mark.django_db
+def test_change_published_by_another_process_clears_state(superadmin_user):
+    assert get_setup_state().status == READY
+    # Another process flagged the superadmin; only its message reaches this one
+    User.objects.filter(pk=superadmin_user.pk).update(must_change_password=True)
+    assert get_setup_state().status == READY
+
+    _setup_state._on_message(b"changed")
+
+    assert get_setup_state() == (SUPERADMIN_MUST_CHANGE_PASSWORD, superadmin_user.pk)
+
+
+@pytest.mark.django_db
+def test_state_is_not_kept_until_subscribed(superadmin_user, django_assert_num_queries, monkeypatch):
+    monkeypatch.setattr(_setup_state, "_subscription", threading.Event())  # Never confirmed
+    monkeypatch.setattr(_setup_state, "_waited", True)
+    get_setup_state()
+
+    with django_assert_num_queries(1):
+        assert get_setup_state().status == READY
+
+
+@pytest.mark.django_db
+def test_state_is_reloaded_after_max_age(superadmin_user, settings):
+    assert get_setup_state().status == READY
+    User.objects.filter(pk=superadmin_user.pk).update(must_change_password=True)
+
+    settings.SETUP_STATE_MAX_AGE = 0
+    assert get_setup_state() == (SUPERADMIN_MUST_CHANGE_PASSWORD, superadmin_user.pk)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import AnonymousUser, Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from accounts.permissions import (
+    ROLE_GROUPS, ROLE_PERMISSION_MASKS, ROLE_PERMISSIONS,
+    get_user_permissions_context, has_role_permission, permission_mask,
+)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("role", ["SUPERADMIN", "ADMIN", "USER"])
+def test_role_permissions_follow_static_map(user_factory, role):
+    user = user_factory(username=f"{role.lower()}-user", role=role)
+
+    for codename in ROLE_PERMISSIONS["SUPERADMIN"]:
+        assert user.has_perm(f"accounts.{codename}") == (codename in ROLE_PERMISSIONS[role])
+
+
+@pytest.mark.django_db
+def test_permission_checks_do_not_query(admin_user, django_assert_num_queries):
+    user = User.objects.get(pk=admin_user.pk)
+
+    with django_assert_num_queries(0):
+        context = get_user_permissions_context(user)
+        assert context["is_admin"]
+        assert not context["is_superadmin"]
+
+
+@pytest.mark.django_db
+def test_denied_role_permission_skips_groups(regular_user, django_assert_num_queries):
+    user = User.objects.get(pk=regular_user.pk)
+
+    with django_assert_num_queries(0):
+        assert not user.has_perm("accounts.can_view_analytics")
+
+
+@pytest.mark.django_db
+def test_role_permissions_ignore_permission_rows(regular_user):
+    from django.contrib.auth.models import Permission
+
+    regular_user.user_permissions.add(Permission.objects.get(codename="can_view_analytics"))
+    user = User.objects.get(pk=regular_user.pk)
+
+    # The role map is the single source of truth for accounts.can_*
+    assert not user.has_perm("accounts.can_view_analytics")
+
+
+@pytest.mark.django_db
+def test_superuser_keeps_every_permission(user_factory):
+    user = user_factory(username="root", role="USER", is_superuser=True)
+
+    assert user.has_perm("accounts.can_create_admins")
+    # Non-role permissions still come from ModelBackend
+    assert user.has_perm("registry.change_repository")
+
+
+@pytest.mark.django_db
+def test_inactive_user_has_no_role_permissions(user_factory):
+    user = user_factory(username="gone", role="ADMIN", is_active=False)
+
+    assert not user.has_perm("accounts.can_manage_users")
+
+
+def test_anonymous_user_has_no_role_permissions():
+    assert not AnonymousUser().has_perm("accounts.can_star_repositories")
+
+
+@pytest.mark.django_db
+def test_login_timestamp_save_is_a_single_update(regular_user, django_assert_num_queries):
+    user = User.objects.get(pk=regular_user.pk)
+    user.last_login = timezone.now()
+
+    with django_assert_num_queries(1):
+        user.save(update_fields=["last_login"])
+
+
+@pytest.mark.django_db
+def test_unchanged_role_leaves_groups_alone(regular_user):
+    user = User.objects.get(pk=regular_user.pk)
+    user.first_name = "Alice"
+
+    with CaptureQueriesContext(connection) as queries:
+        user.save()
+
+    assert not any("accounts_user_groups" in query["sql"] for query in queries)
+    assert not any(query["sql"].startswith("SELECT") and 'FROM "accounts_user"' in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db
+def test_role_change_moves_user_to_new_group(regular_user):
+    user = User.objects.get(pk=regular_user.pk)
+
+    user.role = "ADMIN"
+    user.save(update_fields=["role"])
+
+    assert list(user.groups.values_list("name", flat=True)) == [ROLE_GROUPS["ADMIN"]]
+
+
+@pytest.mark.django_db
+def test_role_change_after_refresh_is_detected(regular_user):
+    User.objects.filter(pk=regular_user.pk).update(role="ADMIN")
+    regular_user.groups.set([Group.objects.get(name=ROLE_GROUPS["ADMIN"])])
+    regular_user.refresh_from_db()
+
+    regular_user.role = "USER"
+    regular_user.save()
+
+    assert list(regular_user.groups.values_list("name", flat=True)) == [ROLE_GROUPS["USER"]]
+
+
+def test_context_flags_are_computed_on_use():
+    user = User(role="ADMIN")
+
+    with patch("accounts.permissions.has_role_permission", wraps=has_role_permission) as check:
+        context = get_user_permissions_context(user)
+        assert check.call_count == 0
+
+        assert context["can_view_analytics"]
+        assert check.call_count == 1
+
+
+def test_permission_mask_is_shared_and_follows_role_changes():
+    user = User(role="USER")
+    assert not user.has_perm("accounts.can_manage_users")
+    assert has_role_permission(user, "can_star_repositories")
+
+    user.role = "ADMIN"
+
+    assert user.has_perm("accounts.can_manage_users")
+    assert permission_mask(user) == ROLE_PERMISSION_MASKS["ADMIN"]
+
+
+@pytest.mark.django_db
+def test_registration_logs_the_new_user_in(client, superadmin_user):
+    response = client.post(reverse("register"), {
+        "username": "newcomer",
+        "email": "newcomer@example.com",
+        "password1": "Sup3r-secret-pass",
+        "password2": "Sup3r-secret-pass",
+    })
+
+    assert response.status_code == 302
+    assert client.session["_auth_user_id"] == str(User.objects.get(username="newcomer").pk)
+    assert client.session["_auth_user_backend"] == "accounts.backends.RolePermissionBackend"
+
+
+@pytest.mark.django_db
+def test_forced_login_loads_the_user_back(client, superadmin_user, regular_user):
+    client.force_login(regular_user)
+
+    response = client.get(reverse("profile"))
+
+    assert response.status_code == 200
+    assert response.context["user"] == regular_user
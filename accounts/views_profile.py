@@ -4,6 +4,7 @@ from django.db.models import Count
 from django.shortcuts import render
 
 from registry.models import Repository, Star
+from registry.services.stars import mark_starred, overlay_pending_stars
 
 
 @login_required
@@ -62,7 +63,9 @@ def starred_repositories(request):
     paginator = Paginator(starred_repos, 20)  # 20 per page
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
-    
+    overlay_pending_stars(page_obj.object_list)
+    mark_starred(user, page_obj.object_list)
+
     return render(
         request,
         "accounts/starred_repositories.html",
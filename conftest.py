@@ -8,6 +8,15 @@ def setup_permissions(db):
     setup_groups_and_permissions()
 
 
+@pytest.fixture(autouse=True)
+def reset_process_caches():
+    """Per-process caches outlive each test's rolled-back transaction."""
+    from accounts.setup_state import reset_setup_state
+    from registry.acl_index import acl_index
+    acl_index.reset()
+    reset_setup_state()
+
+
 @pytest.fixture
 def user_factory(db):
     """Factory fixture for creating users."""
@@ -40,13 +40,14 @@ echo "Database is ready!"
 # Create secrets directory if it doesn't exist
 mkdir -p /app/secrets
 
-# Run database migrations
-echo "Running migrations..."
-python manage.py migrate
-
-# Collect static files
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
+# Run database migrations and collect static files (only the web container does this)
+if [ "${RUN_MIGRATIONS:-true}" = "true" ]; then
+    echo "Running migrations..."
+    python manage.py migrate
+
+    echo "Collecting static files..."
+    python manage.py collectstatic --noinput
+fi
 
 echo "Django application is ready!"
 
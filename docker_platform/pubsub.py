@@ -0,0 +1,124 @@
+"""
+Process-wide Redis pub/sub fan-out for in-memory caches.
+
+Modules register one handler per channel. The first subscription starts a
+single daemon listener thread for the process, which subscribes to every
+registered channel and calls the handlers with the raw message payload.
+Messages published before Redis confirms a subscription are never delivered,
+so subscribe() returns an Event that is set once it is confirmed; state loaded
+before then may already be stale and must not be cached. Messages can also be
+lost while the connection is down, so the events are cleared until the
+listener has resubscribed, and each channel's on_reconnect hook is called to
+drop whatever local state might have missed an update.
+"""
+import logging
+import threading
+import time
+
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 1.0  # seconds
+POLL_TIMEOUT = 0.1  # seconds; also how soon a new channel is subscribed
+CONFIRM_TIMEOUT = 2.0  # seconds a first load waits for its subscription
+
+_handlers = {}
+_lock = threading.Lock()
+_listener = None
+
+
+def publish(channel, message):
+    try:
+        get_redis_connection("default").publish(channel, message)
+    except Exception as e:
+        logger.warning(f"Failed to publish to {channel}: {e}")
+
+
+def subscribe(channel, handler, on_reconnect=None):
+    """
+    Call handler(payload) for every message on channel, in a background thread.
+    Returns the channel's confirmation Event (see the module docstring).
+    """
+    global _listener
+    with _lock:
+        registered = _handlers.get(channel)
+        confirmed = registered[2] if registered else threading.Event()
+        _handlers[channel] = (handler, on_reconnect, confirmed)
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name='redis-pubsub-listener', daemon=True)
+            _listener.start()
+    return confirmed
+
+
+def _channel_name(message):
+    channel = message['channel']
+    return channel.decode() if isinstance(channel, bytes) else channel
+
+
+def _confirmed(message):
+    _, _, confirmed = _handlers.get(_channel_name(message), (None, None, None))
+    if confirmed is not None:
+        confirmed.set()
+
+
+def _dispatch(message):
+    channel = _channel_name(message)
+    handler, _, _ = _handlers.get(channel, (None, None, None))
+    if handler is None:
+        return
+    try:
+        handler(message['data'])
+    except Exception as e:
+        logger.error(f"Pub/sub handler for {channel} failed: {e}", exc_info=True)
+
+
+def _disconnected():
+    for _, _, confirmed in list(_handlers.values()):
+        confirmed.clear()
+
+
+def _reconnected():
+    for channel, (_, on_reconnect, _) in list(_handlers.items()):
+        if on_reconnect is not None:
+            try:
+                on_reconnect()
+            except Exception as e:
+                logger.error(f"Pub/sub reconnect hook for {channel} failed: {e}", exc_info=True)
+
+
+def _listen():
+    pubsub = None
+    subscribed = set()
+    while True:
+        try:
+            if pubsub is None:
+                pubsub = get_redis_connection("default").pubsub()
+                subscribed = set()
+
+            # Channels registered after start-up are picked up here, on this
+            # thread, because PubSub objects are not thread-safe
+            with _lock:
+                new_channels = set(_handlers) - subscribed
+            if new_channels:
+                pubsub.subscribe(*new_channels)
+                subscribed |= new_channels
+
+            message = pubsub.get_message(timeout=POLL_TIMEOUT)
+            if message is None:
+                continue
+            if message['type'] == 'subscribe':
+                _confirmed(message)
+            elif message['type'] == 'message':
+                _dispatch(message)
+        except Exception as e:
+            logger.warning(f"Pub/sub listener lost its connection, reconnecting: {e}")
+            _disconnected()
+            try:
+                if pubsub is not None:
+                    pubsub.close()
+            except Exception:
+                pass
+            pubsub = None
+            time.sleep(RECONNECT_DELAY)
+            _reconnected()
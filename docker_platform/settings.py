@@ -35,6 +35,12 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '127.0.0.1,localhost,testserver').spl
 # Application definition
 AUTH_USER_MODEL='accounts.User'
 
+# Role permissions come from User.role; logins and admin permissions are the
+# inherited ModelBackend behaviour
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.RolePermissionBackend',
+]
+
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
@@ -47,6 +53,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
@@ -56,6 +63,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'accounts.middleware.MustChangePasswordMiddleware',
+    'registry.middleware.CoalescedInvalidationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -142,7 +150,20 @@ CACHES = {
         },
         'KEY_PREFIX': 'scm',
         'TIMEOUT': 300,  # Default 5 minutes
-    }
+    },
+    # Starred sets and unflushed write-behind stars (registry.services.stars).
+    # They exist nowhere else until flushed, so point this at a Redis with
+    # maxmemory-policy noeviction rather than the LRU cache above
+    'stars': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('STARS_REDIS_URL', os.getenv('REDIS_URL', 'redis://redis:6379/1')),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 5,
+            'SOCKET_TIMEOUT': 5,
+        },
+        'KEY_PREFIX': 'scm',
+    },
 }
 
 # Session storage in Redis
@@ -156,6 +177,86 @@ CACHE_TIMEOUT_REPO_DETAIL = 600  # 10 minutes
 CACHE_TIMEOUT_USER_PROFILE = 300  # 5 minutes
 CACHE_TIMEOUT_SEARCH = 180  # 3 minutes
 CACHE_TIMEOUT_STATS = 60  # 1 minute
+CACHE_TIMEOUT_REPO_CARD = 600  # 10 minutes
+
+# Explore cache entries hold at most this many ranked repository ids
+EXPLORE_CACHE_MAX_RESULTS = 1000
+
+# Stale-while-revalidate explore cache: entries go stale after
+# CACHE_TIMEOUT_EXPLORE (or any invalidation) but keep being served for up to
+# CACHE_TIMEOUT_EXPLORE_STALE while one worker, holding a short lock, recomputes
+EXPLORE_STALE_WHILE_REVALIDATE = os.getenv('EXPLORE_STALE_WHILE_REVALIDATE', 'False').lower() in ('true', '1', 'yes', 'on')
+CACHE_TIMEOUT_EXPLORE_STALE = 1800  # 30 minutes
+EXPLORE_RECOMPUTE_LOCK_TIMEOUT = 15  # seconds
+EXPLORE_COLD_WAIT = 2  # seconds a request waits for a recompute when nothing is cached
+
+# Explore pagination: keyset cursors instead of page numbers, and the point
+# past which result totals are reported as "N+" instead of counted exactly
+EXPLORE_CURSOR_PAGINATION = os.getenv('EXPLORE_CURSOR_PAGINATION', 'False').lower() in ('true', '1', 'yes', 'on')
+EXPLORE_COUNT_LIMIT = 1000
+
+# Registry tokens live REGISTRY_TOKEN_TTL seconds; an issued token is reused for
+# identical requests until this fraction of its lifetime has passed
+REGISTRY_TOKEN_TTL = 300
+REGISTRY_TOKEN_REUSE_FRACTION = float(os.getenv('REGISTRY_TOKEN_REUSE_FRACTION', '0.5'))
+
+# Successful registry Basic-auth checks are remembered (as a keyed HMAC) this long
+REGISTRY_CREDENTIAL_CACHE_TTL = 120
+
+# Access-token rows are cached this long (revocation evicts them at once), and
+# last_used_at is written at most once per touch interval
+REGISTRY_ACCESS_TOKEN_CACHE_TTL = 60
+REGISTRY_ACCESS_TOKEN_TOUCH_INTERVAL = 300
+
+# Per-process cache of the system setup state, dropped after this many seconds
+# even if no invalidation arrives
+SETUP_STATE_MAX_AGE = 300
+
+# Per-process repository ACL index used by registry auth and the webhook.
+# Unknown names are remembered briefly; the whole index is dropped after
+# MAX_AGE in case an invalidation message was lost. Per-repository entries
+# shared between processes are blocked for TOMBSTONE_TTL after a change
+REGISTRY_ACL_NEGATIVE_TTL = 30
+REGISTRY_ACL_INDEX_MAX_AGE = 300
+REGISTRY_ACL_ENTRY_TTL = 3600
+REGISTRY_ACL_TOMBSTONE_TTL = 60
+
+# Asynchronous registry webhook: envelopes are appended to a Redis Stream and
+# answered with 202; manage.py process_registry_events ingests them
+REGISTRY_WEBHOOK_ASYNC = os.getenv('REGISTRY_WEBHOOK_ASYNC', 'False').lower() in ('true', '1', 'yes', 'on')
+REGISTRY_EVENTS_STREAM_MAXLEN = 100000
+REGISTRY_EVENTS_BATCH_SIZE = 100
+REGISTRY_EVENTS_BLOCK_MS = 5000
+REGISTRY_EVENTS_CLAIM_IDLE_MS = 60000  # reclaim messages a dead worker left pending
+REGISTRY_EVENTS_MAX_DELIVERIES = 5  # then park the envelope in the dead-letter stream
+
+# Notification event ids are remembered this long to drop registry retries
+REGISTRY_EVENT_DEDUPE_TTL = 3600  # 1 hour
+# Claim held while an event is being ingested; keep it below REGISTRY_EVENTS_CLAIM_IDLE_MS
+# so a message reclaimed from a dead worker is not mistaken for a duplicate
+REGISTRY_EVENT_CLAIM_TTL = 30
+
+# Periodic jobs (manage.py run_periodic_jobs), intervals in seconds
+RELEVANCE_DECAY_INTERVAL = int(os.getenv('RELEVANCE_DECAY_INTERVAL', '3600'))  # 1 hour
+RELEVANCE_DECAY_CHUNK_SIZE = 5000
+PULL_COUNT_FLUSH_INTERVAL = int(os.getenv('PULL_COUNT_FLUSH_INTERVAL', '30'))
+STAR_FLUSH_INTERVAL = int(os.getenv('STAR_FLUSH_INTERVAL', '10'))
+STAR_RECONCILE_INTERVAL = int(os.getenv('STAR_RECONCILE_INTERVAL', '86400'))  # 1 day
+STAR_RECONCILE_CHUNK_SIZE = 50000
+
+# Write-behind pull counters: pulls are counted in Redis and flushed to Postgres
+# by the scheduler; the overlay adds not-yet-flushed pulls to displayed counts
+PULL_COUNT_WRITE_BEHIND = os.getenv('PULL_COUNT_WRITE_BEHIND', 'False').lower() in ('true', '1', 'yes', 'on')
+PULL_COUNT_OVERLAY_PENDING = os.getenv('PULL_COUNT_OVERLAY_PENDING', 'False').lower() in ('true', '1', 'yes', 'on')
+
+# Write-behind stars: toggles flip a per-user set in Redis and are persisted
+# as Star rows by the scheduler; displayed counts include unflushed stars
+STARS_WRITE_BEHIND = os.getenv('STARS_WRITE_BEHIND', 'False').lower() in ('true', '1', 'yes', 'on')
+STARRED_SET_TTL = 86400  # per-user starred ids in Redis, reloaded from Postgres after 1 day
+
+# Star/unstar JSON API: requests allowed per user in each fixed window (seconds)
+STAR_API_RATE_LIMIT = int(os.getenv('STAR_API_RATE_LIMIT', '30'))
+STAR_API_RATE_WINDOW = 60
 
 
 # Password validation
@@ -226,4 +327,6 @@ except FileNotFoundError:
     REGISTRY_PUBLIC_CERTIFICATE = ""
 
 REGISTRY_ISSUER = "docker-platform"
+# RS256, ES256 (P-256) or EdDSA (Ed25519, needs registry 3.x); must match jwt.key
+REGISTRY_TOKEN_ALGORITHM = os.getenv('REGISTRY_TOKEN_ALGORITHM', 'RS256')
 REGISTRY_SERVICE = "docker-platform-registry"
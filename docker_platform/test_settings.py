@@ -71,5 +71,16 @@ CACHES = {
         },
         'KEY_PREFIX': f'test_{WORKER_ID}',
         'TIMEOUT': 300,
-    }
+    },
+    # Same per-worker database, so workers never share stars:pending/stars:flushing
+    'stars': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f'redis://{os.getenv("REDIS_HOST", "redis")}:6379/{WORKER_NUM}',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 5,
+            'SOCKET_TIMEOUT': 5,
+        },
+        'KEY_PREFIX': f'test_{WORKER_ID}',
+    },
 }
\ No newline at end of file
@@ -20,7 +20,7 @@ from django.urls import include, path
 
 from accounts.views import home
 from registry.views import explore
-from registry.views_registry import docker_auth, registry_webhook
+from registry.views_registry import docker_auth, docker_auth_metrics, registry_webhook, registry_webhook_metrics
 
 urlpatterns = [
     path('', home, name='home'),
@@ -29,9 +29,15 @@ urlpatterns = [
     path('accounts/', include('accounts.urls')),
     path('registry/', include('registry.urls')),
     path('api/auth/token/', docker_auth, name='docker_auth'),
+    path('api/auth/token/metrics/', docker_auth_metrics, name='docker_auth_metrics'),
     path(
         'api/webhooks/registry/',
         registry_webhook,
         name='registry_webhook',
     ),
+    path(
+        'api/webhooks/registry/metrics/',
+        registry_webhook_metrics,
+        name='registry_webhook_metrics',
+    ),
 ]
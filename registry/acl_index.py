@@ -0,0 +1,240 @@
+"""
+Per-process repository ACL index for the registry auth hot path.
+
+Maps full registry names ("user/app", "ubuntu") to RepositoryACL tuples, so a
+token request or webhook for known repositories needs no SQL. Names a process
+does not know yet are read from per-repository entries shared through the
+cache, and only the rest from the database (one query per lookup). Repository
+and owner signals keep both levels fresh: they evict locally straight away
+and, on commit, publish the change to every other process.
+
+Shared entries are keyed by repository id, with name -> id hints in front of
+them. A change tombstones the repository's entry, both immediately and after
+commit; entries are only written with ADD, so a process that read the row
+before the change cannot put it back while the tombstone lasts.
+
+A process only keeps entries while its pub/sub subscription is confirmed, so
+no invalidation can slip past it. Names that do not resolve are remembered
+for REGISTRY_ACL_NEGATIVE_TTL seconds, and the whole index is dropped after
+REGISTRY_ACL_INDEX_MAX_AGE, or when the pub/sub connection drops, in case an
+invalidation was missed anyway.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from docker_platform import pubsub
+from registry.cache_keys import CacheKeys
+from registry.utils import resolve_repository_names
+
+logger = logging.getLogger(__name__)
+
+RepositoryACL = namedtuple('RepositoryACL', ['id', 'owner_id', 'visibility', 'is_official'])
+
+# Shared entry value of a repository that just changed
+TOMBSTONE = 0
+
+
+def _channel():
+    return cache.make_key(CacheKeys.repository_acl_channel())
+
+
+def read_shared_entries(full_names):
+    """Return {full_name: RepositoryACL} for the names with a valid shared entry."""
+    name_keys = {CacheKeys.repository_acl_name(name): name for name in full_names}
+    hints = cache.get_many(list(name_keys))
+    if not hints:
+        return {}
+    names_by_key = {
+        CacheKeys.repository_acl_entry(uuid.UUID(bytes=repo_id)): name_keys[key]
+        for key, repo_id in hints.items()
+    }
+
+    found = {}
+    for key, entry in cache.get_many(list(names_by_key)).items():
+        if entry == TOMBSTONE:
+            continue
+        full_name, repo_id, owner_id, visibility, is_official = entry
+        # A hint left behind by a rename points at a repository now known by another name
+        if full_name == names_by_key[key]:
+            found[full_name] = RepositoryACL(
+                uuid.UUID(bytes=repo_id), uuid.UUID(bytes=owner_id), visibility, is_official,
+            )
+    return found
+
+
+def write_shared_entries(acls):
+    """Share {full_name: RepositoryACL} read from the database with other processes."""
+    timeout = settings.REGISTRY_ACL_ENTRY_TTL
+    cache.set_many({CacheKeys.repository_acl_name(name): acl.id.bytes for name, acl in acls.items()}, timeout)
+    for full_name, acl in acls.items():
+        entry = (full_name, acl.id.bytes, acl.owner_id.bytes, acl.visibility, acl.is_official)
+        cache.add(CacheKeys.repository_acl_entry(acl.id), entry, timeout)
+
+
+def _tombstone(repo_ids):
+    cache.set_many(
+        {CacheKeys.repository_acl_entry(repo_id): TOMBSTONE for repo_id in repo_ids},
+        settings.REGISTRY_ACL_TOMBSTONE_TTL,
+    )
+
+
+class RepositoryACLIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._subscription = None
+        self._waited = False
+        self.reset()
+
+    def reset(self):
+        """Forget everything this process knows."""
+        with self._lock:
+            self._version += 1
+            self._entries = {}
+            self._names_by_id = {}
+            self._negative = {}
+            self._started_at = time.monotonic()
+
+    def lookup(self, full_names):
+        """Return {full_name: RepositoryACL} for the names that exist."""
+        names = set(full_names)
+        if not names:
+            return {}
+        keep = self._can_keep_entries()
+
+        now = time.monotonic()
+        entries, negative = self._entries, self._negative
+        found, missing = {}, []
+        for name in names:
+            acl = entries.get(name)
+            if acl is not None and keep:
+                found[name] = acl
+            elif not keep or negative.get(name, 0) <= now:
+                missing.append(name)
+        if not missing:
+            return found
+
+        version = self._version
+        shared = self._read_shared(missing)
+        unresolved = [name for name in missing if name not in shared]
+        resolved = {}
+        if unresolved:
+            rows = resolve_repository_names(unresolved, 'owner_id', 'visibility')
+            resolved = {
+                name: RepositoryACL(row['id'], row['owner_id'], row['visibility'], row['is_official'])
+                for name, row in rows.items()
+            }
+            self._write_shared(resolved)
+        found.update(shared)
+        found.update(resolved)
+
+        with self._lock:
+            # Never store what an eviction may have outdated meanwhile
+            if keep and version == self._version:
+                for name in missing:
+                    acl = found.get(name)
+                    if acl is None:
+                        self._negative[name] = now + settings.REGISTRY_ACL_NEGATIVE_TTL
+                    else:
+                        self._entries[name] = acl
+                        self._names_by_id[acl.id] = name
+        return found
+
+    def evict_repository(self, repo_id):
+        with self._lock:
+            self._version += 1
+            name = self._names_by_id.pop(repo_id, None)
+            if name is not None:
+                self._entries.pop(name, None)
+            # The change may have created or renamed a repository onto a name
+            # that is cached as missing
+            self._negative = {}
+
+    def evict_owner(self, owner_id):
+        with self._lock:
+            self._version += 1
+            for name, acl in list(self._entries.items()):
+                if acl.owner_id == owner_id:
+                    del self._entries[name]
+                    self._names_by_id.pop(acl.id, None)
+            self._negative = {}
+
+    def _can_keep_entries(self):
+        """Whether this process may keep entries: subscribed, and within the max age."""
+        if time.monotonic() - self._started_at >= settings.REGISTRY_ACL_INDEX_MAX_AGE:
+            self.reset()
+
+        if self._subscription is None:
+            self._subscription = pubsub.subscribe(_channel(), self._on_message, on_reconnect=self.reset)
+        if self._subscription.is_set():
+            return True
+        # Only the first lookup waits; later ones go to the database until confirmed
+        waited, self._waited = self._waited, True
+        return not waited and self._subscription.wait(pubsub.CONFIRM_TIMEOUT)
+
+    @staticmethod
+    def _read_shared(names):
+        try:
+            return read_shared_entries(names)
+        except Exception as e:
+            logger.warning(f"Shared repository ACL entries unavailable: {e}")
+            return {}
+
+    @staticmethod
+    def _write_shared(acls):
+        if not acls:
+            return
+        try:
+            write_shared_entries(acls)
+        except Exception as e:
+            logger.warning(f"Failed to share repository ACL entries: {e}")
+
+    def _on_message(self, data):
+        message = json.loads(data)
+        if 'repository_id' in message:
+            self.evict_repository(uuid.UUID(message['repository_id']))
+        if 'owner_id' in message:
+            self.evict_owner(uuid.UUID(message['owner_id']))
+
+
+acl_index = RepositoryACLIndex()
+
+
+def lookup_repositories(full_names):
+    return acl_index.lookup(full_names)
+
+
+def _changed(repo_ids, message):
+    def retire():
+        try:
+            _tombstone(repo_ids)
+        except Exception as e:
+            logger.error(f"Failed to retire shared repository ACL entries: {e}")
+
+    retire()
+    # Other processes hear about it once the change is visible to their queries;
+    # the second tombstone outlasts any row they read before the commit
+    transaction.on_commit(retire, robust=True)
+    transaction.on_commit(lambda: pubsub.publish(_channel(), json.dumps(message)), robust=True)
+
+
+def repository_acl_changed(repo_id):
+    acl_index.evict_repository(repo_id)
+    _changed([repo_id], {'repository_id': str(repo_id)})
+
+
+def owner_acl_changed(owner_id):
+    from registry.models import Repository
+
+    acl_index.evict_owner(owner_id)
+    repo_ids = list(Repository.objects.filter(owner_id=owner_id).values_list('id', flat=True))
+    _changed(repo_ids, {'owner_id': str(owner_id)})
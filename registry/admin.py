@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Repository, Tag
+from django.utils import timezone
+from .models import AccessToken, Repository, Tag
 
 @admin.register(Repository)
 class RepositoryAdmin(admin.ModelAdmin):
@@ -10,3 +11,22 @@ class RepositoryAdmin(admin.ModelAdmin):
 class TagAdmin(admin.ModelAdmin):
     list_display = ("name", "repository", "created_at")
     search_fields = ("name", "repository__name")
+
+@admin.register(AccessToken)
+class AccessTokenAdmin(admin.ModelAdmin):
+    list_display = ("name", "user", "prefix", "allow_push", "created_at", "last_used_at", "expires_at", "revoked_at")
+    list_filter = ("allow_push",)
+    search_fields = ("name", "prefix", "user__username")
+    readonly_fields = ("prefix", "created_at", "last_used_at")
+    actions = ["revoke"]
+
+    def has_add_permission(self, request):
+        # The plaintext must be shown once on creation: manage.py create_access_token
+        return False
+
+    @admin.action(description="Revoke selected tokens")
+    def revoke(self, request, queryset):
+        # Saved one by one so signals evict each cached token
+        for token in queryset.filter(revoked_at__isnull=True):
+            token.revoked_at = timezone.now()
+            token.save(update_fields=["revoked_at"])
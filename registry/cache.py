@@ -1,3 +1,5 @@
+import time
+
 from django.core.cache import cache
 from django_redis import get_redis_connection
 from .cache_keys import CacheKeys
@@ -18,21 +20,67 @@ def invalidate_user_cache(user_id):
     print(f"[CACHE] Invalidated user cache: {user_id}")
 
 
+def invalidate_cache_batch(repo_ids=(), user_ids=()):
+    """
+    Invalidate many repositories and users in one pipelined round trip: a
+    single DEL covering every key, plus one explore generation bump when any
+    repository changed.
+    """
+    keys_to_delete = [
+        key for repo_id in repo_ids for key in CacheKeys.get_repo_invalidation_keys(repo_id)
+    ] + [
+        key for user_id in user_ids for key in CacheKeys.get_user_invalidation_keys(user_id)
+    ]
+    if not keys_to_delete:
+        return
+
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        pipe.delete(*[cache.make_key(key) for key in keys_to_delete])
+        if repo_ids:
+            # Same clock seed as get_explore_generation, so INCR never starts at 1
+            generation_key = cache.make_key(CacheKeys.explore_generation())
+            pipe.set(generation_key, int(time.time() * 1000), nx=True)
+            pipe.incr(generation_key)
+        pipe.execute()
+
+        print(
+            f"[CACHE] Invalidated {len(repo_ids)} repositories and {len(user_ids)} users "
+            f"({len(keys_to_delete)} keys)"
+        )
+    except Exception as e:
+        print(f"[CACHE ERROR] Failed to invalidate cache batch: {e}")
+
+
+def get_explore_generation():
+    key = CacheKeys.explore_generation()
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so a generation lost to allkeys-lru eviction
+        # can never roll back onto entries that are still cached
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def explore_cache_key(query=None, badges=None):
+    return CacheKeys.explore(query, badges, generation=get_explore_generation())
+
+
 def invalidate_explore_cache():
+    """
+    Retire every explore entry with a single INCR of the generation counter.
+    Entries under older generations are never read again and expire by TTL.
+    """
     try:
-        conn = get_redis_connection("default")
-        pattern = CacheKeys.get_explore_invalidation_pattern()
-
-        cursor = 0
-        deleted_count = 0
-        while True:
-            cursor, keys = conn.scan(cursor, match=pattern, count=100)
-            if keys:
-                conn.delete(*keys)
-                deleted_count += len(keys)
-            if cursor == 0:
-                break
-
-        print(f"[CACHE] Invalidated {deleted_count} explore cache entries")
+        key = CacheKeys.explore_generation()
+        try:
+            generation = cache.incr(key)
+        except ValueError:
+            # Counter missing (first use or evicted): seed it, then bump
+            get_explore_generation()
+            generation = cache.incr(key)
+
+        print(f"[CACHE] Invalidated explore cache, generation is now {generation}")
     except Exception as e:
         print(f"[CACHE ERROR] Failed to invalidate explore cache: {e}")
@@ -10,6 +10,10 @@ class CacheKeys:
     def repo_tags(repo_id):
         return f"repo_tags:{repo_id}"
 
+    @staticmethod
+    def repo_card(repo_id):
+        return f"repo_card:{repo_id}"
+
     # ==================== USER-SPECIFIC KEYS ====================
 
     @staticmethod
@@ -27,10 +31,120 @@ class CacheKeys:
     # ==================== EXPLORE KEYS ====================
 
     @staticmethod
-    def explore(query=None, badges=None):
+    def explore_generation():
+        return "explore:generation"
+
+    @staticmethod
+    def explore(query=None, badges=None, generation=0):
+        # Keys embed the current generation; bumping it orphans every older entry
+        query_str = query if query else "None"
+        badges_str = ":".join(sorted(badges)) if badges else ""
+        return f"explore:g{generation}:q:{query_str}:badges:{badges_str}"
+
+    @staticmethod
+    def explore_latest(query=None, badges=None):
+        # Stale-while-revalidate entries outlive generations and carry their own
         query_str = query if query else "None"
         badges_str = ":".join(sorted(badges)) if badges else ""
-        return f"explore:q:{query_str}:badges:{badges_str}"
+        return f"explore:latest:q:{query_str}:badges:{badges_str}"
+
+    @staticmethod
+    def explore_lock(query=None, badges=None):
+        query_str = query if query else "None"
+        badges_str = ":".join(sorted(badges)) if badges else ""
+        return f"explore:lock:q:{query_str}:badges:{badges_str}"
+
+    # ==================== WRITE-BEHIND KEYS ====================
+
+    @staticmethod
+    def pending_pulls():
+        return "pulls:pending"
+
+    @staticmethod
+    def flushing_pulls():
+        return "pulls:flushing"
+
+    @staticmethod
+    def user_star_set(user_id):
+        return f"stars:user:{user_id}"
+
+    @staticmethod
+    def user_star_version(user_id):
+        return f"stars:user:{user_id}:version"
+
+    @staticmethod
+    def pending_stars():
+        return "stars:pending"
+
+    @staticmethod
+    def flushing_stars():
+        return "stars:flushing"
+
+    @staticmethod
+    def pending_star_counts():
+        return "stars:pending_counts"
+
+    @staticmethod
+    def flushing_star_counts():
+        return "stars:flushing_counts"
+
+    @staticmethod
+    def star_rate(user_id, window):
+        return f"stars:rate:{user_id}:{window}"
+
+    # ==================== REGISTRY AUTH KEYS ====================
+
+    @staticmethod
+    def registry_token(identity_hash):
+        return f"registry_token:{identity_hash}"
+
+    @staticmethod
+    def verified_credential(credential_hmac):
+        return f"registry_credential:{credential_hmac}"
+
+    @staticmethod
+    def credential_epoch(user_id):
+        return f"user:{user_id}:credential_epoch"
+
+    @staticmethod
+    def access_token(prefix):
+        return f"access_token:{prefix}"
+
+    @staticmethod
+    def access_token_touched(token_id):
+        return f"access_token:{token_id}:touched"
+
+    @staticmethod
+    def repository_acl_name(full_name):
+        return f"registry_acl:name:{full_name}"
+
+    @staticmethod
+    def repository_acl_entry(repo_id):
+        return f"registry_acl:repo:{repo_id}"
+
+    @staticmethod
+    def repository_acl_channel():
+        return "registry_acl:invalidate"
+
+    # ==================== QUEUE KEYS ====================
+
+    @staticmethod
+    def registry_events_stream():
+        return "registry:events"
+
+    @staticmethod
+    def registry_events_dead_letter():
+        return "registry:events:dead"
+
+    @staticmethod
+    def registry_event_seen(event_id):
+        return f"registry:event:{event_id}"
+
+    # ==================== METRICS KEYS ====================
+
+    @staticmethod
+    def metrics_counters():
+        return "metrics:counters"
 
 
     # ==================== INVALIDATION ====================
@@ -40,6 +154,7 @@ class CacheKeys:
         return [
             CacheKeys.repo_detail_public(repo_id),
             CacheKeys.repo_tags(repo_id),
+            CacheKeys.repo_card(repo_id),
         ]
 
     @staticmethod
@@ -49,7 +164,3 @@ class CacheKeys:
             CacheKeys.user_starred(user_id),
             CacheKeys.user_stats(user_id),
         ]
-
-    @staticmethod
-    def get_explore_invalidation_pattern():
-        return f"*:explore:*"
@@ -0,0 +1,90 @@
+"""
+Coalesced cache invalidation.
+
+Signal receivers mark repositories and users dirty instead of talking to Redis
+themselves. Marks are collected per thread and flushed as one deduplicated,
+pipelined invalidation when the surrounding transaction commits; outside a
+transaction Django runs on_commit callbacks immediately, so the flush does too.
+Only the first mark in a transaction registers the flush callback; later ones
+join it.
+Marks made inside a rolled-back savepoint are flushed with the next commit,
+which only costs a few redundant deletes.
+
+Bulk jobs can wrap their work in batch_invalidation() to get a single flush
+even when every statement autocommits.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .cache import invalidate_cache_batch
+
+_state = threading.local()
+
+
+class _DirtySet:
+    def __init__(self):
+        self.repo_ids = set()
+        self.user_ids = set()
+
+    def __bool__(self):
+        return bool(self.repo_ids or self.user_ids)
+
+
+def _dirty():
+    dirty = getattr(_state, 'dirty', None)
+    if dirty is None:
+        dirty = _state.dirty = _DirtySet()
+    return dirty
+
+
+def _schedule_flush():
+    # Inside batch_invalidation() the block's exit schedules the single flush
+    if getattr(_state, 'batch_depth', 0) == 0:
+        _register_flush()
+
+
+def _register_flush():
+    # Looked up in the connection's pending callbacks rather than kept in a flag,
+    # so a callback dropped with a rolled-back (savepoint) transaction is registered again
+    pending = transaction.get_connection().run_on_commit
+    if not any(callback is flush_invalidations for _, callback, _ in pending):
+        transaction.on_commit(flush_invalidations, robust=True)
+
+
+def mark_repository_dirty(repo_id):
+    _dirty().repo_ids.add(repo_id)
+    _schedule_flush()
+
+
+def mark_repositories_dirty(repo_ids):
+    _dirty().repo_ids.update(repo_ids)
+    _schedule_flush()
+
+
+def mark_user_dirty(user_id):
+    _dirty().user_ids.add(user_id)
+    _schedule_flush()
+
+
+def flush_invalidations():
+    """Invalidate everything marked so far. Later callbacks find nothing left."""
+    dirty, _state.dirty = getattr(_state, 'dirty', None), None
+    if dirty:
+        invalidate_cache_batch(repo_ids=dirty.repo_ids, user_ids=dirty.user_ids)
+
+
+@contextmanager
+def batch_invalidation():
+    """
+    Collect invalidations made inside the block and flush them once on exit,
+    or when the enclosing transaction commits. Blocks may nest.
+    """
+    _state.batch_depth = getattr(_state, 'batch_depth', 0) + 1
+    try:
+        yield
+    finally:
+        _state.batch_depth -= 1
+        if _state.batch_depth == 0 and getattr(_state, 'dirty', None):
+            _register_flush()
@@ -0,0 +1,73 @@
+"""
+Periodic maintenance jobs, run in a loop by ``manage.py run_periodic_jobs``.
+Each job reads its interval (seconds) from settings so deployments can tune it.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PeriodicJob:
+    name: str
+    interval_setting: str
+    func: Callable[[], object]
+
+    @property
+    def interval(self) -> int:
+        return getattr(settings, self.interval_setting)
+
+
+def decay_relevance_scores_job():
+    from .cache import invalidate_explore_cache
+    from .utils import decay_relevance_scores
+
+    updated = decay_relevance_scores(chunk_size=settings.RELEVANCE_DECAY_CHUNK_SIZE)
+    invalidate_explore_cache()
+    return updated
+
+
+def flush_pull_counts_job():
+    from .services.pull_counts import flush_pull_counts
+
+    # Runs even with write-behind off, so deltas left from before a switch drain
+    return flush_pull_counts()
+
+
+def flush_stars_job():
+    from .services.stars import flush_stars
+
+    # Runs even with write-behind off, so operations left from before a switch drain
+    return flush_stars()
+
+
+def reconcile_star_counts_job():
+    from .invalidation import mark_repositories_dirty
+    from .utils import reconcile_star_counts
+
+    drifted = reconcile_star_counts(chunk_size=settings.STAR_RECONCILE_CHUNK_SIZE)
+    mark_repositories_dirty(drifted)
+    return len(drifted)
+
+
+PERIODIC_JOBS = [
+    PeriodicJob('decay_relevance_scores', 'RELEVANCE_DECAY_INTERVAL', decay_relevance_scores_job),
+    PeriodicJob('flush_pull_counts', 'PULL_COUNT_FLUSH_INTERVAL', flush_pull_counts_job),
+    PeriodicJob('flush_stars', 'STAR_FLUSH_INTERVAL', flush_stars_job),
+    PeriodicJob('reconcile_star_counts', 'STAR_RECONCILE_INTERVAL', reconcile_star_counts_job),
+]
+
+
+def run_job(job: PeriodicJob):
+    """Run one job, logging instead of raising so the scheduler loop survives."""
+    try:
+        result = job.func()
+        logger.info(f"Periodic job {job.name} finished: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Periodic job {job.name} failed: {e}", exc_info=True)
+        return None
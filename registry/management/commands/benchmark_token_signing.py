@@ -0,0 +1,60 @@
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from registry.signing import ALGORITHMS, TokenSigner
+
+
+def _generate_key(algorithm):
+    if algorithm == 'RS256':
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == 'ES256':
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = ed25519.Ed25519PrivateKey.generate()
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = "Measure registry token signing throughput (tokens/second on one core) for each algorithm."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0, help="Time to spend on each algorithm")
+        parser.add_argument('--algorithm', choices=ALGORITHMS, action='append', help="Only benchmark these")
+
+    def handle(self, *args, **options):
+        now = int(time.time())
+        # A typical push/pull grant, so payload encoding is part of the cost
+        payload = {
+            'iss': settings.REGISTRY_ISSUER,
+            'sub': 'benchmark',
+            'aud': settings.REGISTRY_SERVICE,
+            'exp': now + settings.REGISTRY_TOKEN_TTL,
+            'nbf': now,
+            'iat': now,
+            'access': [{'type': 'repository', 'name': 'benchmark/app', 'actions': ['pull', 'push']}],
+            'jti': 'benchmark',
+        }
+
+        self.stdout.write(f"Signing for {options['seconds']:.1f}s per algorithm on a single core...")
+        for algorithm in options['algorithm'] or ALGORITHMS:
+            # Fresh keys: the configured one only fits a single algorithm
+            signer = TokenSigner(_generate_key(algorithm), settings.REGISTRY_PUBLIC_CERTIFICATE, algorithm)
+            signed = 0
+            started = time.perf_counter()
+            deadline = started + options['seconds']
+            while time.perf_counter() < deadline:
+                signer.sign(payload)
+                signed += 1
+            elapsed = time.perf_counter() - started
+
+            marker = ' (configured)' if algorithm == settings.REGISTRY_TOKEN_ALGORITHM else ''
+            self.stdout.write(self.style.SUCCESS(
+                f"  ✓ {algorithm:<6} {signed / elapsed:>10,.0f} tokens/s  "
+                f"{elapsed / signed * 1000:.3f} ms/token{marker}"
+            ))
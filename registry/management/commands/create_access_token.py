@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from registry.models import AccessToken
+
+
+class Command(BaseCommand):
+    help = "Issue a registry access token for CI (use it as the password in `docker login`)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="Account the token acts for")
+        parser.add_argument('--name', required=True, help="Label shown in the admin, e.g. the CI system")
+        parser.add_argument(
+            '--repository', action='append', default=[], dest='repositories',
+            help="Limit the token to this repository (\"user/app\" or \"ubuntu\"); repeatable",
+        )
+        parser.add_argument('--push', action='store_true', help="Allow pushes as well as pulls")
+        parser.add_argument('--expires-days', type=int, help="Expire the token after this many days")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+
+        expires_at = None
+        if options['expires_days']:
+            expires_at = timezone.now() + timedelta(days=options['expires_days'])
+
+        token, plaintext = AccessToken.issue(
+            user,
+            options['name'],
+            repositories=options['repositories'],
+            allow_push=options['push'],
+            expires_at=expires_at,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Created access token {token.prefix} for {user.username}"))
+        self.stdout.write("Store it now, it cannot be shown again:")
+        self.stdout.write(plaintext)
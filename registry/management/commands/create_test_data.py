@@ -2,7 +2,9 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
+from registry.invalidation import batch_invalidation, mark_repositories_dirty
 from registry.models import Repository, Star
+from registry.utils import reconcile_star_counts
 import random
 
 User = get_user_model()
@@ -25,6 +27,7 @@ class Command(BaseCommand):
             help='Average number of repositories per user (default: 5)'
         )
 
+    @batch_invalidation()
     def handle(self, *args, **options):
         num_users = options['users']
         repos_per_user = options['repos_per_user']
@@ -252,16 +255,9 @@ class Command(BaseCommand):
 
         # Update star_count for all repositories
         self.stdout.write('\n📊 Updating star_count for repositories...')
-        from django.db.models import Count
-        
-        updated_count = 0
-        for repo in Repository.objects.all():
-            actual_star_count = Star.objects.filter(repository=repo).count()
-            if repo.star_count != actual_star_count:
-                repo.star_count = actual_star_count
-                repo.save(update_fields=['star_count'])
-                updated_count += 1
-        
+        drifted = reconcile_star_counts()
+        mark_repositories_dirty(drifted)
+        updated_count = len(drifted)
         self.stdout.write(self.style.SUCCESS(f'  ✓ Updated star_count for {updated_count} repositories'))
 
         # Summary
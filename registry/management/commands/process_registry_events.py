@@ -0,0 +1,38 @@
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+
+from registry.services.event_queue import ensure_consumer_group, process_batch
+
+
+class Command(BaseCommand):
+    help = "Ingest registry notifications queued by the asynchronous webhook (REGISTRY_WEBHOOK_ASYNC)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--consumer",
+            default=f"{socket.gethostname()}-{os.getpid()}",
+            help="Consumer name within the group (default: hostname-pid).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Envelopes per batch (default: REGISTRY_EVENTS_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the queue and exit (default: block for new events forever).",
+        )
+
+    def handle(self, *args, **options):
+        ensure_consumer_group()
+        consumer = options['consumer']
+        self.stdout.write(f"Consuming registry events as {consumer}...")
+
+        while True:
+            processed = process_batch(consumer, count=options['batch_size'])
+            if options['once'] and not processed:
+                return
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from registry.invalidation import mark_repositories_dirty
+from registry.utils import reconcile_star_counts
+
+
+class Command(BaseCommand):
+    help = "Correct repositories whose star_count no longer matches their Star rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.STAR_RECONCILE_CHUNK_SIZE,
+            help="Repositories per UPDATE (0 for a single statement)",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        scope = f"in chunks of {chunk_size}" if chunk_size else "in one statement"
+        self.stdout.write(f"Reconciling star counts {scope}...")
+        drifted = reconcile_star_counts(chunk_size=chunk_size)
+        mark_repositories_dirty(drifted)
+        self.stdout.write(self.style.SUCCESS(f"  ✓ Corrected {len(drifted)} drifted repositories"))
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from registry.jobs import decay_relevance_scores_job
+
+
+class Command(BaseCommand):
+    help = "Recompute the persisted explore relevance_score for all repositories (re-applies freshness decay)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Refreshing relevance scores in chunks of {settings.RELEVANCE_DECAY_CHUNK_SIZE}...")
+        updated = decay_relevance_scores_job()
+        self.stdout.write(self.style.SUCCESS(f"  ✓ Updated {updated} repositories"))
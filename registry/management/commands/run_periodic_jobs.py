@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from registry.jobs import PERIODIC_JOBS, run_job
+
+
+class Command(BaseCommand):
+    help = "Run registry maintenance jobs (relevance decay, ...) on their configured intervals."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run every job once and exit (default: loop forever).",
+        )
+
+    def handle(self, *args, **options):
+        if options.get('once'):
+            for job in PERIODIC_JOBS:
+                self.stdout.write(f"Running {job.name}...")
+                result = run_job(job)
+                self.stdout.write(self.style.SUCCESS(f"  ✓ {job.name}: {result}"))
+            return
+
+        next_run = {job.name: time.monotonic() for job in PERIODIC_JOBS}
+        self.stdout.write(f"Scheduling {len(PERIODIC_JOBS)} periodic jobs...")
+
+        while True:
+            now = time.monotonic()
+            for job in PERIODIC_JOBS:
+                if next_run[job.name] <= now:
+                    run_job(job)
+                    next_run[job.name] = time.monotonic() + job.interval
+
+            time.sleep(max(0.0, min(next_run.values()) - time.monotonic()))
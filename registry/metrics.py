@@ -0,0 +1,43 @@
+"""
+Lightweight operational counters kept in one Redis hash.
+
+Counters are shared by every process, survive restarts of the web workers and
+cost a single HINCRBY each. Recording never raises: a metrics failure must
+not turn into a failed request.
+"""
+import logging
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .cache_keys import CacheKeys
+
+logger = logging.getLogger(__name__)
+
+
+def _counters_key():
+    return cache.make_key(CacheKeys.metrics_counters())
+
+
+def increment(name, amount=1):
+    try:
+        get_redis_connection("default").hincrby(_counters_key(), name, amount)
+    except Exception as e:
+        logger.warning(f"Failed to record metric {name}: {e}")
+
+
+def increment_many(amounts):
+    """Apply {name: amount} in one pipelined round trip."""
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for name, amount in amounts.items():
+            pipe.hincrby(_counters_key(), name, amount)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record metrics {', '.join(amounts)}: {e}")
+
+
+def get_counters():
+    """Return every counter as {name: int}."""
+    raw = get_redis_connection("default").hgetall(_counters_key())
+    return {name.decode(): int(value) for name, value in raw.items()}
@@ -0,0 +1,15 @@
+from .invalidation import batch_invalidation
+
+
+class CoalescedInvalidationMiddleware:
+    """
+    Collect every cache invalidation a request triggers and flush them once,
+    before the response goes out, so redirects already see fresh data.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with batch_invalidation():
+            return self.get_response(request)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+BACKFILL_SEARCH_VECTOR = """
+UPDATE registry_repository AS r
+SET search_vector =
+    setweight(to_tsvector('simple', coalesce(r.name, '')), 'A')
+    || setweight(to_tsvector('simple', coalesce(u.username, '')), 'B')
+    || setweight(to_tsvector('simple', coalesce(r.description, '')), 'C')
+FROM accounts_user AS u
+WHERE u.id = r.owner_id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0004_repository_star_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='repository',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='repo_search_vector_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTOR, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+BACKFILL_RELEVANCE_SCORE = """
+UPDATE registry_repository AS r
+SET relevance_score =
+    LOG(10, r.pull_count + 1) * 8
+    + LOG(10, r.star_count + 1) * 12
+    + CASE
+        WHEN r.is_official THEN 40.0
+        WHEN u.publisher_status = 'VERIFIED_PUBLISHER' THEN 25.0
+        WHEN u.publisher_status = 'SPONSORED_OSS' THEN 15.0
+        ELSE 0.0
+      END
+    + 15 * EXP(-(EXTRACT(EPOCH FROM (now() - r.updated_at)) / 86400.0) / 60)
+FROM accounts_user AS u
+WHERE u.id = r.owner_id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0005_repository_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='relevance_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='repository',
+            index=models.Index(condition=models.Q(('visibility', 'PUBLIC')), fields=['-relevance_score', '-id'], name='repo_public_relevance_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_RELEVANCE_SCORE, reverse_sql=migrations.RunSQL.noop),
+    ]
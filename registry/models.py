@@ -1,6 +1,10 @@
+import hashlib
+import secrets
 import uuid
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 class Repository(models.Model):
@@ -20,12 +24,24 @@ class Repository(models.Model):
     pull_count = models.IntegerField(default=0)
     star_count = models.IntegerField(default=0, db_index=True)
 
+    # Persisted explore ranking, see registry.utils.relevance_score_expression
+    relevance_score = models.FloatField(default=0.0)
+
+    # Full-text document over name/owner/description, maintained by registry.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         unique_together = [("owner", "name")]
         indexes = [
             models.Index(fields=['visibility', '-pull_count'], name='repo_vis_pull_idx'),
             models.Index(fields=['visibility', '-updated_at'], name='repo_vis_upd_idx'),
             models.Index(fields=['is_official'], name='repo_official_idx'),
+            GinIndex(fields=['search_vector'], name='repo_search_vector_idx'),
+            models.Index(
+                fields=['-relevance_score', '-id'],
+                name='repo_public_relevance_idx',
+                condition=models.Q(visibility='PUBLIC'),
+            ),
         ]
 
     def __str__(self):
@@ -68,3 +84,68 @@ class Star(models.Model):
 
     def __str__(self):
         return f"{self.user.username} ★ {self.repository}"
+
+
+class AccessToken(models.Model):
+    """
+    Revocable registry credential for CI, accepted in place of the account
+    password in Basic auth. Only a SHA-256 digest of the token is stored; the
+    public prefix makes validation a single indexed lookup.
+    """
+    PLAINTEXT_PREFIX = "dkp_"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="access_tokens")
+    name = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=16, unique=True, editable=False)
+    digest = models.CharField(max_length=64, editable=False)
+
+    # Full names ("user/app", "ubuntu") the token may touch; empty means all
+    repositories = models.JSONField(default=list, blank=True)
+    allow_push = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.name} ({self.prefix})"
+
+    @staticmethod
+    def hash_token(plaintext):
+        return hashlib.sha256(plaintext.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name, repositories=(), allow_push=False, expires_at=None):
+        """Create a token; returns (token, plaintext). The plaintext is shown once."""
+        prefix = secrets.token_hex(6)
+        plaintext = f"{cls.PLAINTEXT_PREFIX}{prefix}_{secrets.token_urlsafe(32)}"
+        token = cls.objects.create(
+            user=user,
+            name=name,
+            prefix=prefix,
+            digest=cls.hash_token(plaintext),
+            repositories=sorted(set(repositories)),
+            allow_push=allow_push,
+            expires_at=expires_at,
+        )
+        return token, plaintext
+
+    @classmethod
+    def parse_prefix(cls, plaintext):
+        """The lookup prefix of something shaped like a token, else None."""
+        if not plaintext.startswith(cls.PLAINTEXT_PREFIX):
+            return None
+        prefix, _, secret = plaintext[len(cls.PLAINTEXT_PREFIX):].partition('_')
+        return prefix if prefix and secret else None
+
+
+class PullCountFlush(models.Model):
+    """
+    The last write-behind pull count flush applied to pull_count, recorded in
+    the same transaction. A flush retried after a crash that followed its
+    commit finds its id here and is not applied twice.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    applied_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,113 @@
+"""
+Keyset (cursor) pagination for ranked repository lists.
+
+Pages are addressed by the (score, id) of the row on their edge instead of an
+offset, so every page costs one LIMIT page_size + 1 range scan on the
+(-score, -id) ordering no matter how deep it is.
+"""
+import base64
+import binascii
+import uuid
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+
+
+def encode_cursor(score, row_id):
+    raw = f"{float(score)!r}:{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (score, uuid) or None for a missing or tampered cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split(':', 1)
+        return float(score), uuid.UUID(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+@dataclass
+class KeysetPage:
+    object_list: list = field(default_factory=list)
+    next_cursor: str = None
+    prev_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, score_field, page_size, after=None, before=None):
+    """
+    Fetch one page of queryset ordered by (-score_field, -id).
+
+    after/before are cursors from a previous page; only one is used, after wins.
+    The queryset must already expose score_field (a column or annotation).
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if after_key is None else None
+
+    if after_key is not None:
+        score, row_id = after_key
+        # The leading <= gives the index a range bound, the OR breaks ties on id
+        queryset = queryset.filter(
+            Q(**{f'{score_field}__lte': score}),
+            Q(**{f'{score_field}__lt': score}) | Q(id__lt=row_id),
+        ).order_by(f'-{score_field}', '-id')
+    elif before_key is not None:
+        score, row_id = before_key
+        queryset = queryset.filter(
+            Q(**{f'{score_field}__gte': score}),
+            Q(**{f'{score_field}__gt': score}) | Q(id__gt=row_id),
+        ).order_by(score_field, 'id')
+    else:
+        queryset = queryset.order_by(f'-{score_field}', '-id')
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if before_key is not None:
+        # Walked backwards: restore display order, there is always a next page
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, after_key is not None
+
+    page = KeysetPage(object_list=rows)
+    if rows and has_next:
+        last = rows[-1]
+        page.next_cursor = encode_cursor(getattr(last, score_field), last.id)
+    if rows and has_previous:
+        first = rows[0]
+        page.prev_cursor = encode_cursor(getattr(first, score_field), first.id)
+    return page
+
+
+def capped_count(queryset, limit):
+    """
+    Count at most limit + 1 rows. Returns (count, is_capped); when capped the
+    caller should say "more than limit" rather than pay for an exact total.
+    """
+    count = queryset.order_by()[:limit + 1].count()
+    if count > limit:
+        return limit, True
+    return count, False
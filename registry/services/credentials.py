@@ -0,0 +1,162 @@
+"""
+Verified-credential cache for registry Basic auth.
+
+The Docker CLI re-sends the same username and password with every token
+request, and each check runs the full password hash. Successful checks are
+remembered for REGISTRY_CREDENTIAL_CACHE_TTL seconds under a keyed HMAC of
+username and password; the entry holds the user's id and username, never the
+password. Each entry records the user's credential epoch as it was before the
+password was checked. The epoch is bumped whenever the password, username or
+active flag changes or the user is deleted, so older entries stop matching at
+once, including one whose check raced with the change.
+
+Access tokens (registry.models.AccessToken) skip the password hasher
+altogether: the token's public prefix finds its row with one indexed lookup,
+cached for REGISTRY_ACCESS_TOKEN_CACHE_TTL, and the SHA-256 digest is compared
+in constant time. last_used_at is written at most once per
+REGISTRY_ACCESS_TOKEN_TOUCH_INTERVAL. A secret that only looks like a token
+and matches none is checked as a password, so such passwords keep working.
+"""
+import hmac
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from registry.cache_keys import CacheKeys
+from registry.models import AccessToken
+
+logger = logging.getLogger(__name__)
+
+KEY_SALT = 'registry.services.credentials'
+
+
+@dataclass(frozen=True)
+class RegistryPrincipal:
+    """The authenticated user as the registry token endpoint needs it."""
+    id: uuid.UUID
+    username: str
+    # Access-token limits; None means every repository the user can reach
+    repositories: frozenset = None
+    allow_push: bool = True
+    is_authenticated = True
+
+    def permits(self, name, action):
+        if action == 'push' and not self.allow_push:
+            return False
+        return self.repositories is None or name in self.repositories
+
+
+def _credential_key(username, password):
+    digest = salted_hmac(KEY_SALT, f'{username}\0{password}', algorithm='sha256').hexdigest()
+    return CacheKeys.verified_credential(digest)
+
+
+def _current_epoch(user_id, seed=False):
+    key = CacheKeys.credential_epoch(user_id)
+    epoch = cache.get(key)
+    if epoch is None and seed:
+        # Clock seed: an evicted epoch can never come back at an old value
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        epoch = cache.get(key)
+    return epoch
+
+
+def bump_credential_epoch(user_id):
+    """Invalidate every cached credential check for this user."""
+    key = CacheKeys.credential_epoch(user_id)
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            _current_epoch(user_id, seed=True)
+            cache.incr(key)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cached credentials for user {user_id}: {e}")
+
+
+def _touch_access_token(token_id):
+    # Coalesced: only the first use per interval reaches the database
+    if cache.add(CacheKeys.access_token_touched(token_id), 1, settings.REGISTRY_ACCESS_TOKEN_TOUCH_INTERVAL):
+        AccessToken.objects.filter(pk=token_id).update(last_used_at=timezone.now())
+
+
+def _authenticate_access_token(username, prefix, plaintext):
+    token_key = CacheKeys.access_token(prefix)
+    entry = cache.get(token_key)
+    if entry is None or entry['epoch'] != _current_epoch(entry['user_id']):
+        row = (
+            AccessToken.objects
+            .filter(prefix=prefix, revoked_at__isnull=True, user__is_active=True)
+            .values('id', 'digest', 'user_id', 'user__username', 'repositories', 'allow_push', 'expires_at')
+            .first()
+        )
+        if row is None:
+            return None
+        entry = {
+            'token_id': row['id'],
+            'digest': row['digest'],
+            'user_id': row['user_id'],
+            'username': row['user__username'],
+            'repositories': row['repositories'],
+            'allow_push': row['allow_push'],
+            'expires_at': row['expires_at'],
+            'epoch': _current_epoch(row['user_id'], seed=True),
+        }
+        cache.set(token_key, entry, settings.REGISTRY_ACCESS_TOKEN_CACHE_TTL)
+
+    if not hmac.compare_digest(entry['digest'], AccessToken.hash_token(plaintext)):
+        return None
+    if entry['username'] != username:
+        return None
+    if entry['expires_at'] is not None and entry['expires_at'] <= timezone.now():
+        return None
+
+    _touch_access_token(entry['token_id'])
+    return RegistryPrincipal(
+        id=entry['user_id'],
+        username=entry['username'],
+        repositories=frozenset(entry['repositories']) if entry['repositories'] else None,
+        allow_push=entry['allow_push'],
+    )
+
+
+def authenticate_registry_user(username, password):
+    """
+    Return a RegistryPrincipal for valid credentials, or None. Failed checks
+    are never cached, so guessing still pays the full hash every time.
+    """
+    token_prefix = AccessToken.parse_prefix(password)
+    if token_prefix is not None:
+        principal = _authenticate_access_token(username, token_prefix, password)
+        if principal is not None:
+            return principal
+
+    credential_key = _credential_key(username, password)
+    entry = cache.get(credential_key)
+    if entry is not None and entry['epoch'] == _current_epoch(entry['user_id']):
+        return RegistryPrincipal(id=entry['user_id'], username=entry['username'])
+
+    # Read the epoch before the check: a change committed while the hash runs
+    # bumps it past the value the entry records
+    User = get_user_model()
+    user_id = User._default_manager.filter(**{User.USERNAME_FIELD: username}).values_list('pk', flat=True).first()
+    epoch = _current_epoch(user_id, seed=True) if user_id is not None else None
+
+    user = authenticate(username=username, password=password)
+    if user is None:
+        return None
+
+    if user.pk == user_id:
+        cache.set(
+            credential_key,
+            {'user_id': user.pk, 'username': user.username, 'epoch': epoch},
+            settings.REGISTRY_CREDENTIAL_CACHE_TTL,
+        )
+    return RegistryPrincipal(id=user.pk, username=user.username)
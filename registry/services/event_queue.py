@@ -0,0 +1,172 @@
+"""
+Durable queue for registry notifications.
+
+With REGISTRY_WEBHOOK_ASYNC on, the webhook only appends the raw envelope to a
+Redis Stream and answers 202, so a slow database never backs up the
+registry's notification queue. ``manage.py process_registry_events`` runs
+consumer-group workers that read envelopes in batches, ingest them, and ack
+them. A message a worker died on is reclaimed by another worker once it has
+been idle for REGISTRY_EVENTS_CLAIM_IDLE_MS. Envelopes that cannot be parsed,
+or that keep failing after REGISTRY_EVENTS_MAX_DELIVERIES attempts, are moved
+to a dead-letter stream with the error attached.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from registry import metrics
+from registry.cache_keys import CacheKeys
+from registry.invalidation import batch_invalidation
+from registry.services.webhook import ingest_events, parse_events
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_GROUP = 'registry-webhook'
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _stream_key():
+    return cache.make_key(CacheKeys.registry_events_stream())
+
+
+def _dead_letter_key():
+    return cache.make_key(CacheKeys.registry_events_dead_letter())
+
+
+def enqueue_envelope(body):
+    """Append a raw notification envelope (bytes) to the stream."""
+    _redis().xadd(
+        _stream_key(),
+        {'body': body},
+        maxlen=settings.REGISTRY_EVENTS_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+def ensure_consumer_group():
+    try:
+        _redis().xgroup_create(_stream_key(), CONSUMER_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _dead_letter(redis, message_id, body, error):
+    redis.xadd(
+        _dead_letter_key(),
+        {'body': body, 'error': str(error)[:500], 'source_id': message_id},
+        maxlen=settings.REGISTRY_EVENTS_STREAM_MAXLEN,
+        approximate=True,
+    )
+    redis.xack(_stream_key(), CONSUMER_GROUP, message_id)
+    metrics.increment('webhook.dead_lettered')
+    logger.error(f"Moved registry event {message_id!r} to the dead-letter stream: {error}")
+
+
+def _delivery_count(redis, message_id):
+    pending = redis.xpending_range(_stream_key(), CONSUMER_GROUP, min=message_id, max=message_id, count=1)
+    return pending[0]['times_delivered'] if pending else 0
+
+
+def _read_batch(redis, consumer, count, block_ms):
+    # Messages abandoned by a crashed worker come first, then new ones
+    claimed = redis.xautoclaim(
+        _stream_key(), CONSUMER_GROUP, consumer,
+        min_idle_time=settings.REGISTRY_EVENTS_CLAIM_IDLE_MS, start_id='0-0', count=count,
+    )[1]
+    messages = [(message_id, fields) for message_id, fields in claimed if fields]
+    if len(messages) < count:
+        response = redis.xreadgroup(
+            CONSUMER_GROUP, consumer, {_stream_key(): '>'},
+            count=count - len(messages), block=None if messages else block_ms,
+        )
+        for _, stream_messages in response or []:
+            messages.extend(stream_messages)
+    return messages
+
+
+def process_batch(consumer, count=None, block_ms=None):
+    """
+    Read up to count envelopes and ingest them together. Returns the number of
+    envelopes acked (including dead-lettered ones).
+    """
+    redis = _redis()
+    count = count or settings.REGISTRY_EVENTS_BATCH_SIZE
+    messages = _read_batch(redis, consumer, count, block_ms or settings.REGISTRY_EVENTS_BLOCK_MS)
+    if not messages:
+        return 0
+
+    parsed = []
+    for message_id, fields in messages:
+        body = fields[b'body']
+        try:
+            parsed.append((message_id, body, parse_events(json.loads(body))))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # Malformed envelopes will never succeed, so skip the retries
+            _dead_letter(redis, message_id, body, e)
+
+    if not parsed:
+        return len(messages)
+    # Counted once per delivery here, not again when a failed batch is retried
+    metrics.increment('webhook.events_received', sum(len(events) for _, _, events in parsed))
+
+    with batch_invalidation():
+        try:
+            ingest_events([event for _, _, events in parsed for event in events])
+            done = [message_id for message_id, _, _ in parsed]
+        except Exception as e:
+            # Retry one envelope at a time to isolate the one that failed
+            logger.warning(f"Batch of {len(parsed)} registry envelopes failed, retrying individually: {e}")
+            done = []
+            for message_id, body, events in parsed:
+                try:
+                    ingest_events(events)
+                    done.append(message_id)
+                except Exception as envelope_error:
+                    if _delivery_count(redis, message_id) >= settings.REGISTRY_EVENTS_MAX_DELIVERIES:
+                        _dead_letter(redis, message_id, body, envelope_error)
+                    else:
+                        logger.warning(f"Registry event {message_id!r} failed, will retry: {envelope_error}")
+
+    if done:
+        redis.xack(_stream_key(), CONSUMER_GROUP, *done)
+        done_ids = set(done)
+        metrics.increment('webhook.envelopes_processed', len(done))
+        metrics.increment(
+            'webhook.events_processed',
+            sum(len(events) for message_id, _, events in parsed if message_id in done_ids),
+        )
+    return len(messages) - len(parsed) + len(done)
+
+
+def queue_stats():
+    """Queue depth, consumer lag and throughput counters for monitoring."""
+    redis = _redis()
+    stats = {
+        'stream_length': redis.xlen(_stream_key()),
+        'dead_letter_length': redis.xlen(_dead_letter_key()),
+        'pending': 0,
+        'lag': None,
+        'consumers': 0,
+    }
+    try:
+        groups = redis.xinfo_groups(_stream_key())
+    except ResponseError:
+        groups = []  # Stream not created yet
+    for group in groups:
+        if group['name'] in (CONSUMER_GROUP, CONSUMER_GROUP.encode()):
+            stats['pending'] = group['pending']
+            stats['consumers'] = group['consumers']
+            # Entries not yet delivered to the group (Redis 7+)
+            stats['lag'] = group.get('lag')
+
+    counters = metrics.get_counters()
+    stats['counters'] = {name: value for name, value in counters.items() if name.startswith('webhook.')}
+    return stats
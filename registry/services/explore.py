@@ -0,0 +1,254 @@
+"""
+Compact explore cache entries.
+
+An explore entry is the ranked list of (repository id, rank score) pairs for
+one query, packed as fixed-width binary records and capped at
+EXPLORE_CACHE_MAX_RESULTS. Only the repositories on the requested page are
+hydrated, from per-repository card caches with one id__in query for misses.
+
+With EXPLORE_STALE_WHILE_REVALIDATE on, an outdated entry is recomputed by a
+single request holding a short lock while every other request keeps getting
+the stale ranking, so an invalidation never turns into a dogpile. With no
+entry at all, the others wait up to EXPLORE_COLD_WAIT for the lock holder's
+result before running the query themselves. The lock holds a random token
+and is only released by its holder, so a recompute that outlived the lock
+cannot release the next one.
+"""
+import struct
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from registry import metrics
+from registry.cache import explore_cache_key, get_explore_generation
+from registry.cache_keys import CacheKeys
+from registry.models import Repository
+from registry.utils import calculate_relevance_score, get_repository_badges, search_public_repositories
+
+# 16-byte UUID + 8-byte double per ranked repository
+RANKED_ENTRY = struct.Struct('>16sd')
+
+# Seconds between checks for the lock holder's entry while waiting on a cold key
+COLD_POLL_INTERVAL = 0.05
+
+# KEYS: lock. ARGV: token. Deletes the lock only if this worker still holds it.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_lock = None
+
+
+def pack_ranking(pairs):
+    return b''.join(RANKED_ENTRY.pack(repo_id.bytes, float(score)) for repo_id, score in pairs)
+
+
+class RankedIds:
+    """
+    Read-only sequence over a packed ranking. Slicing unpacks only the requested
+    records, so paginating never decodes the whole result set.
+    """
+
+    def __init__(self, packed):
+        self.packed = packed
+
+    def __len__(self):
+        return len(self.packed) // RANKED_ENTRY.size
+
+    def _unpack(self, index):
+        raw_id, score = RANKED_ENTRY.unpack_from(self.packed, index * RANKED_ENTRY.size)
+        return uuid.UUID(bytes=raw_id), score
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._unpack(index) for index in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('ranking index out of range')
+        return self._unpack(item)
+
+
+def build_explore_entry(query, badge_filters):
+    """Run the ranking query once and return the compact cache entry."""
+    limit = settings.EXPLORE_CACHE_MAX_RESULTS
+    repositories = calculate_relevance_score(
+        search_public_repositories(query=query, badge_filters=badge_filters)
+    )
+
+    # One extra row tells whether the ranking was truncated, without a COUNT
+    pairs = list(repositories.values_list('id', 'rank_score')[:limit + 1])
+    capped = len(pairs) > limit
+    pairs = pairs[:limit]
+
+    return {
+        'ranking': pack_ranking(pairs),
+        'total': len(pairs),
+        'capped': capped,
+    }
+
+
+def get_explore_entry(query, badge_filters):
+    """Return the cached explore entry for a query, building it on a miss."""
+    if settings.EXPLORE_STALE_WHILE_REVALIDATE:
+        return _get_explore_entry_swr(query, badge_filters)
+
+    cache_key = explore_cache_key(query, badge_filters)
+    entry = cache.get(cache_key)
+
+    if entry is None:
+        print(f"[CACHE MISS] Exploring: query='{query}', badges={badge_filters}")
+        entry = build_explore_entry(query, badge_filters)
+        cache.set(cache_key, entry, settings.CACHE_TIMEOUT_EXPLORE)
+    else:
+        print(f"[CACHE HIT] Exploring: query='{query}', badges={badge_filters}")
+    return entry
+
+
+def _get_explore_entry_swr(query, badge_filters):
+    """
+    Entries live under a generation-free key and record the generation and
+    soft expiry they were built for; the cache TTL is the hard expiry. An entry
+    that is soft-expired or from an older generation is rebuilt by whoever wins
+    the lock, and served stale to everyone else meanwhile.
+    """
+    entry_key = CacheKeys.explore_latest(query, badge_filters)
+    generation_key = CacheKeys.explore_generation()
+    cached = cache.get_many([entry_key, generation_key])
+    generation = cached.get(generation_key) or get_explore_generation()
+    entry = cached.get(entry_key)
+
+    if entry is not None and entry['generation'] == generation and entry['soft_expires_at'] > time.time():
+        print(f"[CACHE HIT] Exploring: query='{query}', badges={badge_filters}")
+        return entry
+
+    lock_key = cache.make_key(CacheKeys.explore_lock(query, badge_filters))
+    token = uuid.uuid4().hex
+    redis = get_redis_connection("default")
+    if redis.set(lock_key, token, nx=True, ex=settings.EXPLORE_RECOMPUTE_LOCK_TIMEOUT):
+        try:
+            print(f"[CACHE MISS] Exploring: query='{query}', badges={badge_filters}")
+            # Stamped with the generation read before the query ran, so a change
+            # committed mid-recompute still leaves this entry outdated
+            entry = build_explore_entry(query, badge_filters)
+            entry['generation'] = generation
+            entry['soft_expires_at'] = time.time() + settings.CACHE_TIMEOUT_EXPLORE
+            cache.set(entry_key, entry, settings.CACHE_TIMEOUT_EXPLORE_STALE)
+        finally:
+            _release(redis, lock_key, token)
+        return entry
+
+    metrics.increment('explore.lock_contention')
+    if entry is None:
+        # Cold key with a recompute already running: nothing stale to hand out
+        entry = _wait_for_entry(entry_key)
+        if entry is not None:
+            print(f"[CACHE HIT] Exploring: query='{query}', badges={badge_filters}")
+            return entry
+        print(f"[CACHE MISS] Exploring: query='{query}', badges={badge_filters}")
+        return build_explore_entry(query, badge_filters)
+
+    metrics.increment('explore.stale_served')
+    print(f"[CACHE STALE] Exploring: query='{query}', badges={badge_filters}")
+    return entry
+
+
+def _release(redis, lock_key, token):
+    global _release_lock
+    if _release_lock is None:
+        _release_lock = redis.register_script(RELEASE_LOCK_SCRIPT)
+    _release_lock(keys=[lock_key], args=[token], client=redis)
+
+
+def _wait_for_entry(entry_key):
+    """The entry the lock holder is building, or None if it is not there in time."""
+    deadline = time.monotonic() + settings.EXPLORE_COLD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(COLD_POLL_INTERVAL)
+        entry = cache.get(entry_key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def repository_card(repository):
+    """Everything an explore/listing card renders, as plain picklable values."""
+    return {
+        'id': repository.id,
+        'name': repository.name,
+        'description': repository.description,
+        'visibility': repository.visibility,
+        'is_official': repository.is_official,
+        'pull_count': repository.pull_count,
+        'star_count': repository.star_count,
+        'relevance_score': repository.relevance_score,
+        'owner_id': repository.owner_id,
+        'owner_username': repository.owner.username,
+        'owner_publisher_status': repository.owner.publisher_status,
+        'badges': get_repository_badges(repository),
+    }
+
+
+def repository_from_card(card):
+    """Rebuild a display-only Repository (with its owner) from a cached card."""
+    owner = get_user_model()(
+        id=card['owner_id'],
+        username=card['owner_username'],
+        publisher_status=card['owner_publisher_status'],
+    )
+    repository = Repository(
+        id=card['id'],
+        owner=owner,
+        name=card['name'],
+        description=card['description'],
+        visibility=card['visibility'],
+        is_official=card['is_official'],
+        pull_count=card['pull_count'],
+        star_count=card['star_count'],
+        relevance_score=card['relevance_score'],
+    )
+    for instance in (owner, repository):
+        instance._state.adding = False
+        instance._state.db = 'default'
+    repository.badges = card['badges']
+    return repository
+
+
+def hydrate_repositories(ranked_page):
+    """
+    Turn a page of (repo id, score) pairs into Repository objects in rank order:
+    one get_many for the card caches, one id__in query for whatever missed.
+    Repositories deleted since the ranking was cached are skipped.
+    """
+    keys = {repo_id: CacheKeys.repo_card(repo_id) for repo_id, _ in ranked_page}
+    cached = cache.get_many(list(keys.values()))
+    cards = {repo_id: cached[key] for repo_id, key in keys.items() if key in cached}
+
+    missing = [repo_id for repo_id in keys if repo_id not in cards]
+    if missing:
+        fresh = {
+            repo.id: repository_card(repo)
+            for repo in Repository.objects.filter(id__in=missing).select_related('owner')
+        }
+        cache.set_many(
+            {keys[repo_id]: card for repo_id, card in fresh.items()},
+            settings.CACHE_TIMEOUT_REPO_CARD,
+        )
+        cards.update(fresh)
+
+    repositories = []
+    for repo_id, score in ranked_page:
+        card = cards.get(repo_id)
+        if card is None:
+            continue
+        repository = repository_from_card(card)
+        repository.rank_score = score
+        repositories.append(repository)
+    return repositories
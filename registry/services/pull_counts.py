@@ -0,0 +1,137 @@
+"""
+Write-behind pull counters.
+
+With PULL_COUNT_WRITE_BEHIND on, pull events only HINCRBY a per-repository
+delta in a Redis hash. The flush_pull_counts periodic job renames that hash
+out of the way (so new pulls keep landing in a fresh one), applies every delta
+in a single UPDATE ... FROM (VALUES ...) and then drops the renamed hash. A
+flush whose transaction fails leaves the renamed hash behind and the next run
+retries it before taking new deltas.
+
+Each renamed hash carries a flush id, and the transaction that applies it
+records the id as a PullCountFlush row. A run that finds its id already
+recorded, because the last one crashed between the commit and dropping the
+hash, only drops it. The pending overlay ignores such a hash as well.
+"""
+import logging
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from registry.cache_keys import CacheKeys
+from registry.invalidation import mark_repositories_dirty
+from registry.models import PullCountFlush, Repository
+from registry.utils import refresh_relevance_scores
+
+logger = logging.getLogger(__name__)
+
+# Field of the flushing hash holding its flush id, next to the repository ids
+FLUSH_ID_FIELD = 'flush_id'
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def record_pulls(pulls):
+    """Add {repo_id: count} to the pending deltas in one pipelined round trip."""
+    pipe = _redis().pipeline(transaction=False)
+    pending_key = cache.make_key(CacheKeys.pending_pulls())
+    for repo_id, count in pulls.items():
+        pipe.hincrby(pending_key, str(repo_id), count)
+    pipe.execute()
+
+
+def apply_pull_deltas(deltas):
+    """Add {repo_id: delta} to pull_count with one UPDATE, leaving updated_at alone."""
+    if not deltas:
+        return 0
+    table = connection.ops.quote_name(Repository._meta.db_table)
+    values = ', '.join(['(%s::uuid, %s::integer)'] * len(deltas))
+    params = [value for repo_id, delta in deltas.items() for value in (str(repo_id), delta)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS r SET pull_count = r.pull_count + v.delta '
+            f'FROM (VALUES {values}) AS v(id, delta) WHERE r.id = v.id',
+            params,
+        )
+        updated = cursor.rowcount
+    refresh_relevance_scores(Repository.objects.filter(id__in=list(deltas)))
+    return updated
+
+
+def flush_pull_counts():
+    """Move pending pull deltas into Postgres. Returns the number of rows updated."""
+    redis = _redis()
+    pending_key = cache.make_key(CacheKeys.pending_pulls())
+    flushing_key = cache.make_key(CacheKeys.flushing_pulls())
+
+    if not redis.exists(flushing_key):
+        try:
+            redis.rename(pending_key, flushing_key)
+        except ResponseError:
+            return 0  # Nothing pending
+
+    # Only set once per hash, so a retried flush keeps the id of the first attempt
+    redis.hsetnx(flushing_key, FLUSH_ID_FIELD, uuid.uuid4().hex)
+    fields = redis.hgetall(flushing_key)
+    flush_id = uuid.UUID(fields.pop(FLUSH_ID_FIELD.encode()).decode())
+    deltas = {
+        uuid.UUID(repo_id.decode()): int(delta)
+        for repo_id, delta in fields.items()
+        if int(delta)
+    }
+    with transaction.atomic():
+        if PullCountFlush.objects.filter(id=flush_id).exists():
+            logger.info(f"Pull count flush {flush_id} was already applied")
+            updated = 0
+        else:
+            updated = apply_pull_deltas(deltas)
+            mark_repositories_dirty(deltas)
+            # Only the latest flush can be retried, so one row is enough
+            PullCountFlush.objects.all().delete()
+            PullCountFlush.objects.create(id=flush_id)
+    redis.delete(flushing_key)
+
+    if updated:
+        logger.info(f"Flushed {sum(deltas.values())} pulls into {updated} repositories")
+    return updated
+
+
+def pending_pull_counts(repo_ids):
+    """Unflushed pull deltas for repo_ids, including a flush in progress."""
+    repo_ids = [str(repo_id) for repo_id in repo_ids]
+    if not repo_ids:
+        return {}
+    flushing_key = cache.make_key(CacheKeys.flushing_pulls())
+    pipe = _redis().pipeline(transaction=False)
+    pipe.hmget(cache.make_key(CacheKeys.pending_pulls()), repo_ids)
+    pipe.hmget(flushing_key, repo_ids)
+    pipe.hget(flushing_key, FLUSH_ID_FIELD)
+    pending, flushing, flush_id = pipe.execute()
+    if flush_id is not None and any(flushing):
+        # Already in pull_count if that flush committed but did not clean up
+        if PullCountFlush.objects.filter(id=uuid.UUID(flush_id.decode())).exists():
+            flushing = [None] * len(repo_ids)
+
+    deltas = {}
+    for repo_id, *values in zip(repo_ids, pending, flushing):
+        delta = sum(int(value) for value in values if value is not None)
+        if delta:
+            deltas[uuid.UUID(repo_id)] = delta
+    return deltas
+
+
+def overlay_pending_pulls(repositories):
+    """Add unflushed pulls to each repository's pull_count in place (display only)."""
+    repositories = list(repositories)
+    try:
+        deltas = pending_pull_counts(repository.id for repository in repositories)
+    except Exception as e:
+        logger.warning(f"Could not read pending pull counts: {e}")
+        return
+    for repository in repositories:
+        repository.pull_count += deltas.get(repository.id, 0)
@@ -0,0 +1,76 @@
+"""
+Reuse of signed registry tokens.
+
+Signing a registry token is an RSA operation, and CI fleets ask for the same
+token (same subject, service and granted access) over and over. Issued tokens
+are cached under that identity and handed out again until
+REGISTRY_TOKEN_REUSE_FRACTION of their lifetime has passed, so a reused token
+always leaves the client a useful remainder of its validity.
+
+Each token request records its counters in one round trip: a hit when the
+cached token is reused, otherwise the miss together with the signing.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from registry import metrics
+from registry.cache_keys import CacheKeys
+
+
+def normalize_access(access_list):
+    """Canonical form of a granted access list: sorted entries, sorted unique actions."""
+    return sorted(
+        (entry['type'], entry['name'], tuple(sorted(set(entry['actions']))))
+        for entry in access_list
+    )
+
+
+def _token_key(subject, service, access_list):
+    identity = json.dumps([subject, service, normalize_access(access_list)])
+    return CacheKeys.registry_token(hashlib.sha256(identity.encode()).hexdigest())
+
+
+def get_cached_token(subject, service, access_list):
+    """Return a reusable {'token', 'issued_at', 'expires_at'} entry, or None."""
+    entry = cache.get(_token_key(subject, service, access_list))
+    if entry:
+        # A miss is counted by record_signing, along with the token it leads to
+        metrics.increment('registry_token.cache_hit')
+    return entry
+
+
+def cache_token(subject, service, access_list, token, issued_at, expires_at):
+    reuse_for = int((expires_at - issued_at) * settings.REGISTRY_TOKEN_REUSE_FRACTION)
+    entry = {'token': token, 'issued_at': issued_at, 'expires_at': expires_at}
+    if reuse_for > 0:
+        cache.set(_token_key(subject, service, access_list), entry, reuse_for)
+    return entry
+
+
+def record_signing(started):
+    """Account one cache miss and its signing, which began at time.perf_counter() == started."""
+    elapsed_us = int((time.perf_counter() - started) * 1_000_000)
+    metrics.increment_many({
+        'registry_token.cache_miss': 1,
+        'registry_token.signed': 1,
+        'registry_token.sign_us_total': elapsed_us,
+    })
+
+
+def token_stats():
+    counters = metrics.get_counters()
+    hits = counters.get('registry_token.cache_hit', 0)
+    misses = counters.get('registry_token.cache_miss', 0)
+    signed = counters.get('registry_token.signed', 0)
+    sign_us_total = counters.get('registry_token.sign_us_total', 0)
+    return {
+        'cache_hits': hits,
+        'cache_misses': misses,
+        'cache_hit_rate': hits / (hits + misses) if hits + misses else None,
+        'tokens_signed': signed,
+        'average_sign_ms': sign_us_total / signed / 1000 if signed else None,
+    }
@@ -1,8 +1,158 @@
+"""
+Starring.
+
+By default a star or unstar writes the Star row and bumps star_count in one
+transaction. With STARS_WRITE_BEHIND on, a single Lua script instead flips
+the repository in the user's starred set in Redis and, only if that changed
+anything, records the operation (last one per user and repository wins) and
+adjusts the repository's pending star delta. The flush_stars periodic job
+persists the recorded operations in bulk, recounts star_count for the
+touched repositories, and invalidates their caches once. Until then pages
+show star_count plus the pending delta.
+
+Either way each user's starred repository ids live in a Redis set, loaded
+from Postgres (and any unflushed operations) the first time it is needed, so
+one SMISMEMBER answers "which of these repositories did I star" for a whole
+listing. Without write-behind, Star row changes (the database path, admin,
+cascades) are applied to loaded sets once they commit, and bump a per-user
+version that a load in progress checks before storing what it read; sets
+expire after STARRED_SET_TTL regardless. If Redis is unavailable, starring falls back to
+the database path and lookups to one query per page; the flush recounts
+star_count, so counts converge.
+
+All of this lives on the "stars" cache alias. Unflushed operations exist
+nowhere else, so that Redis must never evict keys (maxmemory-policy
+noeviction); docker-compose runs it separately from the LRU cache.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
 from django.core.exceptions import PermissionDenied
 from django.db import IntegrityError, transaction
-from django.db.models import F
+from django.db.models import F, Q
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
 
+from registry.cache_keys import CacheKeys
+from registry.invalidation import mark_repositories_dirty, mark_user_dirty
 from registry.models import Repository, Star
+from registry.utils import refresh_relevance_scores, refresh_star_counts
+
+logger = logging.getLogger(__name__)
+
+# Cache alias holding starred sets and unflushed operations
+STARS_CACHE = 'stars'
+
+# Member that keeps a loaded but empty starred set in existence
+EMPTY_SET_MARKER = ''
+
+# KEYS: user's starred set, pending operations, pending star deltas
+# ARGV: repository id, '1' to star or '0' to unstar, user id
+# Returns 1 if the star state changed, 0 if not, -1 if the set is not loaded
+TOGGLE_STAR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local changed
+if ARGV[2] == '1' then
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 then
+    redis.call('HSET', KEYS[2], ARGV[3] .. ':' .. ARGV[1], ARGV[2])
+    redis.call('HINCRBY', KEYS[3], ARGV[1], ARGV[2] == '1' and 1 or -1)
+end
+return changed
+"""
+
+# KEYS: user's starred set, user's star version. ARGV: version read before the
+# rows, TTL, members. Loses to a concurrent load, and to any committed change
+# since the version was read.
+LOAD_STARRED_SET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+for i = 3, #ARGV, 1000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: user's starred set, user's star version. ARGV: repository id, '1' to
+# star or '0' to unstar, TTL. Applies a committed database change to a loaded
+# set; unloaded sets load it anyway, unless a load already read the rows.
+SYNC_STARRED_SET_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[2] == '1' then
+    return redis.call('SADD', KEYS[1], ARGV[1])
+end
+return redis.call('SREM', KEYS[1], ARGV[1])
+"""
+
+# KEYS: user's star version, flushing operations, pending operations. ARGV:
+# field pattern of one user. Returns the version, then the user's operations
+# oldest first, read in one step so a flush starting meanwhile cannot move
+# them out of sight.
+USER_OPERATIONS_SCRIPT = """
+local operations = {redis.call('GET', KEYS[1]) or ''}
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    local cursor = '0'
+    repeat
+        local reply = redis.call('HSCAN', key, cursor, 'MATCH', ARGV[1], 'COUNT', 1000)
+        cursor = reply[1]
+        for j = 1, #reply[2] do
+            operations[#operations + 1] = reply[2][j]
+        end
+    until cursor == '0'
+end
+return operations
+"""
+
+# KEYS: pending operations, pending deltas, flushing operations, flushing deltas.
+# A flush left behind by a failed run is retried before taking new work.
+BEGIN_FLUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 or redis.call('EXISTS', KEYS[4]) == 1 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[3])
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[4])
+end
+return 1
+"""
+
+_scripts = {}
+
+
+def _redis():
+    return get_redis_connection(STARS_CACHE)
+
+
+def _script(source):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = _redis().register_script(source)
+    return script
+
+
+def _keys(*names):
+    return [caches[STARS_CACHE].make_key(name) for name in names]
 
 
 def can_star(user, repo: Repository) -> None:
@@ -17,16 +167,38 @@ def can_star(user, repo: Repository) -> None:
         raise PermissionDenied("You cannot star your own repository.")
 
 
-@transaction.atomic
 def star_repository(user, repo: Repository) -> bool:
     """
     Returns True if created, False if already existed.
     """
     can_star(user, repo)
+    if settings.STARS_WRITE_BEHIND:
+        changed = _toggle_star(user.pk, repo.id, star=True)
+        if changed is not None:
+            return bool(changed)
+    return _star_in_database(user, repo)
+
+
+def unstar_repository(user, repo: Repository) -> int:
+    """
+    Returns number of deleted rows (0 or 1).
+    """
+    if not user.is_authenticated:
+        raise PermissionDenied("Authentication required.")
+    if settings.STARS_WRITE_BEHIND:
+        changed = _toggle_star(user.pk, repo.id, star=False)
+        if changed is not None:
+            return changed
+    return _unstar_in_database(user, repo)
+
+
+@transaction.atomic
+def _star_in_database(user, repo):
     try:
         Star.objects.create(user=user, repository=repo)
         # Atomically increment star_count
         Repository.objects.filter(id=repo.id).update(star_count=F('star_count') + 1)
+        refresh_relevance_scores(Repository.objects.filter(id=repo.id))
         return True
     except IntegrityError:
         # unique constraint hit (already starred)
@@ -34,15 +206,218 @@ def star_repository(user, repo: Repository) -> bool:
 
 
 @transaction.atomic
-def unstar_repository(user, repo: Repository) -> int:
-    """
-    Returns number of deleted rows (0 or 1).
-    """
-    if not user.is_authenticated:
-        raise PermissionDenied("Authentication required.")
-
+def _unstar_in_database(user, repo):
     deleted_count = Star.objects.filter(user=user, repository=repo).delete()[0]
     if deleted_count > 0:
         # Atomically decrement star_count
         Repository.objects.filter(id=repo.id).update(star_count=F('star_count') - 1)
+        refresh_relevance_scores(Repository.objects.filter(id=repo.id))
     return deleted_count
+
+
+def _toggle_star(user_id, repo_id, star):
+    """Flip the star in Redis. Returns 1/0 for changed/unchanged, None to use the database."""
+    keys = _keys(CacheKeys.user_star_set(user_id), CacheKeys.pending_stars(), CacheKeys.pending_star_counts())
+    args = [str(repo_id), '1' if star else '0', str(user_id)]
+    try:
+        changed = _script(TOGGLE_STAR_SCRIPT)(keys=keys, args=args)
+        if changed == -1:
+            _load_starred_set(user_id)
+            changed = _script(TOGGLE_STAR_SCRIPT)(keys=keys, args=args)
+    except RedisError as e:
+        logger.warning(f"Star engine unavailable, writing star to the database: {e}")
+        return None
+    return None if changed == -1 else changed
+
+
+def _load_starred_set(user_id):
+    """Load the user's starred set into Redis, and return the repository ids in it."""
+    prefix = f'{user_id}:'
+    set_key, version_key, flushing_key, pending_key = _keys(
+        CacheKeys.user_star_set(user_id), CacheKeys.user_star_version(user_id),
+        CacheKeys.flushing_stars(), CacheKeys.pending_stars(),
+    )
+    # Operations first: any of them flushed meanwhile is already in the rows
+    version, *reply = _script(USER_OPERATIONS_SCRIPT)(
+        keys=[version_key, flushing_key, pending_key], args=[f'{prefix}*'],
+    )
+    operations = {}
+    for field, operation in zip(reply[::2], reply[1::2]):  # Newest last
+        operations[field.decode()[len(prefix):]] = operation == b'1'
+
+    starred = {str(repo_id) for repo_id in Star.objects.filter(user_id=user_id).values_list('repository_id', flat=True)}
+    starred.update(repo_id for repo_id, is_star in operations.items() if is_star)
+    starred.difference_update(repo_id for repo_id, is_star in operations.items() if not is_star)
+
+    _script(LOAD_STARRED_SET_SCRIPT)(
+        keys=[set_key, version_key],
+        args=[version, settings.STARRED_SET_TTL, EMPTY_SET_MARKER, *starred],
+    )
+    return starred
+
+
+def starred_set_changed(user_id, repo_id, starred):
+    """Apply a committed Star row change to the user's starred set, if loaded."""
+    if settings.STARS_WRITE_BEHIND:
+        # The set is ahead of the rows; a flush deleting rows must not undo newer toggles
+        return
+
+    def sync():
+        try:
+            _script(SYNC_STARRED_SET_SCRIPT)(
+                keys=_keys(CacheKeys.user_star_set(user_id), CacheKeys.user_star_version(user_id)),
+                args=[str(repo_id), '1' if starred else '0', settings.STARRED_SET_TTL],
+            )
+        except RedisError as e:
+            logger.warning(f"Could not update starred set of user {user_id}: {e}")
+
+    transaction.on_commit(sync, robust=True)
+
+
+def starred_repository_ids(user, repo_ids):
+    """The subset of repo_ids the user has starred, in one round trip."""
+    repo_ids = list(repo_ids)
+    if not user.is_authenticated or not repo_ids:
+        return set()
+
+    key, = _keys(CacheKeys.user_star_set(user.pk))
+    members = [str(repo_id) for repo_id in repo_ids]
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.smismember(key, members)
+        loaded, flags = pipe.execute()
+        if not loaded:
+            # Answered from what was read, even if a concurrent change kept it from being stored
+            starred = _load_starred_set(user.pk)
+            flags = [member in starred for member in members]
+        return {repo_id for repo_id, flag in zip(repo_ids, flags) if flag}
+    except RedisError as e:
+        logger.warning(f"Star engine unavailable, reading stars from the database: {e}")
+    return set(
+        Star.objects.filter(user=user, repository_id__in=repo_ids).values_list('repository_id', flat=True)
+    )
+
+
+def has_starred(user, repo: Repository) -> bool:
+    return repo.id in starred_repository_ids(user, [repo.id])
+
+
+def mark_starred(user, repositories):
+    """Set user_starred on each repository of a listing, with one lookup for all of them."""
+    repositories = list(repositories)
+    starred = starred_repository_ids(user, [repository.id for repository in repositories])
+    for repository in repositories:
+        repository.user_starred = repository.id in starred
+
+
+def pending_star_counts(repo_ids):
+    """Unflushed star deltas for repo_ids, including a flush in progress."""
+    repo_ids = [str(repo_id) for repo_id in repo_ids]
+    if not repo_ids:
+        return {}
+    pipe = _redis().pipeline(transaction=False)
+    pending_key, flushing_key = _keys(CacheKeys.pending_star_counts(), CacheKeys.flushing_star_counts())
+    pipe.hmget(pending_key, repo_ids)
+    pipe.hmget(flushing_key, repo_ids)
+    pending, flushing = pipe.execute()
+
+    deltas = {}
+    for repo_id, *values in zip(repo_ids, pending, flushing):
+        delta = sum(int(value) for value in values if value is not None)
+        if delta:
+            deltas[uuid.UUID(repo_id)] = delta
+    return deltas
+
+
+def overlay_pending_stars(repositories):
+    """Add unflushed stars to each repository's star_count in place (display only)."""
+    repositories = list(repositories)
+    if not settings.STARS_WRITE_BEHIND:
+        return
+    try:
+        deltas = pending_star_counts(repository.id for repository in repositories)
+    except RedisError as e:
+        logger.warning(f"Could not read pending star counts: {e}")
+        return
+    for repository in repositories:
+        repository.star_count += deltas.get(repository.id, 0)
+
+
+def current_star_count(repo_id):
+    """star_count as stored now, plus stars not yet flushed."""
+    repository = Repository.objects.only('id', 'star_count').get(id=repo_id)
+    overlay_pending_stars([repository])
+    return repository.star_count
+
+
+def star_rate_limit_reset(user):
+    """
+    Count one star API request against the user's fixed window. Returns the
+    seconds until the window resets once the budget is spent, otherwise None.
+    """
+    window_seconds = settings.STAR_API_RATE_WINDOW
+    now = int(time.time())
+    window = now // window_seconds
+    key = CacheKeys.star_rate(user.pk, window)
+    if cache.add(key, 1, timeout=window_seconds):
+        requests = 1
+    else:
+        try:
+            requests = cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            cache.set(key, 1, timeout=window_seconds)
+            requests = 1
+    if requests > settings.STAR_API_RATE_LIMIT:
+        return (window + 1) * window_seconds - now
+    return None
+
+
+def flush_stars():
+    """Persist recorded star operations. Returns the number of operations applied."""
+    redis = _redis()
+    pending_key, counts_key, flushing_key, flushing_counts_key = _keys(
+        CacheKeys.pending_stars(), CacheKeys.pending_star_counts(),
+        CacheKeys.flushing_stars(), CacheKeys.flushing_star_counts(),
+    )
+    _script(BEGIN_FLUSH_SCRIPT)(keys=[pending_key, counts_key, flushing_key, flushing_counts_key])
+
+    starred, unstarred = [], []
+    for field, operation in redis.hgetall(flushing_key).items():
+        user_id, repo_id = (uuid.UUID(value) for value in field.decode().split(':'))
+        (starred if operation == b'1' else unstarred).append((user_id, repo_id))
+
+    if starred or unstarred:
+        repo_ids = {repo_id for _, repo_id in starred + unstarred}
+        user_ids = {user_id for user_id, _ in starred + unstarred}
+        with transaction.atomic():
+            # Rows for repositories or users deleted since would break the insert
+            live_repo_ids = set(Repository.objects.filter(id__in=repo_ids).values_list('id', flat=True))
+            live_user_ids = set(get_user_model().objects.filter(id__in=user_ids).values_list('id', flat=True))
+            Star.objects.bulk_create(
+                [
+                    Star(user_id=user_id, repository_id=repo_id)
+                    for user_id, repo_id in starred
+                    if user_id in live_user_ids and repo_id in live_repo_ids
+                ],
+                ignore_conflicts=True,  # Keeps the one-star-per-user constraint
+            )
+            if unstarred:
+                lookup = Q()
+                for user_id, repo_id in unstarred:
+                    lookup |= Q(user_id=user_id, repository_id=repo_id)
+                Star.objects.filter(lookup).delete()
+
+            touched = Repository.objects.filter(id__in=live_repo_ids)
+            refresh_star_counts(touched)
+            refresh_relevance_scores(touched)
+            mark_repositories_dirty(live_repo_ids)
+            for user_id in live_user_ids:
+                mark_user_dirty(user_id)
+
+    redis.delete(flushing_key, flushing_counts_key)
+    applied = len(starred) + len(unstarred)
+    if applied:
+        logger.info(f"Flushed {len(starred)} stars and {len(unstarred)} unstars")
+    return applied
@@ -0,0 +1,196 @@
+"""
+Registry notification ingestion.
+
+An envelope is parsed up front, every repository it references is resolved
+through the ACL index (one query for any names it does not know), pushed
+tags are upserted with a single INSERT ... ON CONFLICT and pulls are summed
+per repository into one UPDATE. Bulk writes bypass model signals, so each
+touched repository is marked dirty exactly once instead.
+With PULL_COUNT_WRITE_BEHIND on, pulls go to Redis counters instead and reach
+Postgres with the next flush_pull_counts run.
+
+The registry retries notifications, so every event id is claimed with SET NX
+(one pipeline per envelope) before any database work and repeats are dropped.
+A claim first only lives for REGISTRY_EVENT_CLAIM_TTL and is extended to
+REGISTRY_EVENT_DEDUPE_TTL once the writes have committed. Claims are released
+if ingestion fails, and a worker killed mid-envelope leaves claims that expire
+before its message is reclaimed, so the redelivery is ingested, not dropped.
+"""
+import logging
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from registry import metrics
+from registry.cache_keys import CacheKeys
+from registry.acl_index import lookup_repositories
+from registry.invalidation import mark_repositories_dirty
+from registry.models import Tag
+from registry.services.pull_counts import apply_pull_deltas, record_pulls
+
+logger = logging.getLogger(__name__)
+
+HANDLED_ACTIONS = ('push', 'pull')
+
+
+@dataclass(frozen=True)
+class RegistryEvent:
+    action: str
+    repository: str  # "user/app" or "ubuntu" for official repositories
+    tag: str
+    digest: str
+    size: int
+    event_id: str = ''
+
+
+def parse_events(payload):
+    """
+    Turn a notification envelope into RegistryEvents, skipping events this
+    platform does not track. Raises KeyError for a malformed push/pull target.
+    """
+    events = []
+    for event in payload.get('events', []):
+        action = event.get('action')
+        if action not in HANDLED_ACTIONS:
+            logger.info(f"Ignoring non-push/pull event: {action}")
+            continue
+
+        target = event['target']
+        full_name = target['repository']
+        tag_name = target.get('tag')
+        digest = target['digest']
+        size = target['size']
+
+        if not tag_name:
+            logger.warning(f"Skipping event without tag name for repo {full_name}")
+            continue
+
+        events.append(RegistryEvent(
+            action=action,
+            repository=full_name,
+            tag=tag_name,
+            digest=digest,
+            size=size,
+            event_id=event.get('id', ''),
+        ))
+    return events
+
+
+def claim_events(events):
+    """
+    Drop events whose id was already seen within REGISTRY_EVENT_DEDUPE_TTL or
+    is being ingested right now. Returns (new events, claimed keys). Events
+    without an id always pass, and so does everything if Redis is unavailable.
+    """
+    keys = {
+        index: cache.make_key(CacheKeys.registry_event_seen(event.event_id))
+        for index, event in enumerate(events) if event.event_id
+    }
+    if not keys:
+        return list(events), []
+
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for key in keys.values():
+            pipe.set(key, 1, nx=True, ex=settings.REGISTRY_EVENT_CLAIM_TTL)
+        claimed = dict(zip(keys, pipe.execute()))
+    except Exception as e:
+        logger.warning(f"Event deduplication unavailable, processing envelope as is: {e}")
+        return list(events), []
+
+    duplicates = {index for index, is_new in claimed.items() if not is_new}
+    if duplicates:
+        metrics.increment('webhook.events_duplicate', len(duplicates))
+        logger.info(f"Skipping {len(duplicates)} already processed registry events")
+
+    new_events = [event for index, event in enumerate(events) if index not in duplicates]
+    claimed_keys = [keys[index] for index, is_new in claimed.items() if is_new]
+    return new_events, claimed_keys
+
+
+def confirm_events(claimed_keys):
+    """Remember ingested event ids for the full deduplication window."""
+    if claimed_keys:
+        try:
+            pipe = get_redis_connection("default").pipeline(transaction=False)
+            for key in claimed_keys:
+                pipe.expire(key, settings.REGISTRY_EVENT_DEDUPE_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to confirm registry event claims: {e}")
+
+
+def release_events(claimed_keys):
+    if claimed_keys:
+        try:
+            get_redis_connection("default").delete(*claimed_keys)
+        except Exception as e:
+            logger.warning(f"Failed to release registry event claims: {e}")
+
+
+def ingest_events(events):
+    """Apply one envelope's worth of new events. Returns (tags upserted, pulls recorded)."""
+    if not events:
+        return 0, 0
+    events, claimed_keys = claim_events(events)
+    try:
+        result = _ingest_new_events(events)
+    except Exception:
+        release_events(claimed_keys)
+        raise
+    transaction.on_commit(lambda: confirm_events(claimed_keys), robust=True)
+    return result
+
+
+def _ingest_new_events(events):
+    if not events:
+        return 0, 0  # All duplicates
+    repo_ids = {
+        full_name: acl.id
+        for full_name, acl in lookup_repositories(event.repository for event in events).items()
+    }
+
+    tags = {}
+    pulls = Counter()
+    for event in events:
+        repo_id = repo_ids.get(event.repository)
+        if repo_id is None:
+            logger.warning(f"Repository not found in database: {event.repository}")
+            continue
+
+        if event.action == 'push':
+            # ON CONFLICT cannot touch a row twice; the last push of a tag wins
+            tags[(repo_id, event.tag)] = Tag(
+                repository_id=repo_id, name=event.tag, digest=event.digest, size=event.size,
+            )
+        else:
+            pulls[repo_id] += 1
+
+    write_behind = settings.PULL_COUNT_WRITE_BEHIND
+    write_through_pulls = {} if write_behind else pulls
+
+    touched = {repo_id for repo_id, _ in tags} | set(write_through_pulls)
+    if touched:
+        with transaction.atomic():
+            if tags:
+                Tag.objects.bulk_create(
+                    list(tags.values()),
+                    update_conflicts=True,
+                    unique_fields=['repository', 'name'],
+                    update_fields=['digest', 'size'],
+                )
+            apply_pull_deltas(write_through_pulls)
+            mark_repositories_dirty(touched)
+
+    # After the commit: a failed transaction must not leave counted pulls behind
+    if pulls and write_behind:
+        record_pulls(pulls)
+
+    logger.info(
+        f"Upserted {len(tags)} tags and {sum(pulls.values())} pulls across {len(touched)} repositories"
+    )
+    return len(tags), sum(pulls.values())
@@ -1,26 +1,110 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from .models import Repository, Tag, Star
-from .cache import invalidate_repository_cache, invalidate_user_cache, invalidate_explore_cache
+from .acl_index import owner_acl_changed, repository_acl_changed
+from .cache_keys import CacheKeys
+from .models import AccessToken, Repository, Tag, Star
+from .services.credentials import bump_credential_epoch
+from .services.stars import starred_set_changed
+from .invalidation import mark_repositories_dirty, mark_repository_dirty, mark_user_dirty
+from .utils import (
+    RELEVANCE_SCORE_SOURCE_FIELDS, SEARCH_VECTOR_SOURCE_FIELDS,
+    relevance_score_expression, repository_search_vector,
+)
+
+
+def _derived_field_updates(update_fields, fields_by_source):
+    """
+    Build the UPDATE kwargs for derived columns whose source fields were saved.
+    update_fields=None means a full save, which may have touched anything.
+    """
+    updates = {}
+    for field_name, (source_fields, expression_factory) in fields_by_source.items():
+        if update_fields is None or source_fields.intersection(update_fields):
+            updates[field_name] = expression_factory()
+    return updates
+
+
+@receiver(post_save, sender=Repository)
+def update_derived_fields_on_change(sender, instance, update_fields=None, **kwargs):
+    updates = _derived_field_updates(update_fields, {
+        'search_vector': (SEARCH_VECTOR_SOURCE_FIELDS, repository_search_vector),
+        'relevance_score': (RELEVANCE_SCORE_SOURCE_FIELDS, relevance_score_expression),
+    })
+    if updates:
+        Repository.objects.filter(pk=instance.pk).update(**updates)
 
 
 @receiver([post_save, post_delete], sender=Repository)
 def invalidate_repo_cache_on_change(sender, instance, **kwargs):
-    invalidate_repository_cache(instance.id)
-    invalidate_user_cache(instance.owner.id)
+    mark_repository_dirty(instance.id)
+    mark_user_dirty(instance.owner_id)
     print(f"[SIGNAL] Repository changed: {instance.name}")
 
 
+ACL_FIELDS = frozenset({'name', 'owner', 'owner_id', 'visibility', 'is_official'})
+
+
+@receiver([post_save, post_delete], sender=Repository)
+def invalidate_repository_acl(sender, instance, update_fields=None, **kwargs):
+    # Registry auth resolves names through a per-process index
+    if update_fields is None or ACL_FIELDS.intersection(update_fields):
+        repository_acl_changed(instance.id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def update_owned_repositories_on_change(sender, instance, created, update_fields=None, **kwargs):
+    # Owner username feeds the search document, publisher_status the badge score
+    if created:
+        return
+    updates = _derived_field_updates(update_fields, {
+        'search_vector': (frozenset({'username'}), repository_search_vector),
+        'relevance_score': (frozenset({'publisher_status'}), relevance_score_expression),
+    })
+    if updates:
+        owned = Repository.objects.filter(owner_id=instance.pk)
+        owned.update(**updates)
+        # Cached cards embed the owner's username and badge
+        mark_repositories_dirty(owned.values_list('id', flat=True))
+
+
+CREDENTIAL_FIELDS = frozenset({'password', 'username', 'is_active'})
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_verified_credentials(sender, instance, update_fields=None, created=False, **kwargs):
+    # Registry Basic-auth checks are cached; any credential change must end them
+    if created:
+        return
+    if update_fields is None or CREDENTIAL_FIELDS.intersection(update_fields):
+        bump_credential_epoch(instance.pk)
+    # Owned repositories are indexed by "username/name"
+    if update_fields is None or 'username' in update_fields:
+        owner_acl_changed(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def invalidate_access_token_on_change(sender, instance, **kwargs):
+    # Revocation, expiry and scope edits must apply to the next request; the
+    # second delete drops anything cached from the pre-commit row meanwhile
+    key = CacheKeys.access_token(instance.prefix)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
 @receiver([post_save, post_delete], sender=Tag)
 def invalidate_tag_cache_on_change(sender, instance, **kwargs):
-    invalidate_repository_cache(instance.repository.id)
-    print(f"[SIGNAL] Tag changed for repository: {instance.repository.name}")
+    mark_repository_dirty(instance.repository_id)
+    print(f"[SIGNAL] Tag changed for repository: {instance.repository_id}")
 
 
 @receiver([post_save, post_delete], sender=Star)
 def invalidate_star_cache_on_change(sender, instance, **kwargs):
-    invalidate_user_cache(instance.user.id)
-    invalidate_repository_cache(instance.repository.id)
-    invalidate_explore_cache()
-    print(f"[SIGNAL] Star changed: {instance.user.username} ★ {instance.repository.name}")
+    # Repository invalidation already retires explore (star count affects sorting)
+    mark_user_dirty(instance.user_id)
+    mark_repository_dirty(instance.repository_id)
+    starred_set_changed(instance.user_id, instance.repository_id, starred=kwargs['signal'] is post_save)
+    print(f"[SIGNAL] Star changed: user {instance.user_id} ★ repository {instance.repository_id}")
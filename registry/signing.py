@@ -0,0 +1,93 @@
+"""
+Registry token signing.
+
+The private key and certificate are parsed once per process into a
+TokenSigner, which also pre-encodes the JOSE header with its x5c chain, so
+issuing a token costs one JSON dump and one signature. REGISTRY_TOKEN_ALGORITHM
+selects RS256 (default), ES256 (P-256) or EdDSA (Ed25519); the key in
+REGISTRY_PRIVATE_KEY must be of the matching type.
+"""
+import base64
+import functools
+import json
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def x5c_chain(certificate_pem):
+    """DER certificates of a PEM bundle, base64-encoded for the x5c header."""
+    if not certificate_pem:
+        return []
+    certificates = x509.load_pem_x509_certificates(certificate_pem.encode())
+    return [
+        base64.b64encode(certificate.public_bytes(serialization.Encoding.DER)).decode()
+        for certificate in certificates
+    ]
+
+
+class TokenSigner:
+
+    def __init__(self, private_key_pem, certificate_pem, algorithm):
+        if algorithm not in ALGORITHMS:
+            raise ImproperlyConfigured(
+                f"REGISTRY_TOKEN_ALGORITHM must be one of {', '.join(ALGORITHMS)}, not {algorithm!r}"
+            )
+        self.algorithm = algorithm
+        self._key = serialization.load_pem_private_key(private_key_pem.encode(), password=None)
+        self._check_key_type()
+
+        header = {'typ': 'JWT', 'alg': algorithm, 'x5c': x5c_chain(certificate_pem)}
+        self._header_segment = _b64(json.dumps(header, separators=(',', ':')).encode())
+
+    def _check_key_type(self):
+        key = self._key
+        if self.algorithm == 'RS256':
+            matches = isinstance(key, rsa.RSAPrivateKey)
+        elif self.algorithm == 'ES256':
+            matches = isinstance(key, ec.EllipticCurvePrivateKey) and isinstance(key.curve, ec.SECP256R1)
+        else:
+            matches = isinstance(key, ed25519.Ed25519PrivateKey)
+        if not matches:
+            raise ImproperlyConfigured(f"The registry signing key cannot be used with {self.algorithm}")
+
+    def _signature(self, signing_input):
+        if self.algorithm == 'RS256':
+            return self._key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        if self.algorithm == 'ES256':
+            # JWS wants the raw r || s pair, not the DER sequence
+            r, s = decode_dss_signature(self._key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+            return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+        return self._key.sign(signing_input)
+
+    def sign(self, payload):
+        """Return the compact JWS for a claims dict."""
+        signing_input = self._header_segment + b'.' + _b64(json.dumps(payload, separators=(',', ':')).encode())
+        return (signing_input + b'.' + _b64(self._signature(signing_input))).decode()
+
+
+@functools.lru_cache(maxsize=4)
+def _signer(private_key_pem, certificate_pem, algorithm):
+    return TokenSigner(private_key_pem, certificate_pem, algorithm)
+
+
+def get_token_signer():
+    return _signer(
+        settings.REGISTRY_PRIVATE_KEY,
+        settings.REGISTRY_PUBLIC_CERTIFICATE,
+        settings.REGISTRY_TOKEN_ALGORITHM,
+    )
+
+
+def sign_registry_token(payload):
+    return get_token_signer().sign(payload)
@@ -1,6 +1,9 @@
 """
 Redis cache tests for registry app (pytest style)
 """
+import uuid
+from unittest.mock import patch
+
 import pytest
 from django.core.cache import cache
 from django.test import Client
@@ -8,7 +11,13 @@ from django.contrib.auth import get_user_model
 
 from registry.models import Repository, Tag, Star
 from registry.cache_keys import CacheKeys
-from registry.cache import invalidate_repository_cache, invalidate_explore_cache
+from registry.cache import (
+    explore_cache_key, get_explore_generation, invalidate_explore_cache, invalidate_repository_cache,
+)
+from registry import metrics
+from registry.invalidation import batch_invalidation, flush_invalidations
+from registry.services import explore
+from registry.services.explore import RankedIds, hydrate_repositories, pack_ranking
 
 User = get_user_model()
 
@@ -57,12 +66,12 @@ class TestCacheKeys:
     """Test CacheKeys class generates correct keys"""
 
     def test_explore_key_no_params(self):
-        key = CacheKeys.explore(query=None, badges=None)
-        assert key == "explore:q:None:badges:"
+        key = CacheKeys.explore(query=None, badges=None, generation=7)
+        assert key == "explore:g7:q:None:badges:"
 
     def test_explore_key_with_query(self):
-        key = CacheKeys.explore(query="test", badges=None)
-        assert key == "explore:q:test:badges:"
+        key = CacheKeys.explore(query="test", badges=None, generation=7)
+        assert key == "explore:g7:q:test:badges:"
 
     def test_explore_key_with_badges(self):
         key = CacheKeys.explore(query=None, badges=["official", "verified"])
@@ -77,11 +86,16 @@ class TestCacheKeys:
         key = CacheKeys.repo_tags("test-repo-id")
         assert key == "repo_tags:test-repo-id"
 
+    def test_repo_card_key(self):
+        key = CacheKeys.repo_card("test-repo-id")
+        assert key == "repo_card:test-repo-id"
+
     def test_get_repo_invalidation_keys(self):
         keys = CacheKeys.get_repo_invalidation_keys("test-id")
         assert isinstance(keys, list)
         assert len(keys) > 0
         assert any("repo_detail_public:test-id" in k for k in keys)
+        assert CacheKeys.repo_card("test-id") in keys
 
 
 # ==================== EXPLORE CACHE TESTS ====================
@@ -154,6 +168,154 @@ class TestExploreCache:
         assert "[CACHE HIT]" in out3
 
 
+# ==================== COMPACT EXPLORE ENTRY TESTS ====================
+
+class TestRankedIds:
+    """Test the packed (id, score) ranking format"""
+
+    def test_pack_and_slice(self):
+        pairs = [(uuid.uuid4(), float(score)) for score in range(50, 0, -1)]
+        ranking = RankedIds(pack_ranking(pairs))
+
+        assert len(ranking) == 50
+        assert ranking[0] == pairs[0]
+        assert ranking[-1] == pairs[-1]
+        assert ranking[20:40] == pairs[20:40]
+
+    def test_entry_size_is_fixed(self):
+        packed = pack_ranking([(uuid.uuid4(), 1.5)] * 3)
+        assert len(packed) == 3 * 24
+
+
+@pytest.mark.django_db
+class TestCompactExploreCache:
+    """Test explore caches packed rankings and hydrates pages from repo cards"""
+
+    def test_explore_caches_packed_ranking(self, client, public_repo):
+        client.get('/explore/')
+
+        entry = cache.get(explore_cache_key(query=None, badges=None))
+        assert isinstance(entry['ranking'], bytes)
+        assert list(RankedIds(entry['ranking']))[0][0] == public_repo.id
+        assert entry['total'] == 1
+        assert entry['capped'] is False
+
+    def test_explore_populates_repo_cards(self, client, public_repo):
+        client.get('/explore/')
+
+        card = cache.get(CacheKeys.repo_card(public_repo.id))
+        assert card['name'] == 'test-repo'
+        assert card['owner_username'] == 'testuser'
+
+    def test_cached_cards_hydrate_without_repository_query(self, client, public_repo, django_assert_num_queries):
+        client.get('/explore/')
+
+        ranked = [(public_repo.id, 1.0)]
+        with django_assert_num_queries(0):
+            repos = hydrate_repositories(ranked)
+
+        assert repos == [public_repo]
+        assert repos[0].owner.username == 'testuser'
+
+    def test_ranking_is_capped(self, client, user, public_repo, settings):
+        settings.EXPLORE_CACHE_MAX_RESULTS = 1
+        Repository.objects.create(owner=user, name='second-repo', visibility=Repository.Visibility.PUBLIC)
+
+        response = client.get('/explore/')
+
+        entry = cache.get(explore_cache_key(query=None, badges=None))
+        assert len(RankedIds(entry['ranking'])) == 1
+        assert response.context['total_is_capped'] is True
+
+    def test_deleted_repository_is_skipped(self, public_repo):
+        ranked = [(uuid.uuid4(), 2.0), (public_repo.id, 1.0)]
+
+        assert hydrate_repositories(ranked) == [public_repo]
+
+
+@pytest.mark.django_db
+class TestExploreStaleWhileRevalidate:
+    """Test explore serves stale entries while a single worker recomputes"""
+
+    @pytest.fixture(autouse=True)
+    def swr_mode(self, settings):
+        settings.EXPLORE_STALE_WHILE_REVALIDATE = True
+
+    def test_miss_then_hit(self, client, public_repo, capfd):
+        client.get('/explore/')
+        out1, _ = capfd.readouterr()
+        client.get('/explore/')
+        out2, _ = capfd.readouterr()
+
+        assert "[CACHE MISS]" in out1
+        assert "[CACHE HIT]" in out2
+
+    def test_invalidated_entry_is_served_stale_while_locked(self, client, public_repo, capfd):
+        client.get('/explore/')
+        invalidate_explore_cache()
+        cache.add(CacheKeys.explore_lock(None, []), 1, 30)  # another worker is recomputing
+        capfd.readouterr()
+
+        response = client.get('/explore/')
+
+        out, _ = capfd.readouterr()
+        assert "[CACHE STALE]" in out
+        assert list(response.context['repositories']) == [public_repo]
+        counters = metrics.get_counters()
+        assert counters['explore.stale_served'] == 1
+        assert counters['explore.lock_contention'] == 1
+
+    def test_invalidated_entry_is_recomputed_by_lock_holder(self, client, public_repo, capfd):
+        client.get('/explore/')
+        invalidate_explore_cache()
+        capfd.readouterr()
+
+        client.get('/explore/')
+
+        out, _ = capfd.readouterr()
+        assert "[CACHE MISS]" in out
+        assert cache.get(CacheKeys.explore_lock(None, [])) is None, "Lock should be released after recompute"
+        entry = cache.get(CacheKeys.explore_latest(None, []))
+        assert entry['generation'] == get_explore_generation()
+
+    def test_soft_expired_entry_is_recomputed(self, client, public_repo, capfd, settings):
+        settings.CACHE_TIMEOUT_EXPLORE = 0
+        client.get('/explore/')
+        capfd.readouterr()
+
+        client.get('/explore/')
+
+        out, _ = capfd.readouterr()
+        assert "[CACHE MISS]" in out
+
+    def test_expired_lock_taken_by_another_worker_is_kept(self, public_repo):
+        lock_key = CacheKeys.explore_lock(None, [])
+        build = explore.build_explore_entry
+
+        def slow_build(*args):
+            # This recompute outlived its lock and another worker took it over
+            cache.set(lock_key, 'other-worker', 30)
+            return build(*args)
+
+        with patch('registry.services.explore.build_explore_entry', side_effect=slow_build):
+            explore.get_explore_entry(None, [])
+
+        assert cache.get(lock_key) == 'other-worker'
+
+    def test_cold_key_waits_for_lock_holder(self, public_repo):
+        cache.add(CacheKeys.explore_lock(None, []), 1, 30)  # another worker is recomputing
+        built = explore.build_explore_entry(None, [])
+
+        def lock_holder_finishes(seconds):
+            cache.set(CacheKeys.explore_latest(None, []), built, 60)
+
+        with patch('registry.services.explore.time.sleep', side_effect=lock_holder_finishes), \
+                patch('registry.services.explore.build_explore_entry') as build:
+            assert explore.get_explore_entry(None, []) == built
+
+        build.assert_not_called()
+
+
 # ==================== PUBLIC REPO DETAIL CACHE TESTS ====================
 
 @pytest.mark.django_db
@@ -208,7 +370,7 @@ class TestPublicRepositoryDetailCache:
 class TestSignalInvalidation:
     """Test automatic cache invalidation via signals"""
 
-    def test_repository_edit_invalidates_cache(self, public_repo):
+    def test_repository_edit_invalidates_cache(self, public_repo, django_capture_on_commit_callbacks):
         """Test editing repository invalidates its cache"""
         cache_key = CacheKeys.repo_detail_public(public_repo.id)
 
@@ -221,15 +383,16 @@ class TestSignalInvalidation:
         # VERIFY: Cache now exists
         assert cache.get(cache_key) is not None, "Cache should exist after manual set"
 
-        # Edit repository (triggers signal)
-        public_repo.description = "Updated description"
-        public_repo.save()
+        # Edit repository (triggers signal, flushed on commit)
+        with django_capture_on_commit_callbacks(execute=True):
+            public_repo.description = "Updated description"
+            public_repo.save()
 
         # VERIFY: Cache is invalidated
         cached_data = cache.get(cache_key)
         assert cached_data is None, "Cache should be invalidated after repo edit"
 
-    def test_repository_delete_invalidates_cache(self, public_repo):
+    def test_repository_delete_invalidates_cache(self, public_repo, django_capture_on_commit_callbacks):
         """Test deleting repository invalidates cache"""
         cache_key = CacheKeys.repo_detail_public(public_repo.id)
 
@@ -242,13 +405,14 @@ class TestSignalInvalidation:
         # VERIFY: Cache exists
         assert cache.get(cache_key) is not None, "Cache should exist after manual set"
 
-        # Delete repository (triggers signal)
-        public_repo.delete()
+        # Delete repository (triggers signal, flushed on commit)
+        with django_capture_on_commit_callbacks(execute=True):
+            public_repo.delete()
 
         # VERIFY: Cache is invalidated
         assert cache.get(cache_key) is None, "Cache should be invalidated after repo delete"
 
-    def test_tag_push_invalidates_repo_cache(self, public_repo):
+    def test_tag_push_invalidates_repo_cache(self, public_repo, django_capture_on_commit_callbacks):
         """Test pushing tag invalidates repository cache"""
         cache_key = CacheKeys.repo_detail_public(public_repo.id)
 
@@ -261,20 +425,21 @@ class TestSignalInvalidation:
         # VERIFY: Cache exists
         assert cache.get(cache_key) is not None, "Cache should exist after manual set"
 
-        # Create tag (simulates Docker push, triggers signal)
-        Tag.objects.create(
-            repository=public_repo,
-            name='latest',
-            digest='sha256:abc123'
-        )
+        # Create tag (simulates Docker push, triggers signal, flushed on commit)
+        with django_capture_on_commit_callbacks(execute=True):
+            Tag.objects.create(
+                repository=public_repo,
+                name='latest',
+                digest='sha256:abc123'
+            )
 
         # VERIFY: Cache is invalidated
         assert cache.get(cache_key) is None, "Cache should be invalidated after tag push"
 
-    def test_star_invalidates_caches(self, user, public_repo):
+    def test_star_invalidates_caches(self, user, public_repo, django_capture_on_commit_callbacks):
         """Test starring repository invalidates related caches"""
         repo_key = CacheKeys.repo_detail_public(public_repo.id)
-        explore_key = CacheKeys.explore(query=None, badges=None)
+        explore_key = explore_cache_key(query=None, badges=None)
 
         # VERIFY: Caches are empty initially
         assert cache.get(repo_key) is None, "Repo cache should be empty initially"
@@ -288,14 +453,16 @@ class TestSignalInvalidation:
         assert cache.get(repo_key) is not None, "Repo cache should exist after set"
         assert cache.get(explore_key) is not None, "Explore cache should exist after set"
 
-        # Create star (triggers signal)
-        Star.objects.create(user=user, repository=public_repo)
+        # Create star (triggers signal, flushed on commit)
+        with django_capture_on_commit_callbacks(execute=True):
+            Star.objects.create(user=user, repository=public_repo)
 
         # VERIFY: Both caches are invalidated
         assert cache.get(repo_key) is None, "Repo cache should be invalidated after star"
-        assert cache.get(explore_key) is None, "Explore cache should be invalidated (star count affects sorting)"
+        assert cache.get(explore_cache_key(query=None, badges=None)) is None, \
+            "Explore cache should be invalidated (star count affects sorting)"
 
-    def test_unstar_invalidates_caches(self, user, public_repo):
+    def test_unstar_invalidates_caches(self, user, public_repo, django_capture_on_commit_callbacks):
         """Test unstarring repository invalidates caches"""
         repo_key = CacheKeys.repo_detail_public(public_repo.id)
 
@@ -311,13 +478,56 @@ class TestSignalInvalidation:
         # VERIFY: Cache exists
         assert cache.get(repo_key) is not None, "Cache should exist after set"
 
-        # Delete star (triggers signal)
-        star.delete()
+        # Delete star (triggers signal, flushed on commit)
+        with django_capture_on_commit_callbacks(execute=True):
+            star.delete()
 
         # VERIFY: Cache is invalidated
         assert cache.get(repo_key) is None, "Cache should be invalidated after unstar"
 
 
+@pytest.mark.django_db
+class TestCoalescedInvalidation:
+    """Test signal invalidations are collected and flushed once on commit"""
+
+    def test_invalidation_waits_for_commit(self, public_repo, django_capture_on_commit_callbacks):
+        cache_key = CacheKeys.repo_detail_public(public_repo.id)
+        cache.set(cache_key, {'test': 'data'}, 600)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            public_repo.description = "Updated"
+            public_repo.save()
+            assert cache.get(cache_key) is not None, "Cache should survive until the transaction commits"
+
+        assert cache.get(cache_key) is None
+
+    def test_many_tags_flush_once(self, public_repo, capfd, django_capture_on_commit_callbacks):
+        cache_key = CacheKeys.repo_tags(public_repo.id)
+        cache.set(cache_key, ['stale'], 600)
+        capfd.readouterr()
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            for i in range(5):
+                Tag.objects.create(repository=public_repo, name=f'v{i}', digest=f'sha256:{i}')
+
+        assert callbacks.count(flush_invalidations) == 1
+        out, _ = capfd.readouterr()
+        assert out.count("[CACHE] Invalidated") == 1
+        assert cache.get(cache_key) is None
+
+    def test_batch_invalidation_schedules_one_flush(self, public_repo, private_repo, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            with batch_invalidation():
+                public_repo.save()
+                private_repo.save()
+
+        assert callbacks.count(flush_invalidations) == 1
+
+    def test_tag_signal_does_not_load_repository(self, public_repo, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            Tag.objects.create(repository_id=public_repo.id, name='latest', digest='sha256:abc123')
+
+
 # ==================== CACHE INVALIDATION FUNCTION TESTS ====================
 
 @pytest.mark.django_db
@@ -348,9 +558,9 @@ class TestCacheInvalidationFunctions:
             assert cache.get(key) is None, f"Key {key} should be deleted after invalidation"
 
     def test_invalidate_explore_cache(self):
-        """Test invalidate_explore_cache deletes explore keys"""
-        key1 = CacheKeys.explore(query=None, badges=None)
-        key2 = CacheKeys.explore(query="test", badges=[])
+        """Test invalidate_explore_cache retires explore keys"""
+        key1 = explore_cache_key(query=None, badges=None)
+        key2 = explore_cache_key(query="test", badges=[])
 
         # VERIFY: Both keys are empty initially
         assert cache.get(key1) is None, "Explore key 1 should be empty initially"
@@ -367,9 +577,25 @@ class TestCacheInvalidationFunctions:
         # Invalidate all explore caches
         invalidate_explore_cache()
 
-        # VERIFY: Both keys are deleted
-        assert cache.get(key1) is None, "Explore key 1 should be deleted after invalidation"
-        assert cache.get(key2) is None, "Explore key 2 should be deleted after invalidation"
+        # VERIFY: Both keys now resolve to the new generation, which is empty
+        assert explore_cache_key(query=None, badges=None) != key1
+        assert cache.get(explore_cache_key(query=None, badges=None)) is None, "Explore key 1 should be retired after invalidation"
+        assert cache.get(explore_cache_key(query="test", badges=[])) is None, "Explore key 2 should be retired after invalidation"
+
+    def test_invalidate_explore_cache_is_single_incr(self):
+        """Test invalidation bumps the generation instead of scanning keys"""
+        before = get_explore_generation()
+
+        invalidate_explore_cache()
+
+        assert get_explore_generation() == before + 1
+
+    def test_evicted_generation_does_not_roll_back(self):
+        """Test a lost generation counter is reseeded ahead of earlier values"""
+        before = get_explore_generation()
+        cache.delete(CacheKeys.explore_generation())
+
+        assert get_explore_generation() >= before
 
 
 # ==================== INTEGRATION TESTS ====================
@@ -378,7 +604,7 @@ class TestCacheInvalidationFunctions:
 class TestCacheIntegration:
     """Integration tests - full cache lifecycle via behavior observation"""
 
-    def test_full_cache_lifecycle(self, client, user, public_repo, capfd):
+    def test_full_cache_lifecycle(self, client, user, public_repo, capfd, django_capture_on_commit_callbacks):
         """Test complete cache lifecycle: populate → hit → invalidate → repopulate"""
         # 1. First request - cache miss
         response1 = client.get('/explore/')
@@ -392,9 +618,10 @@ class TestCacheIntegration:
         out2, _ = capfd.readouterr()
         assert "[CACHE HIT]" in out2, "Second request should be cache hit"
 
-        # 3. Edit repo - invalidates cache via signal
-        public_repo.description = "Updated"
-        public_repo.save()
+        # 3. Edit repo - invalidates cache via signal once the change commits
+        with django_capture_on_commit_callbacks(execute=True):
+            public_repo.description = "Updated"
+            public_repo.save()
         out3, _ = capfd.readouterr()
         assert "[SIGNAL] Repository changed" in out3, "Signal should fire"
         assert "[CACHE] Invalidated" in out3, "Cache should be invalidated"
@@ -411,7 +638,7 @@ class TestCacheIntegration:
         out5, _ = capfd.readouterr()
         assert "[CACHE HIT]" in out5, "After repopulation should be cache hit"
 
-    def test_public_repo_detail_lifecycle(self, client, public_repo, capfd):
+    def test_public_repo_detail_lifecycle(self, client, public_repo, capfd, django_capture_on_commit_callbacks):
         """Test public repo detail cache lifecycle"""
         url = f'/registry/public/{public_repo.id}/'
 
@@ -428,8 +655,9 @@ class TestCacheIntegration:
         assert "[CACHE HIT]" in out2
 
         # 3. Edit repo - invalidate
-        public_repo.description = "New description"
-        public_repo.save()
+        with django_capture_on_commit_callbacks(execute=True):
+            public_repo.description = "New description"
+            public_repo.save()
         out3, _ = capfd.readouterr()
         assert "[SIGNAL] Repository changed" in out3
 
@@ -1,16 +1,39 @@
 import base64
+import hashlib
 import json
+import threading
 import pytest
+from datetime import timedelta
 from unittest.mock import patch
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.test import RequestFactory
-from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.contrib.auth import authenticate, get_user_model
+from jose import jwt
 
-from registry.models import Repository
+from registry.acl_index import RepositoryACL, RepositoryACLIndex, acl_index, lookup_repositories
+from registry.cache_keys import CacheKeys
+from registry.models import AccessToken, Repository
+from registry.services.credentials import authenticate_registry_user, bump_credential_epoch
+from registry.services.registry_tokens import normalize_access, token_stats
+from registry.signing import TokenSigner, get_token_signer
 from registry.views_registry import docker_auth
 
 User = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Issued tokens are cached in Redis
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def user(db):
     """Create test user"""
@@ -53,7 +76,7 @@ class TestDockerAuth:
         })
         
         with patch('registry.views_registry.getattr', return_value='test-value'):
-            with patch('registry.views_registry.jwt.encode', return_value='token'):
+            with patch('registry.views_registry.sign_registry_token', return_value='token'):
                 response = docker_auth(request)
                 
         assert response.status_code == 200
@@ -80,7 +103,7 @@ class TestDockerAuth:
         request.META['HTTP_AUTHORIZATION'] = f'Basic {encoded}'
         
         with patch('registry.views_registry.getattr', return_value='test-value'):
-            with patch('registry.views_registry.jwt.encode', return_value='token'):
+            with patch('registry.views_registry.sign_registry_token', return_value='token'):
                 response = docker_auth(request)
                 
         assert response.status_code == 200
@@ -119,10 +142,468 @@ class TestDockerAuth:
         request.META['HTTP_AUTHORIZATION'] = f'Basic {encoded}'
         
         with patch('registry.views_registry.getattr', return_value='test-value'):
-            with patch('registry.views_registry.jwt.encode', return_value='token'):
+            with patch('registry.views_registry.sign_registry_token', return_value='token'):
                 response = docker_auth(request)
                 
         # Should return 200 but with no push permissions
         assert response.status_code == 200
         data = json.loads(response.content)
-        assert data['token'] == 'token'
\ No newline at end of file
+        assert data['token'] == 'token'
+
+
+@pytest.mark.django_db
+class TestTokenCache:
+    """Test identical token requests reuse one signed token"""
+
+    def _request(self, scope='repository:testuser/test-repo:pull'):
+        request = RequestFactory().get('/api/auth/token/', {'scope': scope})
+        with patch('registry.views_registry.sign_registry_token', side_effect=lambda payload, *args, **kwargs: payload['jti']) as encode:
+            response = docker_auth(request)
+        return response, encode
+
+    def test_identical_requests_reuse_token(self, repository):
+        first, first_encode = self._request()
+        second, second_encode = self._request()
+
+        assert first_encode.call_count == 1
+        assert second_encode.call_count == 0
+        assert json.loads(first.content)['token'] == json.loads(second.content)['token']
+
+        stats = token_stats()
+        assert stats['cache_hits'] == 1
+        assert stats['cache_misses'] == 1
+        assert stats['tokens_signed'] == 1
+
+    def test_stats_cost_one_round_trip_per_request(self, repository):
+        with patch('registry.services.registry_tokens.metrics') as recorded:
+            self._request()
+            self._request()
+
+        # The miss is recorded with its signing in one pipeline, the hit on its own
+        assert recorded.increment_many.call_count == 1
+        assert recorded.increment.call_count == 1
+
+    def test_response_includes_lifetime(self, repository):
+        response, _ = self._request()
+
+        data = json.loads(response.content)
+        assert 0 < data['expires_in'] <= 300
+        assert data['issued_at'].endswith('Z')
+
+    def test_different_access_signs_new_token(self, repository, private_repository):
+        first, _ = self._request('repository:testuser/test-repo:pull')
+        second, encode = self._request('repository:unknown/repo:pull')
+
+        assert encode.call_count == 1
+        assert json.loads(first.content)['token'] != json.loads(second.content)['token']
+
+    def test_reuse_can_be_disabled(self, repository, settings):
+        settings.REGISTRY_TOKEN_REUSE_FRACTION = 0
+
+        self._request()
+        _, encode = self._request()
+
+        assert encode.call_count == 1
+
+    def test_access_normalization(self):
+        assert normalize_access([
+            {'type': 'repository', 'name': 'b', 'actions': ['push', 'pull']},
+            {'type': 'repository', 'name': 'a', 'actions': ['pull', 'pull']},
+        ]) == normalize_access([
+            {'type': 'repository', 'name': 'a', 'actions': ['pull']},
+            {'type': 'repository', 'name': 'b', 'actions': ['pull', 'push']},
+        ])
+
+
+@pytest.mark.django_db
+class TestVerifiedCredentialCache:
+    """Test repeated Basic-auth checks skip the password hash"""
+
+    def _auth(self, username, password, scope='repository:testuser/test-repo:push'):
+        request = RequestFactory().get('/api/auth/token/', {'scope': scope})
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        request.META['HTTP_AUTHORIZATION'] = f'Basic {credentials}'
+        with patch('registry.views_registry.sign_registry_token', return_value='token'):
+            return docker_auth(request)
+
+    def test_repeated_login_skips_password_check(self, user, repository):
+        with patch('registry.services.credentials.authenticate', wraps=authenticate) as check:
+            assert self._auth('testuser', 'testpass123').status_code == 200
+            assert self._auth('testuser', 'testpass123').status_code == 200
+
+        assert check.call_count == 1
+
+    def test_cached_principal_keeps_owner_access(self, user, repository):
+        self._auth('testuser', 'testpass123')
+        cache.delete_pattern('registry_token:*')  # force a fresh grant from the cached principal
+
+        with patch('registry.views_registry.sign_registry_token', return_value='token') as encode:
+            request = RequestFactory().get('/api/auth/token/', {'scope': 'repository:testuser/test-repo:push'})
+            request.META['HTTP_AUTHORIZATION'] = 'Basic ' + base64.b64encode(b'testuser:testpass123').decode()
+            docker_auth(request)
+
+        assert encode.call_args[0][0]['access'] == [
+            {'type': 'repository', 'name': 'testuser/test-repo', 'actions': ['push']}
+        ]
+
+    def test_password_change_invalidates_cache(self, user, repository):
+        self._auth('testuser', 'testpass123')
+
+        user.set_password('newpass456')
+        user.save()
+
+        assert self._auth('testuser', 'testpass123').status_code == 401
+        assert self._auth('testuser', 'newpass456').status_code == 200
+
+    def test_deactivation_invalidates_cache(self, user, repository):
+        self._auth('testuser', 'testpass123')
+
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+
+        assert self._auth('testuser', 'testpass123').status_code == 401
+
+    def test_deleted_user_is_rejected(self, user):
+        self._auth('testuser', 'testpass123', scope='')
+        user.delete()
+
+        assert self._auth('testuser', 'testpass123', scope='').status_code == 401
+
+    def test_change_during_password_check_is_not_cached(self, user, repository):
+        def check_then_change(**credentials):
+            result = authenticate(**credentials)
+            bump_credential_epoch(user.pk)  # e.g. a password change committed meanwhile
+            return result
+
+        with patch('registry.services.credentials.authenticate', side_effect=check_then_change):
+            assert self._auth('testuser', 'testpass123').status_code == 200
+
+        with patch('registry.services.credentials.authenticate', wraps=authenticate) as check:
+            assert self._auth('testuser', 'testpass123').status_code == 200
+        assert check.call_count == 1
+
+    def test_failed_login_is_not_cached(self, user):
+        self._auth('testuser', 'wrongpass')
+
+        with patch('registry.services.credentials.authenticate', wraps=authenticate) as check:
+            assert self._auth('testuser', 'wrongpass').status_code == 401
+        assert check.call_count == 1
+
+    def test_plaintext_is_never_stored(self, user):
+        self._auth('testuser', 'testpass123', scope='')
+
+        for key in cache.keys('registry_credential:*'):
+            assert 'testpass123' not in key
+            assert 'testpass123' not in repr(cache.get(key))
+
+
+@pytest.mark.django_db
+class TestScopeResolution:
+    """Test every requested scope is resolved with one query"""
+
+    def test_multiple_scopes_resolve_in_one_query(self, user, repository, private_repository, django_assert_num_queries):
+        official = Repository.objects.create(name='ubuntu', visibility='PUBLIC', is_official=True, owner=user)
+        lookup_repositories(['ubuntu'])  # Load the ACL index
+        request = RequestFactory().get('/api/auth/token/', {'scope': [
+            'repository:testuser/test-repo:pull',
+            'repository:ubuntu:pull',
+            'repository:unknown/repo:pull',
+            'repository:not-a-scope',
+        ]})
+
+        with patch('registry.views_registry.sign_registry_token', return_value='token') as encode:
+            # Only the name the index does not know goes to the database
+            with django_assert_num_queries(1):
+                response = docker_auth(request)
+
+        assert response.status_code == 200
+        assert encode.call_args[0][0]['access'] == [
+            {'type': 'repository', 'name': 'testuser/test-repo', 'actions': ['pull']},
+            {'type': 'repository', 'name': official.name, 'actions': ['pull']},
+        ]
+
+    def test_owner_gets_push_and_pull_on_private_repo(self, user, private_repository):
+        request = RequestFactory().get('/api/auth/token/', {'scope': 'repository:testuser/private-repo:pull,push'})
+        request.META['HTTP_AUTHORIZATION'] = 'Basic ' + base64.b64encode(b'testuser:testpass123').decode()
+
+        with patch('registry.views_registry.sign_registry_token', return_value='token') as encode:
+            docker_auth(request)
+
+        assert encode.call_args[0][0]['access'] == [
+            {'type': 'repository', 'name': 'testuser/private-repo', 'actions': ['pull', 'push']},
+        ]
+
+
+@pytest.mark.django_db
+class TestRepositoryACLIndex:
+    """Test registry auth resolves repositories from the in-process index"""
+
+    def _anonymous_pull(self, name):
+        request = RequestFactory().get('/api/auth/token/', {'scope': f'repository:{name}:pull'})
+        with patch('registry.views_registry.sign_registry_token', return_value='token') as encode:
+            response = docker_auth(request)
+        return response, encode
+
+    def test_warm_index_serves_auth_without_queries(self, repository, django_assert_num_queries):
+        self._anonymous_pull('testuser/test-repo')
+        cache.clear()  # Also rules out the token cache
+
+        with django_assert_num_queries(0):
+            response, encode = self._anonymous_pull('testuser/test-repo')
+
+        assert response.status_code == 200
+        assert encode.call_args[0][0]['access'] == [
+            {'type': 'repository', 'name': 'testuser/test-repo', 'actions': ['pull']},
+        ]
+
+    def test_unknown_names_are_cached_briefly(self, repository, django_assert_num_queries):
+        lookup_repositories(['testuser/missing'])
+
+        with django_assert_num_queries(0):
+            assert lookup_repositories(['testuser/missing']) == {}
+
+    def test_negative_entries_expire(self, repository, settings, django_assert_num_queries):
+        settings.REGISTRY_ACL_NEGATIVE_TTL = 0
+        lookup_repositories(['testuser/missing'])
+
+        with django_assert_num_queries(1):
+            assert lookup_repositories(['testuser/missing']) == {}
+
+    def test_visibility_change_is_seen_immediately(self, repository):
+        self._anonymous_pull('testuser/test-repo')
+
+        repository.visibility = 'PRIVATE'
+        repository.save()
+
+        response, _ = self._anonymous_pull('testuser/test-repo')
+        assert response.status_code == 401
+
+    def test_new_repository_replaces_negative_entry(self, user, repository):
+        assert lookup_repositories(['testuser/new-repo']) == {}
+
+        new_repo = Repository.objects.create(name='new-repo', visibility='PUBLIC', owner=user)
+
+        assert lookup_repositories(['testuser/new-repo'])['testuser/new-repo'].id == new_repo.id
+
+    def test_deleted_repository_is_evicted(self, repository):
+        lookup_repositories(['testuser/test-repo'])
+
+        repository.delete()
+
+        assert lookup_repositories(['testuser/test-repo']) == {}
+
+    def test_owner_rename_moves_names(self, user, repository):
+        lookup_repositories(['testuser/test-repo'])
+
+        user.username = 'renamed'
+        user.save(update_fields=['username'])
+
+        assert lookup_repositories(['testuser/test-repo']) == {}
+        assert lookup_repositories(['renamed/test-repo'])['renamed/test-repo'].id == repository.id
+
+    def test_unrelated_save_keeps_index(self, repository, django_assert_num_queries):
+        lookup_repositories(['testuser/test-repo'])
+
+        repository.description = 'Updated'
+        repository.save(update_fields=['description'])
+
+        with django_assert_num_queries(0):
+            assert lookup_repositories(['testuser/test-repo'])['testuser/test-repo'].visibility == 'PUBLIC'
+
+    def test_published_change_evicts_entry(self, repository):
+        lookup_repositories(['testuser/test-repo'])
+        # Another process changed the row; only its message reaches this one
+        Repository.objects.filter(pk=repository.pk).update(visibility='PRIVATE')
+        assert lookup_repositories(['testuser/test-repo'])['testuser/test-repo'].visibility == 'PUBLIC'
+
+        acl_index._on_message(json.dumps({'repository_id': str(repository.id)}))
+
+        assert lookup_repositories(['testuser/test-repo'])['testuser/test-repo'].visibility == 'PRIVATE'
+
+    def test_new_process_reads_shared_entries(self, repository, django_assert_num_queries):
+        cache.delete(CacheKeys.repository_acl_entry(repository.id))  # As once the creation tombstone expired
+        lookup_repositories(['testuser/test-repo'])
+
+        with django_assert_num_queries(0):
+            acl = RepositoryACLIndex().lookup(['testuser/test-repo'])['testuser/test-repo']
+
+        assert acl.id == repository.id
+        assert acl.owner_id == repository.owner_id
+
+    def test_changed_repository_is_not_served_from_shared_entries(self, repository):
+        cache.delete(CacheKeys.repository_acl_entry(repository.id))
+        lookup_repositories(['testuser/test-repo'])
+
+        repository.visibility = 'PRIVATE'
+        repository.save(update_fields=['visibility'])
+        # A process that read the row before the change cannot share it again
+        acl_index._write_shared({'testuser/test-repo': RepositoryACL(
+            repository.id, repository.owner_id, 'PUBLIC', False,
+        )})
+
+        acl = RepositoryACLIndex().lookup(['testuser/test-repo'])['testuser/test-repo']
+        assert acl.visibility == 'PRIVATE'
+
+    def test_lookups_are_not_kept_until_subscribed(self, repository, django_assert_num_queries):
+        index = RepositoryACLIndex()
+        index._subscription = threading.Event()  # Never confirmed
+        index._waited = True
+        index.lookup(['testuser/missing'])
+
+        with django_assert_num_queries(1):
+            assert index.lookup(['testuser/missing']) == {}
+
+
+def _pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ).decode()
+
+
+class TestTokenSigning:
+    """Test registry tokens are signed with key material parsed once"""
+
+    @pytest.mark.parametrize('algorithm,key', [
+        ('RS256', lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+        ('ES256', lambda: ec.generate_private_key(ec.SECP256R1())),
+    ])
+    def test_tokens_verify_with_public_key(self, algorithm, key):
+        private_key = key()
+        token = TokenSigner(_pem(private_key), '', algorithm).sign({'sub': 'testuser', 'access': []})
+
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+        assert jwt.decode(token, public_pem, algorithms=[algorithm]) == {'sub': 'testuser', 'access': []}
+        assert jwt.get_unverified_header(token)['alg'] == algorithm
+
+    def test_eddsa_signature_verifies(self):
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        token = TokenSigner(_pem(private_key), '', 'EdDSA').sign({'sub': 'testuser'})
+
+        header, payload, signature = token.split('.')
+        private_key.public_key().verify(
+            base64.urlsafe_b64decode(signature + '=='), f'{header}.{payload}'.encode(),
+        )
+        assert jwt.get_unverified_header(token)['alg'] == 'EdDSA'
+
+    def test_header_carries_certificate_chain(self, settings):
+        token = get_token_signer().sign({'sub': 'testuser'})
+
+        certificate = x509.load_der_x509_certificate(
+            base64.b64decode(jwt.get_unverified_header(token)['x5c'][0])
+        )
+        assert certificate == x509.load_pem_x509_certificate(settings.REGISTRY_PUBLIC_CERTIFICATE.encode())
+
+    def test_signer_is_built_once(self):
+        assert get_token_signer() is get_token_signer()
+
+    def test_key_must_match_algorithm(self):
+        with pytest.raises(ImproperlyConfigured):
+            TokenSigner(_pem(ed25519.Ed25519PrivateKey.generate()), '', 'RS256')
+
+
+@pytest.mark.django_db
+class TestAccessTokens:
+    """Test access tokens authenticate without the password hasher"""
+
+    def _token_grant(self, username, password, scope):
+        request = RequestFactory().get('/api/auth/token/', {'scope': scope})
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        request.META['HTTP_AUTHORIZATION'] = f'Basic {credentials}'
+        with patch('registry.views_registry.sign_registry_token', return_value='token') as encode:
+            response = docker_auth(request)
+        access = encode.call_args[0][0]['access'] if encode.called else None
+        return response, access
+
+    def test_token_grants_access_without_password_hash(self, user, private_repository):
+        _, plaintext = AccessToken.issue(user, 'ci', allow_push=True)
+
+        with patch('registry.services.credentials.authenticate') as check:
+            response, access = self._token_grant('testuser', plaintext, 'repository:testuser/private-repo:pull,push')
+
+        assert response.status_code == 200
+        assert access == [{'type': 'repository', 'name': 'testuser/private-repo', 'actions': ['pull', 'push']}]
+        check.assert_not_called()
+
+    def test_only_digest_is_stored(self, user):
+        token, plaintext = AccessToken.issue(user, 'ci')
+
+        token.refresh_from_db()
+        assert plaintext not in (token.prefix, token.digest)
+        assert token.digest == hashlib.sha256(plaintext.encode()).hexdigest()
+
+    def test_cached_validation_needs_no_query(self, user, django_assert_num_queries):
+        _, plaintext = AccessToken.issue(user, 'ci')
+        self._token_grant('testuser', plaintext, '')
+
+        with django_assert_num_queries(0):
+            assert authenticate_registry_user('testuser', plaintext).id == user.id
+
+    def test_wrong_secret_is_rejected(self, user):
+        token, _ = AccessToken.issue(user, 'ci')
+
+        response, _ = self._token_grant('testuser', f'dkp_{token.prefix}_guess', '')
+        assert response.status_code == 401
+
+    def test_password_shaped_like_a_token_still_logs_in(self, user):
+        user.set_password('dkp_notatoken_secret')
+        user.save()
+
+        response, _ = self._token_grant('testuser', 'dkp_notatoken_secret', '')
+        assert response.status_code == 200
+
+    def test_token_is_bound_to_its_user(self, user, user_factory):
+        user_factory(username='mallory')
+        _, plaintext = AccessToken.issue(user, 'ci')
+
+        response, _ = self._token_grant('mallory', plaintext, '')
+        assert response.status_code == 401
+
+    def test_revoked_token_is_rejected_immediately(self, user):
+        token, plaintext = AccessToken.issue(user, 'ci')
+        self._token_grant('testuser', plaintext, '')
+
+        token.revoked_at = timezone.now()
+        token.save(update_fields=['revoked_at'])
+
+        response, _ = self._token_grant('testuser', plaintext, '')
+        assert response.status_code == 401
+
+    def test_expired_token_is_rejected(self, user):
+        _, plaintext = AccessToken.issue(user, 'ci', expires_at=timezone.now() - timedelta(minutes=1))
+
+        response, _ = self._token_grant('testuser', plaintext, '')
+        assert response.status_code == 401
+
+    def test_deactivated_user_token_is_rejected(self, user):
+        _, plaintext = AccessToken.issue(user, 'ci')
+        self._token_grant('testuser', plaintext, '')
+
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+
+        response, _ = self._token_grant('testuser', plaintext, '')
+        assert response.status_code == 401
+
+    def test_repository_limits_and_read_only(self, user, repository, private_repository):
+        _, plaintext = AccessToken.issue(user, 'ci', repositories=['testuser/private-repo'])
+
+        _, access = self._token_grant('testuser', plaintext, [
+            'repository:testuser/private-repo:pull,push',
+            'repository:testuser/test-repo:pull,push',
+        ])
+
+        assert access == [{'type': 'repository', 'name': 'testuser/private-repo', 'actions': ['pull']}]
+
+    def test_last_used_is_written_once_per_interval(self, user):
+        token, plaintext = AccessToken.issue(user, 'ci')
+
+        with patch('registry.services.credentials.AccessToken.objects.filter', wraps=AccessToken.objects.filter) as lookup:
+            for _ in range(3):
+                self._token_grant('testuser', plaintext, '')
+
+        token.refresh_from_db()
+        assert token.last_used_at is not None
+        # One row lookup and one last_used_at update, however many requests
+        assert lookup.call_count == 2
@@ -10,7 +10,9 @@ from django.utils import timezone
 from datetime import timedelta
 
 from registry.models import Repository, Star
-from registry.utils import calculate_relevance_score, search_public_repositories, get_repository_badges
+from registry.utils import (
+    calculate_relevance_score, decay_relevance_scores, search_public_repositories, get_repository_badges
+)
 
 User = get_user_model()
 
@@ -199,6 +201,54 @@ class TestPublicSearch:
         assert results.count() == 1
         assert results.first() == setup_test_data['repos']['verified']
 
+    def test_search_matches_word_prefix(self, setup_test_data):
+        """Partial words still match, like the previous icontains search"""
+        results = search_public_repositories(query='ngi')
+
+        assert results.count() == 1
+        assert results.first() == setup_test_data['repos']['official']
+
+    def test_search_without_words_returns_nothing(self, setup_test_data):
+        """Queries with no searchable terms match nothing"""
+        results = search_public_repositories(query='--- !!')
+
+        assert results.count() == 0
+
+    def test_search_follows_repository_rename(self, setup_test_data):
+        """The stored search document is refreshed when a repository is renamed"""
+        repo = setup_test_data['repos']['regular']
+        repo.name = 'renamed-service'
+        repo.save()
+
+        assert search_public_repositories(query='renamed').first() == repo
+        assert search_public_repositories(query='regular-app').count() == 0
+
+    def test_search_follows_owner_rename(self, setup_test_data):
+        """Owner usernames are part of the document, so a rename is searchable"""
+        owner = setup_test_data['users']['sponsored']
+        owner.username = 'openfoundation'
+        owner.save()
+
+        results = search_public_repositories(query='openfoundation')
+        assert results.count() == 1
+        assert results.first() == setup_test_data['repos']['sponsored']
+
+    def test_name_match_ranks_above_description_match(self, setup_test_data):
+        """Name hits carry more text relevance than description hits"""
+        user = setup_test_data['users']['regular']
+        by_name = Repository.objects.create(
+            owner=user, name='redis-tools', description='Helpers',
+            visibility=Repository.Visibility.PUBLIC,
+        )
+        by_description = Repository.objects.create(
+            owner=user, name='helpers', description='Tools for redis',
+            visibility=Repository.Visibility.PUBLIC,
+        )
+
+        scored = {r.id: r.text_score for r in calculate_relevance_score(search_public_repositories(query='redis'))}
+
+        assert scored[by_name.id] > scored[by_description.id]
+
 
 
 @pytest.mark.django_db
@@ -245,23 +295,58 @@ class TestRelevanceScoring:
         assert official_scored.relevance_score > regular_scored.relevance_score
     
     def test_old_repos_have_lower_time_score(self, setup_test_data):
-        """Old repositories should have lower time relevance scores"""
+        """The decay job lowers the persisted score of repositories that went stale"""
         recent = setup_test_data['repos']['regular']
         old = setup_test_data['repos']['old']
         
         # Verify that old repo is actually older
         assert old.updated_at < recent.updated_at
-        
-        repos = Repository.objects.filter(id__in=[recent.id, old.id])
-        scored = list(calculate_relevance_score(repos))
-        
-        # Find scored repos
-        recent_scored = next(r for r in scored if r.id == recent.id)
-        old_scored = next(r for r in scored if r.id == old.id)
-        
-        # Recent repo should have higher time_score due to fresher updated_at
-        # Check that time_score is higher for recent repo
-        assert recent_scored.time_score > old_scored.time_score
+        score_before_decay = old.relevance_score
+        recent_before_decay = recent.relevance_score
+
+        decay_relevance_scores(chunk_size=2)
+
+        old.refresh_from_db()
+        recent.refresh_from_db()
+
+        # 180 days without updates removes almost all of the 15-point freshness bonus
+        assert old.relevance_score < score_before_decay - 14
+        assert recent.relevance_score == pytest.approx(recent_before_decay, abs=0.01)
+
+    def test_publisher_status_change_updates_score(self, setup_test_data):
+        """Owner badge changes are reflected in the persisted score"""
+        repo = setup_test_data['repos']['regular']
+        owner = setup_test_data['users']['regular']
+        score_before = repo.relevance_score
+
+        owner.publisher_status = User.PublisherStatus.VERIFIED_PUBLISHER
+        owner.save(update_fields=['publisher_status'])
+
+        repo.refresh_from_db()
+        assert repo.relevance_score == pytest.approx(score_before + 25, abs=0.01)
+
+    def test_star_updates_score(self, setup_test_data):
+        """Starring through the service refreshes the persisted score"""
+        from registry.services.stars import star_repository
+
+        repo = setup_test_data['repos']['regular']
+        score_before = repo.relevance_score
+
+        star_repository(setup_test_data['users']['verified'], repo)
+
+        repo.refresh_from_db()
+        assert repo.relevance_score > score_before
+
+    def test_save_without_score_fields_keeps_score(self, setup_test_data):
+        """Saves that touch no scoring field skip the recompute"""
+        repo = setup_test_data['repos']['regular']
+        Repository.objects.filter(id=repo.id).update(relevance_score=1.0)
+
+        repo.description = 'Only the description changed'
+        repo.save(update_fields=['description'])
+
+        repo.refresh_from_db()
+        assert repo.relevance_score == 1.0
 
 
 @pytest.mark.django_db
@@ -373,3 +458,85 @@ class TestExploreView:
         # Check that scores are descending
         for i in range(len(repos) - 1):
             assert repos[i].relevance_score >= repos[i + 1].relevance_score
+
+
+@pytest.mark.django_db
+class TestExploreCursorPagination:
+    """Test keyset (cursor) pagination on the explore view"""
+
+    @pytest.fixture
+    def many_repos(self, setup_test_data):
+        user = setup_test_data['users']['regular']
+        for i in range(25):
+            Repository.objects.create(
+                owner=user,
+                name=f'test-repo-{i}',
+                visibility=Repository.Visibility.PUBLIC,
+                is_official=False
+            )
+        return setup_test_data
+
+    def test_cursor_pages_walk_all_results_once(self, many_repos, settings):
+        """Following next cursors visits every public repo exactly once, in score order"""
+        settings.EXPLORE_CURSOR_PAGINATION = True
+        client = Client()
+
+        first = client.get(reverse('explore'))
+        first_page = first.context['cursor_page']
+        assert len(first_page) == 20
+        assert first_page.has_next
+        assert not first_page.has_previous
+
+        second = client.get(reverse('explore'), {'after': first_page.next_cursor})
+        second_page = second.context['cursor_page']
+        assert len(second_page) == 10  # 25 + 5 public fixture repos
+        assert not second_page.has_next
+        assert second_page.has_previous
+
+        seen = [repo.id for repo in first_page] + [repo.id for repo in second_page]
+        assert len(seen) == len(set(seen)) == 30
+        scores = [repo.rank_score for repo in list(first_page) + list(second_page)]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_prev_cursor_returns_previous_page(self, many_repos, settings):
+        """The previous cursor of page two leads back to page one"""
+        settings.EXPLORE_CURSOR_PAGINATION = True
+        client = Client()
+
+        first_page = client.get(reverse('explore')).context['cursor_page']
+        second_page = client.get(reverse('explore'), {'after': first_page.next_cursor}).context['cursor_page']
+        back = client.get(reverse('explore'), {'before': second_page.prev_cursor}).context['cursor_page']
+
+        assert [r.id for r in back] == [r.id for r in first_page]
+        assert not back.has_previous
+
+    def test_cursor_param_enables_cursor_mode(self, setup_test_data):
+        """An after/before parameter switches to cursor mode even when it is off"""
+        client = Client()
+        response = client.get(reverse('explore'), {'after': 'not-a-cursor'})
+
+        assert 'cursor_page' in response.context
+        assert response.context['repositories'][0] == setup_test_data['repos']['official']
+
+    def test_large_totals_are_capped(self, many_repos, settings):
+        """Counting stops at EXPLORE_COUNT_LIMIT and the page reports many results"""
+        settings.EXPLORE_CURSOR_PAGINATION = True
+        settings.EXPLORE_COUNT_LIMIT = 10
+        client = Client()
+
+        response = client.get(reverse('explore'))
+
+        assert response.context['total_results'] == 10
+        assert response.context['total_is_capped'] is True
+        assert b'Many results' in response.content
+
+    def test_cursor_search_keeps_query_in_links(self, many_repos, settings):
+        """Search filters survive in the prev/next links"""
+        settings.EXPLORE_CURSOR_PAGINATION = True
+        client = Client()
+
+        response = client.get(reverse('explore'), {'q': 'test'})
+
+        assert len(response.context['cursor_page']) == 20
+        assert 'q=test' in response.context['link_querystring']
+        assert b'q=test&amp;after=' in response.content
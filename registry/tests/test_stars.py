@@ -141,3 +141,265 @@ class TestStarCountCaching:
         actual_count = Star.objects.filter(repository=repo).count()
         assert repo.star_count == actual_count
         assert repo.star_count == 2
+
+    @pytest.mark.parametrize('chunk_size', [None, 2])
+    def test_reconcile_corrects_only_drifted_counts(self, setup_test_data, chunk_size):
+        """Reconciliation rewrites drifted star_count values and reports them"""
+        from registry.utils import reconcile_star_counts
+
+        repos = setup_test_data['repos']
+        # The fixture's counts have no Star rows behind them
+        assert len(reconcile_star_counts(chunk_size=chunk_size)) == Repository.objects.count()
+
+        Star.objects.create(user=setup_test_data['users']['verified'], repository=repos['regular'])
+        Repository.objects.filter(id=repos['regular'].id).update(star_count=5)
+        Repository.objects.filter(id=repos['official'].id).update(star_count=3)
+
+        drifted = reconcile_star_counts(chunk_size=chunk_size)
+
+        assert set(drifted) == {repos['regular'].id, repos['official'].id}
+        for repo in Repository.objects.all():
+            assert repo.star_count == Star.objects.filter(repository=repo).count()
+        assert reconcile_star_counts(chunk_size=chunk_size) == []
+
+
+# ====================
+# Write-behind Star Tests
+# ====================
+
+@pytest.mark.django_db
+class TestWriteBehindStars:
+    """Test star toggles land in Redis and are persisted by flush_stars"""
+
+    @pytest.fixture(autouse=True)
+    def write_behind(self, settings):
+        from django_redis import get_redis_connection
+        from registry.cache_keys import CacheKeys
+        from registry.services.stars import STARS_CACHE, _keys
+
+        settings.STARS_WRITE_BEHIND = True
+        get_redis_connection(STARS_CACHE).delete(*_keys(
+            CacheKeys.pending_stars(), CacheKeys.pending_star_counts(),
+            CacheKeys.flushing_stars(), CacheKeys.flushing_star_counts(),
+        ))
+
+    def test_star_is_pending_until_flushed(self, other_user, public_repo):
+        from registry.services.stars import has_starred, pending_star_counts, star_repository
+
+        assert star_repository(other_user, public_repo) is True
+        assert star_repository(other_user, public_repo) is False
+
+        public_repo.refresh_from_db()
+        assert Star.objects.count() == 0
+        assert public_repo.star_count == 0
+        assert has_starred(other_user, public_repo)
+        assert pending_star_counts([public_repo.id]) == {public_repo.id: 1}
+
+    def test_flush_persists_stars_and_recounts(self, other_user, admin_user_for_stars, public_repo):
+        from registry.services.stars import flush_stars, pending_star_counts, star_repository
+
+        star_repository(other_user, public_repo)
+        star_repository(admin_user_for_stars, public_repo)
+
+        assert flush_stars() == 2
+
+        public_repo.refresh_from_db()
+        assert Star.objects.filter(repository=public_repo).count() == 2
+        assert public_repo.star_count == 2
+        assert pending_star_counts([public_repo.id]) == {}
+
+    def test_last_toggle_wins(self, other_user, public_repo):
+        from registry.services.stars import flush_stars, has_starred, star_repository, unstar_repository
+
+        Star.objects.create(user=other_user, repository=public_repo)
+        Repository.objects.filter(id=public_repo.id).update(star_count=1)
+
+        assert unstar_repository(other_user, public_repo) == 1
+        assert star_repository(other_user, public_repo) is True
+        assert unstar_repository(other_user, public_repo) == 1
+        assert unstar_repository(other_user, public_repo) == 0
+        assert not has_starred(other_user, public_repo)
+
+        flush_stars()
+
+        public_repo.refresh_from_db()
+        assert not Star.objects.filter(user=other_user, repository=public_repo).exists()
+        assert public_repo.star_count == 0
+
+    def test_starred_set_loads_operations_being_flushed(self, other_user, public_repo):
+        from django_redis import get_redis_connection
+        from registry.cache_keys import CacheKeys
+        from registry.services.stars import (
+            BEGIN_FLUSH_SCRIPT, STARS_CACHE, _keys, _script, has_starred, star_repository,
+        )
+
+        star_repository(other_user, public_repo)
+        # A flush has taken the operation but not written the row yet
+        _script(BEGIN_FLUSH_SCRIPT)(keys=_keys(
+            CacheKeys.pending_stars(), CacheKeys.pending_star_counts(),
+            CacheKeys.flushing_stars(), CacheKeys.flushing_star_counts(),
+        ))
+        get_redis_connection(STARS_CACHE).delete(*_keys(CacheKeys.user_star_set(other_user.pk)))
+
+        assert has_starred(other_user, public_repo)
+
+    def test_overlay_adds_pending_stars(self, other_user, public_repo):
+        from registry.services.stars import overlay_pending_stars, star_repository
+
+        star_repository(other_user, public_repo)
+
+        overlay_pending_stars([public_repo])
+
+        assert public_repo.star_count == 1
+
+    def test_star_view_uses_write_behind(self, client, other_user, public_repo):
+        client.login(username="other", password="pass")
+        client.post(reverse("repo_star", kwargs={"repo_id": public_repo.id}), follow=True)
+
+        response = client.get(reverse("public_repository_detail", kwargs={"repo_id": public_repo.id}))
+
+        assert Star.objects.count() == 0
+        assert response.context['user_starred'] is True
+        assert response.context['star_count'] == 1
+
+
+# ====================
+# Starred-by-me Lookup Tests
+# ====================
+
+@pytest.mark.django_db
+class TestStarredLookups:
+    """Test listings learn which repositories the user starred in one lookup"""
+
+    @pytest.fixture
+    def second_repo(self, owner_user):
+        return Repository.objects.create(
+            owner=owner_user, name="pub2", visibility=Repository.Visibility.PUBLIC,
+        )
+
+    def test_starred_repository_ids_returns_starred_subset(self, other_user, public_repo, second_repo,
+                                                           django_capture_on_commit_callbacks):
+        from registry.services.stars import star_repository, starred_repository_ids
+
+        with django_capture_on_commit_callbacks(execute=True):
+            star_repository(other_user, public_repo)
+
+        assert starred_repository_ids(other_user, [public_repo.id, second_repo.id]) == {public_repo.id}
+
+    def test_loaded_set_follows_committed_unstar(self, other_user, public_repo,
+                                                  django_capture_on_commit_callbacks):
+        from registry.services.stars import has_starred, star_repository, unstar_repository
+
+        star_repository(other_user, public_repo)
+        assert has_starred(other_user, public_repo)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            unstar_repository(other_user, public_repo)
+
+        assert not has_starred(other_user, public_repo)
+
+    def test_change_committed_during_load_is_not_lost(self, other_user, public_repo,
+                                                       django_capture_on_commit_callbacks):
+        from unittest.mock import patch
+        from registry.services import stars
+
+        script = stars._script
+
+        def star_before_storing(source):
+            if source != stars.LOAD_STARRED_SET_SCRIPT:
+                return script(source)
+
+            def load(**kwargs):
+                # A database-path star commits after the load read the rows
+                with django_capture_on_commit_callbacks(execute=True):
+                    stars.star_repository(other_user, public_repo)
+                return script(source)(**kwargs)
+            return load
+
+        with patch.object(stars, '_script', side_effect=star_before_storing):
+            assert not stars.has_starred(other_user, public_repo)
+
+        assert stars.has_starred(other_user, public_repo)
+
+    def test_starred_page_renders_unstar_toggles(self, client, other_user, public_repo, second_repo):
+        Star.objects.create(user=other_user, repository=public_repo)
+        Star.objects.create(user=other_user, repository=second_repo)
+        client.login(username="other", password="pass")
+
+        response = client.get(reverse("starred_repositories"))
+
+        assert all(repo.user_starred for repo in response.context['repositories'])
+        assert reverse("repo_unstar", kwargs={"repo_id": public_repo.id}) in response.content.decode()
+
+
+# ====================
+# Star API Tests
+# ====================
+
+@pytest.mark.django_db
+class TestStarApi:
+    """Test the JSON star endpoint used for in-place toggles"""
+
+    def _url(self, repo):
+        return reverse("repo_star_api", kwargs={"repo_id": repo.id})
+
+    def test_put_and_delete_are_idempotent(self, client, other_user, public_repo):
+        client.login(username="other", password="pass")
+
+        for _ in range(2):
+            response = client.put(self._url(public_repo))
+            assert response.status_code == 200
+            assert response.json() == {"starred": True, "star_count": 1}
+        assert Star.objects.count() == 1
+
+        for _ in range(2):
+            response = client.delete(self._url(public_repo))
+            assert response.json() == {"starred": False, "star_count": 0}
+        assert Star.objects.count() == 0
+
+    def test_get_reports_state(self, client, other_user, public_repo):
+        Star.objects.create(user=other_user, repository=public_repo)
+        Repository.objects.filter(id=public_repo.id).update(star_count=1)
+        client.login(username="other", password="pass")
+
+        response = client.get(self._url(public_repo))
+
+        assert response.json() == {"starred": True, "star_count": 1}
+
+    def test_requires_authentication(self, client, public_repo):
+        assert client.put(self._url(public_repo)).status_code == 401
+
+    def test_own_repository_is_forbidden(self, client, owner_user, public_repo):
+        client.login(username="owner", password="pass")
+
+        response = client.put(self._url(public_repo))
+
+        assert response.status_code == 403
+        assert Star.objects.count() == 0
+
+    def test_private_repository_is_not_found(self, client, other_user, private_repo):
+        client.login(username="other", password="pass")
+
+        assert client.put(self._url(private_repo)).status_code == 404
+
+    def test_delete_cannot_probe_private_repositories(self, client, other_user, private_repo):
+        import uuid
+
+        client.login(username="other", password="pass")
+        private = client.delete(self._url(private_repo))
+        missing = client.delete(reverse("repo_star_api", kwargs={"repo_id": uuid.uuid4()}))
+
+        assert private.status_code == missing.status_code == 404
+        assert private.json() == missing.json()
+
+    def test_rate_limited_per_user(self, client, settings, other_user, public_repo):
+        settings.STAR_API_RATE_LIMIT = 2
+        client.login(username="other", password="pass")
+
+        client.put(self._url(public_repo))
+        client.delete(self._url(public_repo))
+        response = client.put(self._url(public_repo))
+
+        assert response.status_code == 429
+        assert int(response['Retry-After']) > 0
+        assert Star.objects.count() == 0
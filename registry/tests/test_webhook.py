@@ -1,9 +1,14 @@
 import json
+from unittest.mock import patch
 import pytest
+from django.core.cache import cache
 from django.test import RequestFactory
 from django.contrib.auth import get_user_model
 
+from registry import metrics
 from registry.models import Repository, Tag
+from registry.services.event_queue import ensure_consumer_group, process_batch, queue_stats
+from registry.services.pull_counts import flush_pull_counts, overlay_pending_pulls, pending_pull_counts
 from registry.views_registry import registry_webhook
 
 User = get_user_model()
@@ -40,6 +45,14 @@ def official_repository(db, user):
     )
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Event ids are remembered in Redis for deduplication
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.mark.django_db
 class TestWebhook:
     """Test registry webhook functionality"""
@@ -284,3 +297,264 @@ class TestWebhook:
 
         response = registry_webhook(request)
         assert response.status_code == 200  # Should handle gracefully
+
+
+@pytest.mark.django_db
+class TestWebhookBatching:
+    """Test a multi-event envelope is ingested with bulk writes"""
+
+    @staticmethod
+    def _event(action, repository, tag, digest='sha256:abc', size=100):
+        return {
+            "action": action,
+            "target": {"digest": digest, "size": size, "repository": repository, "tag": tag},
+        }
+
+    def _post(self, events):
+        request = RequestFactory().post('/api/webhooks/registry/',
+                                        data=json.dumps({"events": events}),
+                                        content_type='application/json')
+        return registry_webhook(request)
+
+    def test_envelope_upserts_tags_and_sums_pulls(self, repository, official_repository):
+        Tag.objects.create(repository=repository, name='latest', digest='sha256:old', size=1)
+
+        response = self._post([
+            self._event('push', 'testuser/test-app', 'latest', digest='sha256:amd64'),
+            self._event('push', 'testuser/test-app', 'latest', digest='sha256:index', size=200),
+            self._event('push', 'testuser/test-app', '1.0'),
+            self._event('push', 'ubuntu', '24.04'),
+            self._event('pull', 'testuser/test-app', 'latest'),
+            self._event('pull', 'testuser/test-app', '1.0'),
+            self._event('pull', 'ubuntu', '24.04'),
+            self._event('push', 'unknown/repo', 'latest'),
+        ])
+
+        assert response.status_code == 200
+        latest = Tag.objects.get(repository=repository, name='latest')
+        assert (latest.digest, latest.size) == ('sha256:index', 200)
+        assert Tag.objects.filter(repository=repository).count() == 2
+        assert Tag.objects.filter(repository=official_repository, name='24.04').exists()
+
+        repository.refresh_from_db()
+        official_repository.refresh_from_db()
+        assert repository.pull_count == 2
+        assert official_repository.pull_count == 1
+
+    def test_envelope_resolves_repositories_in_one_query(self, repository, official_repository, django_assert_num_queries):
+        events = [self._event('pull', 'testuser/test-app', f'v{i}') for i in range(10)]
+        events += [self._event('pull', 'ubuntu', 'latest')]
+
+        # repository lookup, savepoint, pull UPDATE, relevance UPDATE, release savepoint
+        with django_assert_num_queries(5):
+            self._post(events)
+
+    def test_pull_updates_relevance_score(self, repository):
+        before = Repository.objects.get(pk=repository.pk).relevance_score
+
+        self._post([self._event('pull', 'testuser/test-app', 'latest')] * 50)
+
+        assert Repository.objects.get(pk=repository.pk).relevance_score > before
+
+
+@pytest.mark.django_db
+class TestWriteBehindPullCounts:
+    """Test pulls are counted in Redis and flushed to Postgres in batches"""
+
+    @pytest.fixture(autouse=True)
+    def write_behind(self, settings):
+        settings.PULL_COUNT_WRITE_BEHIND = True
+
+    def _pull(self, repository_name, times=1):
+        events = [{
+            "action": "pull",
+            "target": {"digest": "sha256:abc", "size": 1, "repository": repository_name, "tag": "latest"},
+        }] * times
+        request = RequestFactory().post('/api/webhooks/registry/',
+                                        data=json.dumps({"events": events}),
+                                        content_type='application/json')
+        return registry_webhook(request)
+
+    def test_pulls_are_pending_until_flushed(self, repository):
+        self._pull('testuser/test-app', times=3)
+        self._pull('testuser/test-app')
+
+        repository.refresh_from_db()
+        assert repository.pull_count == 0
+        assert pending_pull_counts([repository.id]) == {repository.id: 4}
+
+    def test_flush_applies_deltas_without_touching_updated_at(self, repository, official_repository):
+        updated_at = repository.updated_at
+        self._pull('testuser/test-app', times=2)
+        self._pull('ubuntu')
+
+        assert flush_pull_counts() == 2
+
+        repository.refresh_from_db()
+        official_repository.refresh_from_db()
+        assert repository.pull_count == 2
+        assert official_repository.pull_count == 1
+        assert repository.updated_at == updated_at
+        assert pending_pull_counts([repository.id]) == {}
+
+    def test_flush_retried_after_commit_is_not_applied_twice(self, repository):
+        from django_redis import get_redis_connection
+
+        self._pull('testuser/test-app', times=2)
+        redis = get_redis_connection("default")
+        # The worker dies after the commit, before dropping the flushing hash
+        with patch('registry.services.pull_counts._redis', return_value=redis), \
+                patch.object(redis, 'delete', side_effect=RuntimeError('worker died')):
+            with pytest.raises(RuntimeError):
+                flush_pull_counts()
+
+        repository.refresh_from_db()
+        assert repository.pull_count == 2
+        overlay_pending_pulls([repository])
+        assert repository.pull_count == 2
+
+        assert flush_pull_counts() == 0
+        repository.refresh_from_db()
+        assert repository.pull_count == 2
+        assert pending_pull_counts([repository.id]) == {}
+
+    def test_flush_with_nothing_pending(self):
+        assert flush_pull_counts() == 0
+
+    def test_overlay_adds_pending_pulls(self, repository):
+        self._pull('testuser/test-app', times=5)
+
+        overlay_pending_pulls([repository])
+
+        assert repository.pull_count == 5
+
+
+@pytest.mark.django_db
+class TestAsyncWebhook:
+    """Test the webhook queues envelopes and workers ingest them"""
+
+    @pytest.fixture(autouse=True)
+    def async_webhook(self, settings):
+        settings.REGISTRY_WEBHOOK_ASYNC = True
+        ensure_consumer_group()
+
+    def _post(self, payload):
+        request = RequestFactory().post('/api/webhooks/registry/',
+                                        data=payload if isinstance(payload, str) else json.dumps(payload),
+                                        content_type='application/json')
+        return registry_webhook(request)
+
+    def test_envelope_is_acknowledged_then_processed(self, repository):
+        response = self._post({"events": [{
+            "action": "push",
+            "target": {"digest": "sha256:abc", "size": 10, "repository": "testuser/test-app", "tag": "latest"},
+        }]})
+
+        assert response.status_code == 202
+        assert not Tag.objects.filter(repository=repository).exists()
+
+        assert process_batch('test-worker', block_ms=1) == 1
+
+        assert Tag.objects.filter(repository=repository, name='latest').exists()
+        stats = queue_stats()
+        assert stats['pending'] == 0
+        assert stats['counters']['webhook.envelopes_processed'] == 1
+        assert stats['counters']['webhook.events_processed'] == 1
+
+    def test_invalid_json_is_rejected(self):
+        assert self._post('invalid json').status_code == 400
+
+    def test_malformed_envelope_is_dead_lettered(self, repository):
+        self._post({"events": [{"action": "push", "target": {"repository": "testuser/test-app"}}]})
+
+        assert process_batch('test-worker', block_ms=1) == 1
+
+        stats = queue_stats()
+        assert stats['dead_letter_length'] == 1
+        assert stats['pending'] == 0
+
+    def test_metrics_require_analytics_permission(self, client, regular_user, admin_user):
+        client.login(username='alice', password='pass12345')
+        assert client.get('/api/webhooks/registry/metrics/').status_code == 403
+
+        client.login(username='admin1', password='pass12345')
+        response = client.get('/api/webhooks/registry/metrics/')
+        assert response.status_code == 200
+        assert 'stream_length' in response.json()
+
+
+@pytest.mark.django_db
+class TestWebhookDeduplication:
+    """Test retried notifications are applied once"""
+
+    @staticmethod
+    def _envelope(*events):
+        return {"events": [
+            {
+                "id": event_id,
+                "action": action,
+                "target": {"digest": "sha256:abc", "size": 1, "repository": "testuser/test-app", "tag": "latest"},
+            }
+            for event_id, action in events
+        ]}
+
+    def _post(self, payload):
+        request = RequestFactory().post('/api/webhooks/registry/',
+                                        data=json.dumps(payload),
+                                        content_type='application/json')
+        return registry_webhook(request)
+
+    def test_retried_pull_is_counted_once(self, repository):
+        self._post(self._envelope(('evt-1', 'pull')))
+        response = self._post(self._envelope(('evt-1', 'pull')))
+
+        assert response.status_code == 200
+        repository.refresh_from_db()
+        assert repository.pull_count == 1
+
+        counters = metrics.get_counters()
+        assert counters['webhook.events_received'] == 2
+        assert counters['webhook.events_duplicate'] == 1
+
+    def test_duplicate_envelope_skips_database(self, repository, django_assert_num_queries):
+        self._post(self._envelope(('evt-1', 'push'), ('evt-2', 'pull')))
+
+        with django_assert_num_queries(0):
+            self._post(self._envelope(('evt-1', 'push'), ('evt-2', 'pull')))
+
+    def test_only_new_events_of_a_retry_are_applied(self, repository):
+        self._post(self._envelope(('evt-1', 'pull')))
+        self._post(self._envelope(('evt-1', 'pull'), ('evt-2', 'pull')))
+
+        repository.refresh_from_db()
+        assert repository.pull_count == 2
+
+    def test_failed_ingestion_releases_event_ids(self, repository, monkeypatch):
+        def fail(pulls):
+            raise RuntimeError("database unavailable")
+
+        monkeypatch.setattr('registry.services.webhook.apply_pull_deltas', fail)
+        assert self._post(self._envelope(('evt-1', 'pull'))).status_code == 500
+        monkeypatch.undo()
+
+        self._post(self._envelope(('evt-1', 'pull')))
+
+        repository.refresh_from_db()
+        assert repository.pull_count == 1
+
+    def test_event_id_is_remembered_only_after_commit(self, repository, settings,
+                                                      django_capture_on_commit_callbacks):
+        from django_redis import get_redis_connection
+        from registry.cache_keys import CacheKeys
+
+        key = cache.make_key(CacheKeys.registry_event_seen('evt-1'))
+        redis = get_redis_connection("default")
+
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            self._post(self._envelope(('evt-1', 'pull')))
+        # A worker killed here leaves only the short processing claim behind
+        assert 0 < redis.ttl(key) <= settings.REGISTRY_EVENT_CLAIM_TTL
+
+        for callback in callbacks:
+            callback()
+        assert redis.ttl(key) > settings.REGISTRY_EVENT_CLAIM_TTL
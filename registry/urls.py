@@ -27,6 +27,7 @@ urlpatterns = [
     # Star functionality URLs
     path('repositories/<uuid:repo_id>/star/', views_stars.star, name='repo_star'),
     path('repositories/<uuid:repo_id>/unstar/', views_stars.unstar, name='repo_unstar'),
+    path('api/repositories/<uuid:repo_id>/star/', views_stars.star_api, name='repo_star_api'),
     # Admin repository management URLs
     path(
         'admin/repositories/', views.admin_repository_list, name='admin_repository_list'
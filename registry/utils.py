@@ -1,8 +1,25 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
 from django.utils import timezone
 from django.db.models import (
     Count, Q, F, FloatField, Case, When, Value, 
-    ExpressionWrapper, Func
+    ExpressionWrapper, Func, OuterRef, Subquery
 )
+from django.db.models.functions import Coalesce
+
+
+# Names and usernames are identifiers, so no language stemming
+SEARCH_CONFIG = 'simple'
+
+# ts_rank is roughly 0..1, scaled to sit alongside the badge boost
+SEARCH_RANK_WEIGHT = 30.0
+
+SEARCH_VECTOR_SOURCE_FIELDS = frozenset({'name', 'description', 'owner', 'owner_id'})
+
+# updated_at is left out on purpose: freshness is re-applied in bulk by the decay job
+RELEVANCE_SCORE_SOURCE_FIELDS = frozenset({'pull_count', 'star_count', 'is_official', 'owner', 'owner_id'})
 
 
 # Custom PostgreSQL functions for database-level calculations
@@ -23,45 +40,189 @@ class Extract(Func):
     output_field = FloatField()
 
 
-def calculate_relevance_score(repositories_queryset):
-    now = timezone.now()
-    
-    return repositories_queryset.annotate(
-        pull_score=ExpressionWrapper(
-            Log10(F('pull_count') + 1) * 8,
-            output_field=FloatField()
-        ),
-        
-        star_score=ExpressionWrapper(
-            Log10(F('star_count') + 1) * 12,
-            output_field=FloatField()
-        ),
-        
-        badge_score=Case(
-            When(is_official=True, then=Value(40.0)),
-            When(owner__publisher_status='VERIFIED_PUBLISHER', then=Value(25.0)),
-            When(owner__publisher_status='SPONSORED_OSS', then=Value(15.0)),
-            default=Value(0.0),
-            output_field=FloatField()
-        ),
-        
-        days_since_update=ExpressionWrapper(
-            Extract(Value(now) - F('updated_at')) / 86400.0,
-            output_field=FloatField()
-        ),
-        time_score=ExpressionWrapper(
-            15 * Exp(-F('days_since_update') / 60),
-            output_field=FloatField()
+def repository_search_vector():
+    """
+    Weighted document for a repository: name (A), owner username (B), description (C).
+    Usable in UPDATE statements, so the owner is read through a subquery instead of a join.
+    """
+    from django.contrib.auth import get_user_model
+
+    owner_username = Subquery(
+        get_user_model().objects.filter(pk=OuterRef('owner_id')).values('username')[:1]
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(owner_username, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def build_search_query(query):
+    """
+    Turn free text into a prefix tsquery ("ngi web" -> "ngi:* & web:*"), so partial
+    words keep matching like the old icontains search did.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    raw_query = ' & '.join(f'{term}:*' for term in terms)
+    return SearchQuery(raw_query, search_type='raw', config=SEARCH_CONFIG)
+
+
+def relevance_score_expression(now=None):
+    """
+    Query-independent part of the explore ranking (pulls, stars, badge, freshness).
+    Usable in UPDATE statements, so the owner's badge is read through a subquery
+    instead of a join.
+    """
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+
+    now = now or timezone.now()
+
+    pull_score = Log10(F('pull_count') + 1) * 8
+    star_score = Log10(F('star_count') + 1) * 12
+
+    badge_score = Case(
+        When(is_official=True, then=Value(40.0)),
+        When(
+            owner_id__in=User.objects.filter(publisher_status='VERIFIED_PUBLISHER').values('pk'),
+            then=Value(25.0),
         ),
-        
-        relevance_score=ExpressionWrapper(
-            F('pull_score') + F('star_score') + F('badge_score') + F('time_score'),
-            output_field=FloatField()
+        When(
+            owner_id__in=User.objects.filter(publisher_status='SPONSORED_OSS').values('pk'),
+            then=Value(15.0),
         ),
-        
-        # Keep star count for display
-        star_count_display=F('star_count')
-    ).order_by('-relevance_score')
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+
+    # Decays with a 60-day time constant, re-applied by the relevance decay job
+    days_since_update = Extract(Value(now) - F('updated_at')) / 86400.0
+    time_score = 15 * Exp(-days_since_update / 60)
+
+    return ExpressionWrapper(
+        pull_score + star_score + badge_score + time_score,
+        output_field=FloatField()
+    )
+
+
+def refresh_relevance_scores(repositories_queryset, now=None):
+    return repositories_queryset.update(relevance_score=relevance_score_expression(now))
+
+
+def refresh_star_counts(repositories_queryset):
+    """Recount star_count from the Star rows, in one UPDATE for the whole queryset."""
+    from .models import Star
+
+    stars = (
+        Star.objects.filter(repository=OuterRef('pk'))
+        .order_by().values('repository').annotate(total=Count('pk')).values('total')
+    )
+    return repositories_queryset.update(star_count=Coalesce(Subquery(stars), 0))
+
+
+def iter_pk_ranges(queryset, chunk_size):
+    """
+    Yield (lower, upper) primary key bounds covering the queryset in chunks, for
+    bulk jobs that must not lock or rewrite the whole table in one statement.
+    The lower bound is exclusive (None for the first chunk), the upper inclusive.
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    lower = None
+    while True:
+        chunk = pks if lower is None else pks.filter(pk__gt=lower)
+        upper = chunk[chunk_size - 1:chunk_size].first()
+        if upper is None:
+            # Last, partial chunk
+            if chunk.exists():
+                yield lower, None
+            return
+        yield lower, upper
+        lower = upper
+
+
+def decay_relevance_scores(chunk_size=5000):
+    """
+    Re-apply the freshness decay to every repository in primary key chunks.
+    Returns the number of rows updated.
+    """
+    from .models import Repository
+
+    now = timezone.now()
+    updated = 0
+    for lower, upper in iter_pk_ranges(Repository.objects.all(), chunk_size):
+        chunk = Repository.objects.all()
+        if lower is not None:
+            chunk = chunk.filter(pk__gt=lower)
+        if upper is not None:
+            chunk = chunk.filter(pk__lte=upper)
+        updated += refresh_relevance_scores(chunk, now=now)
+    return updated
+
+
+def reconcile_star_counts(chunk_size=None):
+    """
+    Set star_count to the number of Star rows wherever the two have drifted,
+    with one set-based UPDATE per primary key chunk (or one for the whole table
+    when chunk_size is falsy). Rows that already match are not rewritten.
+    Each chunk's repositories are locked before they are counted, so a star
+    that is changing star_count meanwhile either commits first and is counted,
+    or waits and applies its F() update on top of the corrected count.
+    Returns the ids of the repositories that were corrected.
+    """
+    from .models import Repository, Star
+
+    repositories = connection.ops.quote_name(Repository._meta.db_table)
+    stars = connection.ops.quote_name(Star._meta.db_table)
+
+    if chunk_size:
+        ranges = iter_pk_ranges(Repository.objects.all(), chunk_size)
+    else:
+        ranges = [(None, None)]
+
+    drifted = []
+    for lower, upper in ranges:
+        bounds, params = [], []
+        if lower is not None:
+            bounds.append('c.id > %s')
+            params.append(lower)
+        if upper is not None:
+            bounds.append('c.id <= %s')
+            params.append(upper)
+        where = f"WHERE {' AND '.join(bounds)}" if bounds else ''
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'SELECT c.id FROM {repositories} AS c {where} ORDER BY c.id FOR UPDATE', params)
+            # A separate statement, so the count sees everything committed before the locks were granted
+            cursor.execute(
+                f'UPDATE {repositories} AS r SET star_count = s.total '
+                f'FROM (SELECT c.id, count(st.id) AS total FROM {repositories} AS c '
+                f'LEFT JOIN {stars} AS st ON st.repository_id = c.id {where} GROUP BY c.id) AS s '
+                f'WHERE r.id = s.id AND r.star_count <> s.total RETURNING r.id',
+                params,
+            )
+            corrected = [row[0] for row in cursor.fetchall()]
+            if corrected:
+                refresh_relevance_scores(Repository.objects.filter(id__in=corrected))
+        drifted.extend(corrected)
+    return drifted
+
+
+def calculate_relevance_score(repositories_queryset):
+    """
+    Order repositories by rank_score: the persisted relevance_score, plus the
+    ts_rank text component when the queryset came from a full-text search.
+    Without a search this is a plain index range scan on relevance_score.
+    """
+    if 'search_rank' in repositories_queryset.query.annotations:
+        return repositories_queryset.annotate(
+            text_score=ExpressionWrapper(F('search_rank') * SEARCH_RANK_WEIGHT, output_field=FloatField()),
+            rank_score=ExpressionWrapper(F('relevance_score') + F('text_score'), output_field=FloatField()),
+        ).order_by('-rank_score', '-id')
+
+    return repositories_queryset.annotate(
+        rank_score=F('relevance_score')
+    ).order_by('-rank_score', '-id')
 
 
 def search_public_repositories(query=None, badge_filters=None):
@@ -72,10 +233,12 @@ def search_public_repositories(query=None, badge_filters=None):
     ).select_related('owner')
 
     if query:
-        repositories = repositories.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(owner__username__icontains=query)
+        search_query = build_search_query(query)
+        if search_query is None:
+            return repositories.none()
+        # GIN-indexed match on the stored document instead of three icontains scans
+        repositories = repositories.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
         )
     
     # Apply badge filters
@@ -118,3 +281,30 @@ def get_repository_badges(repository):
             })
 
     return badges
+
+
+def resolve_repository_names(full_names, *fields):
+    """
+    Resolve registry repository names ("user/app" for user repositories,
+    "ubuntu" for official ones) with a single query. Returns
+    {full_name: {'id': ..., <fields>...}}; unknown or malformed names are absent.
+    """
+    from .models import Repository
+
+    lookup = Q()
+    for full_name in set(full_names):
+        parts = full_name.split('/')
+        if len(parts) == 2:
+            lookup |= Q(owner__username=parts[0], name=parts[1], is_official=False)
+        elif len(parts) == 1:
+            lookup |= Q(name=parts[0], is_official=True)
+
+    if not lookup:
+        return {}
+
+    resolved = {}
+    rows = Repository.objects.filter(lookup).values('id', 'name', 'is_official', 'owner__username', *fields)
+    for row in rows:
+        full_name = row['name'] if row['is_official'] else f"{row['owner__username']}/{row['name']}"
+        resolved[full_name] = row
+    return resolved
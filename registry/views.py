@@ -9,6 +9,7 @@ from .cache_keys import CacheKeys
 
 
 from accounts.permissions import (
+    has_role_permission,
     repository_management_permission_required,
     permission_required_with_403
 )
@@ -19,6 +20,10 @@ from .forms import (
     RepositoryEditForm,
     RepositorySearchForm, PublicSearchForm
 )
+from .pagination import capped_count, keyset_paginate
+from .services.explore import RankedIds, get_explore_entry, hydrate_repositories
+from .services.pull_counts import overlay_pending_pulls
+from .services.stars import has_starred, mark_starred, overlay_pending_stars
 from .utils import search_public_repositories, get_repository_badges, calculate_relevance_score
 
 
@@ -138,29 +143,38 @@ def public_repository_detail(request, repo_id):
         print(f"[CACHE HIT] Public repository data: {repo_id}")
 
     is_authenticated = request.user.is_authenticated
-    is_owner = is_authenticated and repository.owner == request.user
-    is_admin = is_authenticated and request.user.has_perm('accounts.can_manage_official_repos')
+    is_owner = is_authenticated and repository.owner_id == request.user.pk
+    is_admin = is_authenticated and has_role_permission(request.user, 'can_manage_official_repos')
 
     can_edit = is_owner or (is_admin and repository.is_official)
 
     can_star = (
             is_authenticated and
-            request.user.has_perm('accounts.can_star_repositories') and
+            has_role_permission(request.user, 'can_star_repositories') and
             not is_owner
     )
 
     user_starred = False
     if can_star:
-        user_starred = repository.stars.filter(user=request.user).exists()
+        user_starred = has_starred(request.user, repository)
 
     paginator = Paginator(cached_data['all_tags'], 20)
     page_number = request.GET.get('page')
     tags_page = paginator.get_page(page_number)
 
+    if settings.PULL_COUNT_OVERLAY_PENDING:
+        overlay_pending_pulls([cached_data['repository']])
+
+    # Stars not yet flushed to Postgres
+    star_count = cached_data['star_count']
+    if settings.STARS_WRITE_BEHIND:
+        overlay_pending_stars([cached_data['repository']])
+        star_count = cached_data['repository'].star_count
+
     context = {
         'repository': cached_data['repository'],
         'tags': tags_page,
-        'star_count': cached_data['star_count'],
+        'star_count': star_count,
         'user_starred': user_starred,
         'can_edit': can_edit,
         'can_star': can_star,
@@ -265,6 +279,9 @@ def admin_repository_list(request):
     return render(request, 'registry/admin_repository_list.html', context)
 
 
+EXPLORE_PAGE_SIZE = 20
+
+
 def explore(request):
     form = PublicSearchForm(request.GET or None)
 
@@ -275,25 +292,28 @@ def explore(request):
         query = form.cleaned_data.get('q', '').strip()
         badge_filters = form.cleaned_data.get('badges', [])
 
-    cache_key = CacheKeys.explore(query, badge_filters)
-    repositories_with_scores = cache.get(cache_key)
-
-    if repositories_with_scores is None:
-        print(f"[CACHE MISS] Exploring: query='{query}', badges={badge_filters}")
-        repositories = search_public_repositories(query=query, badge_filters=badge_filters)
-
-        repositories_with_scores = calculate_relevance_score(repositories)
-
-        for repo in repositories_with_scores:
-            repo.badges = get_repository_badges(repo)
+    use_cursor = (
+        settings.EXPLORE_CURSOR_PAGINATION
+        or 'after' in request.GET
+        or 'before' in request.GET
+    )
+    if use_cursor:
+        return _explore_cursor_page(request, form, query, badge_filters)
 
-        cache.set(cache_key, repositories_with_scores, settings.CACHE_TIMEOUT_EXPLORE)
-    else:
-        print(f"[CACHE HIT] Exploring: query='{query}', badges={badge_filters}")
+    explore_entry = get_explore_entry(query, badge_filters)
 
-    paginator = Paginator(repositories_with_scores, 20)
+    # Paginate the packed (id, score) ranking, then hydrate only the visible page
+    paginator = Paginator(RankedIds(explore_entry['ranking']), EXPLORE_PAGE_SIZE)
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = hydrate_repositories(page_obj.object_list)
+    if settings.PULL_COUNT_OVERLAY_PENDING:
+        overlay_pending_pulls(page_obj.object_list)
+    overlay_pending_stars(page_obj.object_list)
+
+    can_star = has_role_permission(request.user, 'can_star_repositories')
+    if can_star:
+        mark_starred(request.user, page_obj.object_list)
 
     context = {
         'form': form,
@@ -301,7 +321,57 @@ def explore(request):
         'page_obj': page_obj,
         'query': query,
         'badge_filters': badge_filters,
-        'total_results': len(repositories_with_scores),
+        'total_results': explore_entry['total'],
+        'total_is_capped': explore_entry['capped'],
+        'can_star': can_star,
+    }
+
+    return render(request, 'explore.html', context)
+
+
+def _explore_cursor_page(request, form, query, badge_filters):
+    """
+    Keyset-paginated explore: one LIMIT page_size + 1 query per page on the
+    (rank_score, id) ordering, and a capped count instead of an exact total.
+    """
+    repositories = calculate_relevance_score(
+        search_public_repositories(query=query, badge_filters=badge_filters)
+    )
+
+    cursor_page = keyset_paginate(
+        repositories,
+        'rank_score',
+        EXPLORE_PAGE_SIZE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    for repo in cursor_page:
+        repo.badges = get_repository_badges(repo)
+    if settings.PULL_COUNT_OVERLAY_PENDING:
+        overlay_pending_pulls(cursor_page)
+    overlay_pending_stars(cursor_page)
+
+    can_star = has_role_permission(request.user, 'can_star_repositories')
+    if can_star:
+        mark_starred(request.user, cursor_page)
+
+    total_results, total_is_capped = capped_count(repositories, settings.EXPLORE_COUNT_LIMIT)
+
+    # Keep search/badge filters on the prev/next links, drop any old position
+    link_params = request.GET.copy()
+    for param in ('page', 'after', 'before'):
+        link_params.pop(param, None)
+
+    context = {
+        'form': form,
+        'repositories': cursor_page,
+        'cursor_page': cursor_page,
+        'link_querystring': link_params.urlencode(),
+        'query': query,
+        'badge_filters': badge_filters,
+        'total_results': total_results,
+        'total_is_capped': total_is_capped,
+        'can_star': can_star,
     }
 
     return render(request, 'explore.html', context)
@@ -326,18 +396,22 @@ def _get_repository_detail_context(repository, request):
     page_number = request.GET.get('page')
     tags_page = paginator.get_page(page_number)
 
+    if settings.PULL_COUNT_OVERLAY_PENDING:
+        overlay_pending_pulls([repository])
+    overlay_pending_stars([repository])
+
     user_starred = False
-    if request.user.is_authenticated and request.user.has_perm('accounts.can_star_repositories'):
-        user_starred = repository.stars.filter(user=request.user).exists()
+    if request.user.is_authenticated and has_role_permission(request.user, 'can_star_repositories'):
+        user_starred = has_starred(request.user, repository)
 
-    is_owner = request.user.is_authenticated and repository.owner == request.user
-    is_admin = request.user.is_authenticated and request.user.has_perm('accounts.can_manage_official_repos')
+    is_owner = request.user.is_authenticated and repository.owner_id == request.user.pk
+    is_admin = request.user.is_authenticated and has_role_permission(request.user, 'can_manage_official_repos')
     can_edit = is_owner or (is_admin and repository.is_official)
     
     can_star = (
         request.user.is_authenticated and 
-        request.user.has_perm('accounts.can_star_repositories') and 
-        repository.owner != request.user
+        has_role_permission(request.user, 'can_star_repositories') and 
+        repository.owner_id != request.user.pk
     )
 
     return {
@@ -4,38 +4,26 @@ import json
 import logging
 import os
 import time
+from datetime import datetime, timezone as dt_timezone
 
 from django.conf import settings
-from django.contrib.auth import authenticate
 from django.db.models import Q
 from django.http import HttpResponse, JsonResponse, HttpResponseNotAllowed
 from django.views.decorators.csrf import csrf_exempt
-from jose import jwt
 
-from .models import Repository, Tag
+from accounts.permissions import analytics_permission_required
+from . import metrics
+from .acl_index import lookup_repositories
+from .models import Repository
+from .services.credentials import authenticate_registry_user
+from .services.event_queue import enqueue_envelope, queue_stats
+from .services.registry_tokens import cache_token, get_cached_token, record_signing, token_stats
+from .services.webhook import ingest_events, parse_events
+from .signing import sign_registry_token
 
 logger = logging.getLogger(__name__)
 
 
-def get_x5c_chain():
-    """
-    Loads the public certificate from auth.crt file and formats it for x5c jwT header
-    """
-    try:
-        certificate = getattr(settings, 'REGISTRY_PUBLIC_CERTIFICATE', '')
-        lines = certificate.splitlines()
-        clean_lines = [
-            line.strip() for line in lines if '-----' not in line and line.strip()
-        ]
-
-        cert_content = ''.join(clean_lines)
-
-        return [cert_content]
-    except FileNotFoundError:
-        print('ERROR: auth.crt not found for x5c header!')
-        return []
-
-
 @csrf_exempt
 def docker_auth(request):
     user = None
@@ -48,7 +36,7 @@ def docker_auth(request):
                 username, password = (
                     base64.b64decode(auth[1]).decode('utf-8').split(':')
                 )
-                user = authenticate(username=username, password=password)
+                user = authenticate_registry_user(username, password)
                 if user is None:
                     return JsonResponse({'error': 'Invalid credentials'}, status=401)
             except:
@@ -61,96 +49,96 @@ def docker_auth(request):
     )
     scope_params = request.GET.getlist('scope')
 
-    access_list = []
-
+    # Format: "repository:name:actions"
+    # (User): "repository:mika/web-app:pull,push"
+    # (Official): "repository:ubuntu:pull,push"
+    scopes = []
     for scope_param in scope_params:
         if scope_param:
             try:
-                # Format: "repository:name:actions"
-                # (User): "repository:mika/web-app:pull,push"
-                # (Official): "repository:ubuntu:pull,push"
-                scope_param = unquote(scope_param)
-                typ, name, actions = scope_param.split(':')
-                requested_actions = actions.split(',')
-
-                repo = None
-
-                parts = name.split('/')
-
-                if len(parts) == 2:
-                    repo_owner_username = parts[0]
-                    repo_name = parts[1]
-
-                    try:
-                        repo = Repository.objects.get(
-                            owner__username=repo_owner_username,
-                            name=repo_name,
-                            is_official=False,  # only user repos here
-                        )
-                    except Repository.DoesNotExist:
-                        repo = None
-
-                elif len(parts) == 1:
-                    repo_name = parts[0]
-                    try:
-                        repo = Repository.objects.get(name=repo_name, is_official=True)
-                    except Repository.DoesNotExist:
-                        repo = None
-
-                allowed_actions = []
-
-                is_public = False
-                if repo:
-                    if repo.visibility == Repository.Visibility.PUBLIC:
-                        is_public = True
-
-                if 'pull' in requested_actions:
-                    if is_public:
-                        allowed_actions.append('pull')
-                    elif repo and user and repo.owner == user:
-                        allowed_actions.append('pull')
-                    elif repo and not is_public and not user:
-                        # Private repo access requires authentication
-                        return JsonResponse({'error': 'Authentication required'}, status=401)
-                    elif not repo and user:
-                        # Allow pull for non-existent repos if user is authenticated
-                        # (needed for some base images)
-                        allowed_actions.append('pull')
-
-                if 'push' in requested_actions:
-                    if user and repo:
-                        if repo.owner == user:
-                            allowed_actions.append('push')
-                    elif repo and not user:
-                        # Push operations always require authentication
-                        return JsonResponse({'error': 'Authentication required'}, status=401)
-
-                if allowed_actions:
-                    access_list.append(
-                        {'type': typ, 'name': name, 'actions': allowed_actions}
-                    )
-
+                typ, name, actions = unquote(scope_param).split(':')
             except ValueError:
                 # Invalid scope format, skip
-                pass
+                continue
+            scopes.append((typ, name, actions.split(',')))
 
-    now = int(time.time())
-    payload = {
-        'iss': getattr(settings, 'REGISTRY_ISSUER', 'docker-platform'),
-        'sub': user.username if user else 'anonymous',
-        'aud': service,
-        'exp': now + 300,
-        'nbf': now,
-        'iat': now,
-        'access': access_list,
-        'jti': base64.urlsafe_b64encode(os.urandom(16)).decode('utf-8'),
-    }
-    custom_headers = {'typ': 'JWT', 'x5c': get_x5c_chain(), 'alg': 'RS256'}
+    # Served from the in-process ACL index; grants compare owner_id only
+    repositories = lookup_repositories(name for _, name, _ in scopes)
 
-    private_key = getattr(settings, 'REGISTRY_PRIVATE_KEY', '')
-    token = jwt.encode(payload, private_key, algorithm='RS256', headers=custom_headers)
+    access_list = []
 
-    return JsonResponse({'token': token, 'access_token': token})
+    for typ, name, requested_actions in scopes:
+        repo = repositories.get(name)
+
+        allowed_actions = []
+
+        is_public = repo is not None and repo.visibility == Repository.Visibility.PUBLIC
+        is_owner = repo is not None and user is not None and repo.owner_id == user.id
+
+        if 'pull' in requested_actions:
+            if is_public:
+                allowed_actions.append('pull')
+            elif is_owner:
+                allowed_actions.append('pull')
+            elif repo and not user:
+                # Private repo access requires authentication
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            elif not repo and user:
+                # Allow pull for non-existent repos if user is authenticated
+                # (needed for some base images)
+                allowed_actions.append('pull')
+
+        if 'push' in requested_actions:
+            if user and repo:
+                if is_owner:
+                    allowed_actions.append('push')
+            elif repo and not user:
+                # Push operations always require authentication
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+
+        if user is not None:
+            # Access tokens may be limited to some repositories or to pulls
+            allowed_actions = [action for action in allowed_actions if user.permits(name, action)]
+
+        if allowed_actions:
+            access_list.append(
+                {'type': typ, 'name': name, 'actions': allowed_actions}
+            )
+
+    subject = user.username if user else 'anonymous'
+    issued = get_cached_token(subject, service, access_list)
+
+    if issued is None:
+        now = int(time.time())
+        expires_at = now + settings.REGISTRY_TOKEN_TTL
+        payload = {
+            'iss': getattr(settings, 'REGISTRY_ISSUER', 'docker-platform'),
+            'sub': subject,
+            'aud': service,
+            'exp': expires_at,
+            'nbf': now,
+            'iat': now,
+            'access': access_list,
+            'jti': base64.urlsafe_b64encode(os.urandom(16)).decode('utf-8'),
+        }
+        started = time.perf_counter()
+        token = sign_registry_token(payload)
+        record_signing(started)
+
+        issued = cache_token(subject, service, access_list, token, now, expires_at)
+
+    return JsonResponse({
+        'token': issued['token'],
+        'access_token': issued['token'],
+        # Lets clients reuse the token instead of asking again per operation
+        'expires_in': max(0, issued['expires_at'] - int(time.time())),
+        'issued_at': datetime.fromtimestamp(issued['issued_at'], tz=dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    })
+
+
+@analytics_permission_required
+def docker_auth_metrics(request):
+    return JsonResponse(token_stats())
 
 
 @csrf_exempt
@@ -160,65 +148,16 @@ def registry_webhook(request):
         logger.warning(f"Invalid method for webhook: {request.method}")
         return HttpResponse(status=405)
 
+    if settings.REGISTRY_WEBHOOK_ASYNC:
+        return _enqueue_webhook(request)
+
     try:
         body_text = request.body.decode('utf-8')
 
         data = json.loads(body_text)
-        events = data.get('events', [])
-
-        for i, event in enumerate(events):
-            action = event.get('action')
-
-            if action == 'push' or action == 'pull':
-                target = event['target']
-                full_name = target['repository']  # can be "user/app" or "ubuntu"
-                tag_name = target.get('tag')
-                digest = target['digest']
-                size = target['size']
-
-                if not tag_name:
-                    logger.warning(f"Skipping event without tag name for repo {full_name}")
-                    continue
-
-                parts = full_name.split('/')
-                repo = None
-
-                try:
-                    if len(parts) == 2:
-                        # User repository: user/repo
-                        repo = Repository.objects.get(
-                            owner__username=parts[0], name=parts[1], is_official=False
-                        )
-                        logger.info(f"Found user repository: {repo}")
-                    elif len(parts) == 1:
-                        # Official repository: repo
-                        repo = Repository.objects.get(name=parts[0], is_official=True)
-                        logger.info(f"Found official repository: {repo}")
-                    else:
-                        logger.warning(f"Invalid repository name format: {full_name}")
-                        continue
-
-                except Repository.DoesNotExist:
-                    logger.warning(f"Repository not found in database: {full_name}")
-                    continue
-
-                if repo:
-                    if action == 'push':
-                        tag, created = Tag.objects.update_or_create(
-                            repository=repo,
-                            name=tag_name,
-                            defaults={'digest': digest, 'size': size},
-                        )
-                        action_word = "Created" if created else "Updated"
-                        logger.info(f"{action_word} tag: {repo.name}:{tag_name}")
-                    else:
-                        repo.pull_count += 1
-                        repo.save()
-                        logger.info(f"Incremented pull count for {repo.name}: {repo.pull_count}")
-                else:
-                    logger.error(f"Repository object is None for {full_name}")
-            else:
-                logger.info(f"Ignoring non-push/pull event: {action}")
+        events = parse_events(data)
+        metrics.increment('webhook.events_received', len(events))
+        ingest_events(events)
 
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in webhook body: {e}")
@@ -232,3 +171,25 @@ def registry_webhook(request):
 
     logger.info("Webhook processed successfully")
     return HttpResponse('OK')
+
+
+def _enqueue_webhook(request):
+    """Hand the raw envelope to the event queue; workers do the actual ingestion."""
+    try:
+        # Only reject what a worker could never process
+        if not isinstance(json.loads(request.body), dict):
+            return HttpResponse('Invalid envelope', status=400)
+        enqueue_envelope(request.body)
+    except ValueError as e:
+        logger.error(f"Invalid JSON in webhook body: {e}")
+        return HttpResponse('Invalid JSON', status=400)
+    except Exception as e:
+        logger.error(f"Failed to enqueue webhook envelope: {e}", exc_info=True)
+        return HttpResponse('Queue unavailable', status=503)
+
+    return HttpResponse('Accepted', status=202)
+
+
+@analytics_permission_required
+def registry_webhook_metrics(request):
+    return JsonResponse(queue_stats())
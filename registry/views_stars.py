@@ -1,9 +1,13 @@
 from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_http_methods, require_POST
 
 from registry.models import Repository
-from registry.services.stars import star_repository, unstar_repository
+from registry.services.stars import (
+    current_star_count, has_starred, star_rate_limit_reset, star_repository, unstar_repository,
+)
 
 
 @require_POST
@@ -24,3 +28,40 @@ def unstar(request, repo_id):
     except PermissionDenied:
         pass  # Silently ignore permission errors
     return redirect(request.META.get("HTTP_REFERER", "/"))
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+def star_api(request, repo_id):
+    """
+    Star state of a repository for the current user: GET reads it, PUT stars,
+    DELETE unstars. PUT and DELETE are idempotent and both answer with the
+    resulting state, so pages can update in place.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    # Private repositories of others look exactly like missing ones, whatever the method
+    repo = Repository.objects.filter(
+        Q(visibility=Repository.Visibility.PUBLIC) | Q(owner_id=request.user.pk), id=repo_id,
+    ).first()
+    if repo is None:
+        return JsonResponse({'error': 'Repository not found'}, status=404)
+
+    if request.method == 'GET':
+        starred = has_starred(request.user, repo)
+    else:
+        retry_after = star_rate_limit_reset(request.user)
+        if retry_after is not None:
+            response = JsonResponse({'error': 'Too many star requests'}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        try:
+            if request.method == 'PUT':
+                star_repository(request.user, repo)
+            else:
+                unstar_repository(request.user, repo)
+        except PermissionDenied as e:
+            return JsonResponse({'error': str(e)}, status=403)
+        starred = request.method == 'PUT'
+
+    return JsonResponse({'starred': starred, 'star_count': current_star_count(repo.id)})